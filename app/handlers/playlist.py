@@ -0,0 +1,355 @@
+import os
+import asyncio
+import contextlib
+import html
+import logging
+
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery, InputMediaAudio
+
+from app.handlers.youtube import (
+    DeliveryError,
+    audio_reservation,
+    download_m4a,
+    download_mp3,
+    job_cost,
+    job_title,
+    remember_sent_file,
+    sanitize_filename,
+    scratch_job,
+    send_video_card,
+    upload_source,
+)
+from app.services.youtube_service import YouTubeService
+from app.services.file_cache import file_id_cache
+from app.services.media_cache import media_cache
+from app.services.scheduler import scheduler, QueueFullError
+from app.services.prefetch import prefetcher
+from app.services.url_parser import extract_playlist_ids, extract_video_ids
+from app.services.metrics import deliveries_total
+from app.services.size_estimator import estimate_audio_size, exceeds_limit
+from app.keyboards.builder import build_playlist_keyboard
+from config import (
+    URL_MAX_LINKS,
+    BATCH_MAX_ITEMS,
+    BATCH_EXTRACTS,
+    BATCH_DOWNLOADS,
+    BATCH_GROUP_SIZE,
+    BATCH_GROUP_WAIT,
+    BATCH_PROGRESS_INTERVAL,
+)
+
+router = Router()
+logger = logging.getLogger("PLAYLIST_HANDLER")
+
+FETCHERS = {'mp3': download_mp3, 'm4a': download_m4a}
+
+# Пока у пользователя заняты все слоты планировщика (он качает что-то ещё), плейлист ждёт
+SLOT_RETRY = 2
+
+# Плейлист пользователя, который сейчас скачивается: второй запускать не даём
+active_batches = {}
+
+
+def has_playlist(text):
+    return bool(extract_playlist_ids(text, 1))
+
+def count_label(count):
+    if count % 10 == 1 and count % 100 != 11:
+        word = "ролик"
+    elif 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        word = "ролика"
+    else:
+        word = "роликов"
+    return f"{count} {word}"
+
+def build_playlist_message(playlist):
+    count = count_label(len(playlist['entries']))
+    if len(playlist['entries']) >= BATCH_MAX_ITEMS:
+        count += " (больше не берём)"
+    uploader = f"👤 {html.escape(playlist['uploader'])}\n" if playlist.get('uploader') else ""
+    return (
+        f"📃 <b>{html.escape(playlist['title'])}</b>\n"
+        f"{uploader}"
+        f"🎬 {count}\n\n"
+        f"<i>Скачать все ролики одним форматом ↓</i>"
+    )
+
+@router.message(F.text.func(has_playlist))
+async def handle_playlist(message: Message):
+    for playlist_id in extract_playlist_ids(message.text, URL_MAX_LINKS):
+        await send_playlist_card(message, playlist_id)
+    # Ссылки на отдельные ролики из того же сообщения — обычными карточками
+    for video_id in extract_video_ids(message.text, URL_MAX_LINKS):
+        await send_video_card(message, video_id)
+
+async def send_playlist_card(message, playlist_id):
+    try:
+        wait_msg = await message.reply("👀 Получаю список роликов...")
+        playlist = await YouTubeService.get_playlist(playlist_id)
+        await wait_msg.delete()
+        if not playlist or not playlist['entries']:
+            await message.reply("❌ Не удалось получить плейлист. Проверьте ссылку: плейлист должен быть открытым.")
+            return
+        await message.reply(build_playlist_message(playlist), reply_markup=build_playlist_keyboard(playlist_id, 'yt'),
+                            parse_mode="HTML")
+    except Exception as e:
+        logger.error(f"Ошибка плейлиста ({playlist_id}): {e}")
+        await message.reply(f"❌ Ошибка: {e}")
+
+
+class BatchItem:
+    def __init__(self, index, entry):
+        self.index = index
+        self.video_id = entry['id']
+        self.title = entry.get('title') or 'YouTube Audio'
+        # Путь к файлу, (kind, file_id) из кэша или None, если ролик пропущен
+        self.ready = asyncio.get_running_loop().create_future()
+        self.sent = asyncio.Event()
+        self.source = 'download'
+        self.error = None
+
+
+class Batch:
+    # Конвейер плейлиста: каждый ролик — своя задача, этапы разных роликов идут одновременно.
+    # Извлечений и загрузок не больше BATCH_EXTRACTS и BATCH_DOWNLOADS, загрузки ещё и через общий
+    # планировщик. Окно ограничивает число роликов, чьи файлы ждут отправки на диске. Отправка идёт
+    # по порядку плейлиста альбомами до BATCH_GROUP_SIZE, пока следующие ролики скачиваются.
+
+    def __init__(self, msg, user_id, playlist, quality):
+        self.msg = msg
+        self.user_id = user_id
+        self.title = playlist['title']
+        self.quality = quality
+        self.fetch = FETCHERS[quality]
+        self.items = [BatchItem(i, entry) for i, entry in enumerate(playlist['entries'])]
+        self.window = asyncio.Semaphore(BATCH_GROUP_SIZE + BATCH_DOWNLOADS)
+        self.extracts = asyncio.Semaphore(BATCH_EXTRACTS)
+        self.downloads = asyncio.Semaphore(BATCH_DOWNLOADS)
+        self.tasks = []
+        self.status_msg = None
+        self.downloaded = 0
+        self.sent = 0
+        self.failed = 0
+
+    def progress_text(self, done=False):
+        total = len(self.items)
+        if done:
+            text = f"✅ Плейлист «{self.title}»: отправлено {self.sent} из {total}"
+        else:
+            text = f"⏳ Плейлист «{self.title}»: готово {self.downloaded} из {total}, отправлено {self.sent}"
+        if self.failed:
+            text += f", пропущено {self.failed}"
+        if done:
+            failed = [item for item in self.items if item.error]
+            lines = [f"• {item.title}: {item.error}" for item in failed[:5]]
+            if len(failed) > 5:
+                lines.append(f"• и ещё {len(failed) - 5}")
+            if lines:
+                text += "\n\nНе удалось:\n" + "\n".join(lines)
+        return text
+
+    async def show(self, text):
+        try:
+            await self.status_msg.edit_text(text)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить статус плейлиста: {e}")
+
+    async def report(self):
+        # Правки статуса не чаще раза в интервал: лимит Telegram на чат общий с файлами
+        shown = self.progress_text()
+        while True:
+            await asyncio.sleep(BATCH_PROGRESS_INTERVAL)
+            text = self.progress_text()
+            if text != shown:
+                shown = text
+                await self.show(text)
+
+    async def feed(self):
+        # Задачи создаются по порядку: первые ролики всегда получают место в окне раньше следующих
+        for item in self.items:
+            await self.window.acquire()
+            task = asyncio.create_task(self.process(item))
+            task.add_done_callback(lambda _: self.window.release())
+            self.tasks.append(task)
+
+    async def slot(self, cost):
+        while True:
+            try:
+                ticket = scheduler.submit(self.user_id, cost)
+                break
+            except QueueFullError:
+                await asyncio.sleep(SLOT_RETRY)
+        try:
+            if not ticket.granted.done():
+                prefetcher.preempt()
+            await asyncio.shield(ticket.granted)
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+        return ticket
+
+    async def process(self, item):
+        try:
+            async with self.extracts:
+                info = await YouTubeService.get_cached_info(item.video_id)
+            if not info:
+                raise DeliveryError("не удалось получить информацию о видео")
+            item.title = job_title(info, self.quality)
+            cached = file_id_cache.get(item.video_id, self.quality)
+            if cached and cached[0] == 'audio':
+                item.source = 'file_id_cache'
+                self.downloaded += 1
+                item.ready.set_result(cached)
+                await item.sent.wait()
+                return
+            ready = media_cache.get(item.video_id, self.quality)
+            if ready is not None:
+                item.source = 'media_cache'
+                self.downloaded += 1
+                async with ready.use() as path:
+                    item.ready.set_result(path)
+                    await item.sent.wait()
+                return
+            size, confidence = estimate_audio_size(info, self.quality)
+            if exceeds_limit(size, confidence):
+                raise DeliveryError("файл больше лимита Telegram")
+            async with scratch_job(audio_reservation(info, self.quality, size, confidence), 'batch') as job:
+                async with self.downloads:
+                    ticket = await self.slot(job_cost(info, self.quality))
+                    try:
+                        path = await self.fetch(job, item.video_id, size)
+                    finally:
+                        scheduler.release(ticket)
+                if not os.path.getsize(path):
+                    raise DeliveryError("файл пустой")
+                self.downloaded += 1
+                item.ready.set_result(path)
+                # Каталог живёт, пока файл не отправлен
+                await item.sent.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Ролик {item.video_id} из плейлиста пропущен: {e}")
+            item.error = str(e).lstrip("❌ ") or type(e).__name__
+            if not item.ready.done():
+                item.ready.set_result(None)
+
+    async def send_group(self, group):
+        # group — [(item, путь или (kind, file_id))]; один файл отправляется сам по себе, альбом — от двух
+        async with contextlib.AsyncExitStack() as stack:
+            media = []
+            for item, result in group:
+                if isinstance(result, tuple):
+                    source = result[1]
+                else:
+                    filename = sanitize_filename(item.title) + os.path.splitext(result)[1]
+                    source = await stack.enter_async_context(upload_source(result, filename))
+                media.append(InputMediaAudio(media=source, caption=item.title, title=item.title))
+            try:
+                if len(media) == 1:
+                    sent = [await self.msg.reply_audio(media[0].media, caption=media[0].caption, title=media[0].title)]
+                else:
+                    sent = await self.msg.reply_media_group(media)
+            except Exception as e:
+                logger.warning(f"Альбом плейлиста не отправлен ({e}), отправляем файлы по одному")
+                sent = []
+                for (item, _), audio in zip(group, media):
+                    try:
+                        sent.append(await self.msg.reply_audio(audio.media, caption=audio.caption, title=audio.title))
+                    except Exception as e:
+                        item.error = f"ошибка отправки: {e}"
+                        sent.append(None)
+        for (item, result), message in zip(group, sent):
+            if message is None:
+                self.failed += 1
+                continue
+            self.sent += 1
+            deliveries_total.inc(source=item.source)
+            remember_sent_file(message, item.video_id, self.quality)
+            if not isinstance(result, tuple):
+                await media_cache.put(item.video_id, self.quality, result)
+
+    async def flush(self, group):
+        try:
+            await self.send_group(group)
+        finally:
+            for item, _ in group:
+                item.sent.set()
+
+    async def upload(self):
+        loop = asyncio.get_running_loop()
+        group = []
+        collected_at = 0.0
+        try:
+            for item in self.items:
+                if group and not item.ready.done():
+                    # Медленные загрузки: готовое не копится дольше BATCH_GROUP_WAIT ради полного альбома
+                    left = BATCH_GROUP_WAIT - (loop.time() - collected_at)
+                    done, _ = await asyncio.wait([item.ready], timeout=max(0.0, left))
+                    if not done:
+                        await self.flush(group)
+                        group = []
+                result = await item.ready
+                if result is None:
+                    self.failed += 1
+                    item.sent.set()
+                    continue
+                if not group:
+                    collected_at = loop.time()
+                group.append((item, result))
+                if len(group) >= BATCH_GROUP_SIZE:
+                    await self.flush(group)
+                    group = []
+            if group:
+                await self.flush(group)
+                group = []
+        finally:
+            for item, _ in group:
+                item.sent.set()
+
+    async def run(self):
+        self.status_msg = await self.msg.reply(self.progress_text())
+        logger.info(f"Плейлист «{self.title}»: {len(self.items)} роликов в {self.quality}")
+        reporter = asyncio.create_task(self.report())
+        feeder = asyncio.create_task(self.feed())
+        try:
+            await self.upload()
+        finally:
+            reporter.cancel()
+            feeder.cancel()
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(reporter, feeder, *self.tasks, return_exceptions=True)
+        await self.show(self.progress_text(done=True))
+        logger.info(f"Плейлист «{self.title}»: отправлено {self.sent}, пропущено {self.failed}")
+
+
+@router.callback_query(F.data.startswith("batch:yt:"))
+async def process_batch(callback: CallbackQuery):
+    msg = getattr(callback, 'message', None)
+    parts = (callback.data or '').split(':')
+    if len(parts) != 4 or parts[3] not in FETCHERS or msg is None:
+        await callback.answer("Не удалось найти плейлист.", show_alert=True)
+        return
+    playlist_id, quality = parts[2], parts[3]
+    user_id = callback.from_user.id
+    if user_id in active_batches:
+        await callback.answer("⏳ Дождитесь, пока скачается предыдущий плейлист.", show_alert=True)
+        return
+    # Место занимаем до первого await: двойной клик во время извлечения не запустит второй плейлист
+    active_batches[user_id] = None
+    try:
+        await callback.answer("Скачиваю плейлист...")
+        playlist = await YouTubeService.get_playlist(playlist_id)
+        if not playlist or not playlist['entries']:
+            await msg.reply("❌ Не удалось получить плейлист.")
+            return
+        batch = Batch(msg, user_id, playlist, quality)
+        active_batches[user_id] = batch
+        await batch.run()
+    except Exception as e:
+        logger.error(f"Ошибка плейлиста {playlist_id}: {e}")
+        await msg.reply(f"❌ Ошибка: {e}")
+    finally:
+        active_batches.pop(user_id, None)
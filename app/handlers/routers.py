@@ -1,16 +1,11 @@
-import re
-import requests
-import os
 from aiogram import Router, F
-from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from config import RAPIDAPI_KEY
-from app.services.youtube_service import YouTubeService
-from app.keyboards.builder import build_quality_keyboard
-import asyncio
-import string
+from aiogram.types import Message
 from .youtube import router as youtube_router
+from .playlist import router as playlist_router
 
 router = Router()
+# Плейлисты раньше роликов: ссылка на плейлист тоже содержит youtube.com
+router.include_router(playlist_router)
 router.include_router(youtube_router)
 
 @router.message(F.text == "/start")
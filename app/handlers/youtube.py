@@ -1,21 +1,160 @@
 import os
+import asyncio
+import contextlib
 import logging
 import tempfile
 import time
 import re
-import glob
+from datetime import datetime, timezone
 
 from aiogram import Router, F
-from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.exceptions import TelegramEntityTooLarge
+from aiogram.types import Message, Chat, FSInputFile, CallbackQuery
+from aiogram.exceptions import TelegramEntityTooLarge, TelegramBadRequest
 
 from app.services.youtube_service import YouTubeService
+from app.services.file_cache import file_id_cache
+from app.services.singleflight import SingleFlight
+from app.services.scheduler import scheduler, QueueFullError
+from app.services.scratch import scratch, remove_path, ScratchQuotaError
+from app.services.prefetch import prefetcher
+from app.services.media_cache import media_cache
+from app.services.journal import journal, UPLOADING
+from app.services.url_parser import extract_video_ids, has_youtube_link
+from app.services.metrics import timed, stage_seconds, uploaded_bytes, deliveries_total, new_trace_id
+from app.services.size_estimator import (
+    UNKNOWN,
+    UPLOAD_LIMIT,
+    VIDEO_LIMIT,
+    delivery_kind,
+    estimate_audio_size,
+    estimate_spec_size,
+    exceeds_limit,
+    format_size_label,
+)
+from app.keyboards.builder import build_quality_keyboard
+from config import TELEGRAM_UPLOAD_LIMIT_MB, TELEGRAM_API_LOCAL, URL_MAX_LINKS
 
 
 router = Router()
 logger = logging.getLogger("YOUTUBE_HANDLER")
 
-STANDARD_QUALITIES = ['144p', '240p', '360p', '480p', '720p']
+MAX_HEIGHT = 720
+
+deliveries = SingleFlight("deliveries")
+
+
+class DeliveryError(Exception):
+    pass
+
+
+TOO_LARGE_MESSAGE = (
+    f"❗️ Файл слишком большой для отправки через Telegram (больше {TELEGRAM_UPLOAD_LIMIT_MB} МБ).\n"
+    "Попробуйте выбрать качество пониже!"
+)
+
+
+def scratch_reservation(size, confidence, copies=2):
+    # Во время склейки/перепаковки на диске одновременно лежат исходники и результат
+    if confidence == UNKNOWN or not size:
+        size = UPLOAD_LIMIT
+    return int(size * copies)
+
+@contextlib.asynccontextmanager
+async def scratch_job(reserve, tag, name=None):
+    try:
+        async with scratch.job(reserve, tag, name) as job:
+            yield job
+    except ScratchQuotaError as e:
+        raise DeliveryError(str(e))
+
+@contextlib.asynccontextmanager
+async def fetched_file(fetch, key, reserve, tag, prefetched=None, entry=None):
+    # Готовый файл (кэш на диске, упреждающая загрузка) или скачанный сейчас в свой временный каталог;
+    # у задачи из журнала каталог постоянный, и после перезапуска yt-dlp докачивает .part-файлы.
+    # Отправленный файл остаётся в кэше для следующих запросов
+    if prefetched is not None:
+        async with prefetched.use() as path:
+            yield path
+            await media_cache.put(*key, path)
+        return
+    name = entry.staging if entry is not None else None
+    async with scratch_job(reserve or scratch_reservation(0, UNKNOWN), tag, name) as job:
+        if entry is not None and entry.state == UPLOADING and entry.path and os.path.exists(entry.path):
+            logger.info(f"Файл {entry.video_id}/{entry.quality} скачан до перезапуска, осталось отправить")
+            path = entry.path
+        else:
+            path = await fetch(job)
+        journal.uploading(entry, path)
+        yield path
+        await media_cache.put(*key, path)
+
+@contextlib.asynccontextmanager
+async def upload_source(path, filename):
+    size = os.path.getsize(path)
+    kind = 'video' if filename.endswith('.mp4') else 'audio'
+    if not TELEGRAM_API_LOCAL:
+        with timed('upload'):
+            yield FSInputFile(path, filename=filename)
+        uploaded_bytes.inc(size, kind=kind)
+        return
+    # Локальный Bot API сам читает файл с диска: байты не идут через процесс бота.
+    # Имя файла он берёт из пути, поэтому кладём ссылку с нужным именем.
+    link_dir = tempfile.mkdtemp(dir=os.path.dirname(path))
+    link_path = os.path.join(link_dir, filename)
+    try:
+        try:
+            os.link(path, link_path)
+        except OSError:
+            os.symlink(os.path.abspath(path), link_path)
+        with timed('upload'):
+            yield f"file://{os.path.abspath(link_path)}"
+        uploaded_bytes.inc(size, kind=kind)
+    finally:
+        await remove_path(link_dir)
+
+def remember_sent_file(sent, video_id, quality):
+    if sent is None:
+        return None
+    for kind in ('video', 'audio', 'document'):
+        media = getattr(sent, kind, None)
+        if media is not None:
+            if video_id:
+                file_id_cache.put(video_id, quality, kind, media.file_id)
+            return kind, media.file_id
+    return None
+
+async def send_by_file_id(msg, kind, file_id, caption):
+    if kind == 'video':
+        return await msg.reply_video(file_id, caption=caption)
+    if kind == 'audio':
+        return await msg.reply_audio(file_id, caption=caption)
+    return await msg.reply_document(file_id, caption=caption)
+
+async def send_cached_file(msg, video_id, quality, caption):
+    if not video_id:
+        return False
+    cached = file_id_cache.get(video_id, quality)
+    if not cached:
+        return False
+    kind, file_id = cached
+    try:
+        await send_by_file_id(msg, kind, file_id, caption)
+        logger.info(f"Отправлено из кэша file_id: {video_id}/{quality}")
+        deliveries_total.inc(source='file_id_cache')
+        return True
+    except TelegramBadRequest as e:
+        logger.warning(f"Telegram не принял file_id из кэша ({video_id}/{quality}): {e}")
+        file_id_cache.invalidate(video_id, quality)
+        return False
+
+def parse_download_callback(data):
+    # download:<source>:<video_id>:<format_spec|mp3|m4a>, format_spec — '136+140' или '18'
+    if not data or not isinstance(data, str):
+        return None
+    parts = data.split(':', 3)
+    if len(parts) != 4 or parts[0] != 'download' or not parts[2] or not parts[3]:
+        return None
+    return parts[2], parts[3]
 
 def sanitize_filename(filename):
     filename = re.sub(r'[^\w\s\-_.]', '', filename)
@@ -25,34 +164,7 @@ def sanitize_filename(filename):
         filename = 'file'
     return filename[:50]
 
-def build_formats_keyboard(formats):
-    video_formats = {f"{f.get('height')}p": f for f in formats.get('video', []) if f.get('height') and f.get('height') <= 720}
-    keyboard = []
-    row = []
-    for quality in ['144p', '240p', '360p', '480p', '720p']:
-        fmt = video_formats.get(quality)
-        if fmt:
-            row.append(InlineKeyboardButton(text=quality, callback_data=f"ytvideo_{fmt['format_id']}"))
-        if len(row) == 3:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-    keyboard.append([InlineKeyboardButton(text="🎵 MP3", callback_data="ytaudio_mp3")])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-def build_formats_text(formats):
-    video_formats = {f"{f.get('height')}p": f for f in formats.get('video', []) if f.get('height') and f.get('height') <= 720}
-    available = []
-    for quality in ['144p', '240p', '360p', '480p', '720p']:
-        fmt = video_formats.get(quality)
-        if fmt:
-            size_mb = int(fmt.get('filesize', 0) or fmt.get('filesize_approx', 0) or 0) // (1024 * 1024)
-            size_str = f"{size_mb} МБ" if size_mb else "? МБ"
-            available.append(f"{quality} ({size_str})")
-    return ', '.join(available)
-
-def build_video_info_message(info, formats):
+def build_video_info_message(info, selections):
     title = info.get('title', 'YouTube Video')
     uploader = info.get('uploader', 'Unknown')
     uploader_url = info.get('uploader_url') or info.get('channel_url')
@@ -66,14 +178,16 @@ def build_video_info_message(info, formats):
         ('480p', '⚡️'),
         ('720p', '⚡️'),
     ]
-    video_formats = {f"{f.get('height')}p": f for f in formats.get('video', []) if f.get('height') and f.get('height') <= 720}
+    video_formats = {f"{h}p": item for h, item in selections.items()}
     lines = []
     for q, emoji in qualities:
         fmt = video_formats.get(q)
         if fmt:
-            size = int(fmt.get('filesize', 0) or fmt.get('filesize_approx', 0) or 0)
-            size_mb = f"{size // (1024 * 1024)}MB" if size else "?MB"
-            lines.append(f"{emoji} {q}: {size_mb}")
+            size_label = format_size_label(fmt['size'], fmt['size_confidence'])
+            if exceeds_limit(fmt['size'], fmt['size_confidence']):
+                lines.append(f"🚫 {q}: {size_label} — больше лимита Telegram")
+            else:
+                lines.append(f"{emoji} {q}: {size_label}")
     lines_str = '\n'.join(lines)
     if uploader_url:
         uploader_line = f'👤 <a href="{uploader_url}">{uploader}</a>'
@@ -92,191 +206,466 @@ def build_video_info_message(info, formats):
 
 
 
-@router.message(F.text.contains("youtube.com") | F.text.contains("youtu.be"))
+@router.message(F.text.func(has_youtube_link))
 async def handle_youtube(message: Message):
-    url = message.text
+    # Ссылки разбираются без yt-dlp: каналы, плейлисты и битые ссылки отклоняем сразу
+    video_ids = extract_video_ids(message.text, URL_MAX_LINKS)
+    if not video_ids:
+        await message.reply("❌ Не нашёл ссылку на видео YouTube. Пришлите ссылку на ролик, Shorts или youtu.be.")
+        return
+    for video_id in video_ids:
+        await send_video_card(message, video_id)
+
+async def send_video_card(message, video_id):
     try:
         wait_msg = await message.reply("👀 Получаю информацию о видео...")
-        info = await YouTubeService.get_video_info(url)
+        info = await YouTubeService.get_cached_info(video_id)
         if not info or not info.get('formats'):
             await wait_msg.delete()
             await message.reply("❌ Не удалось получить информацию о видео. Проверьте ссылку.")
             return
-        formats = YouTubeService.extract_video_audio_formats(info['formats'])
-        video_formats = {f"{f.get('height')}p": f for f in formats.get('video', []) if f.get('height')}
-        if not video_formats:
+        # Пара видео+аудио выбрана заранее и зашита в callback_data, склейка — копированием
+        selections = YouTubeService.select_formats(info['formats'], MAX_HEIGHT, info.get('duration'))
+        if not selections or not info.get('id'):
             await wait_msg.delete()
             await message.reply("❌ Не найдено подходящих видео-форматов для скачивания.")
             return
-        msg = build_video_info_message(info, formats)
-        kb = build_formats_keyboard(formats)
+        msg = build_video_info_message(info, selections)
+        # Кнопки для форматов, которые заведомо не пролезут в Telegram, не показываем
+        deliverable = [item for item in selections.values() if not exceeds_limit(item['size'], item['size_confidence'])]
+        kb = build_quality_keyboard(deliverable, short_id=info['id'], source='yt')
         thumbnail = info.get('thumbnail')
         if thumbnail:
-            await message.reply_photo(thumbnail, caption=msg, reply_markup=kb, parse_mode="HTML")
+            card = await message.reply_photo(thumbnail, caption=msg, reply_markup=kb, parse_mode="HTML")
         else:
-            await message.reply(msg, reply_markup=kb, parse_mode="HTML")
+            card = await message.reply(msg, reply_markup=kb, parse_mode="HTML")
         await wait_msg.delete()
+        start_prefetch(card, info, deliverable)
     except Exception as e:
-        logger.error(f"Ошибка YouTube: {e}")
+        logger.error(f"Ошибка YouTube ({video_id}): {e}")
         await message.reply(f"❌ Ошибка: {e}")
 
-@router.callback_query(F.data.startswith("ytvideo_"))
-async def process_video_format(callback: CallbackQuery):
-    msg = getattr(callback, 'message', None)
-    url = None
-    if msg is not None:
-        reply_msg = getattr(msg, 'reply_to_message', None)
-        if reply_msg is not None and getattr(reply_msg, 'text', None):
-            url = reply_msg.text
-        elif hasattr(msg, 'caption') and msg.caption:
-            url = msg.caption.split('\n')[0]
-    data = getattr(callback, 'data', None)
-    if not url or not isinstance(url, str) or not data or not isinstance(data, str) or not data.startswith("ytvideo_"):
-        await callback.answer("Не удалось найти ссылку на видео.", show_alert=True)
-        return
-    url = str(url)
-    format_id = data.replace("ytvideo_", "")
-    await callback.answer("Скачиваю видео...")
-    info = await YouTubeService.get_video_info(url)
-    if not info:
-        if msg:
-            await msg.reply("❌ Не удалось получить информацию о видео.")
-        return
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as f:
-        temp_path = f.name
-    success = await YouTubeService.download_format(url, format_id, temp_path)
+async def download_video(job, video_id, format_spec, size=0):
+    temp_path = job.file('video.mp4')
+    success = await YouTubeService.download_format(video_id, format_spec, temp_path, size)
     if not success:
-        if msg:
-            await msg.reply("❌ Не удалось скачать видео.")
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        raise DeliveryError("❌ Не удалось скачать видео.")
+    return temp_path
+
+async def download_mp3(job, video_id, size=0):
+    file_path = job.file('audio.mp3')
+    success = await YouTubeService.download_audio_mp3(video_id, file_path, size=size)
+    if not success or not os.path.exists(file_path):
+        raise DeliveryError("❌ Не удалось скачать MP3.")
+    return file_path
+
+async def download_m4a(job, video_id, size=0):
+    file_path = await YouTubeService.download_audio_copy(video_id, job.file('audio'), size)
+    if not file_path or not os.path.exists(file_path):
+        raise DeliveryError("❌ Не удалось скачать аудио.")
+    return file_path
+
+async def download_and_send_video(msg, video_id, format_spec, title, kind='video', reserve=None, size=0,
+                                  prefetched=None, entry=None):
+    fetch = lambda job: download_video(job, video_id, format_spec, size)
+    async with fetched_file(fetch, (video_id, format_spec), reserve, 'video', prefetched, entry) as temp_path:
+        file_size = os.path.getsize(temp_path)
+        if file_size == 0:
+            raise DeliveryError("❌ Не удалось скачать видео: файл пустой. Попробуйте другой формат или ссылку.")
+        if file_size > UPLOAD_LIMIT:
+            raise DeliveryError(TOO_LARGE_MESSAGE)
+        if file_size > VIDEO_LIMIT:
+            kind = 'document'
+        try:
+            logger.info(f"Пробую отправить видео ({kind}): {temp_path}, размер: {file_size} байт")
+            safe_filename = sanitize_filename(title) + ".mp4"
+            async with upload_source(temp_path, safe_filename) as media:
+                if kind == 'video':
+                    sent = await msg.reply_video(
+                        media,
+                        caption=f"Готово! {title}",
+                        supports_streaming=True
+                    )
+                else:
+                    sent = await msg.reply_document(
+                        media,
+                        caption=f"Готово! {title} (отправлено как документ)"
+                    )
+            logger.info("Видео успешно отправлено!")
+        except TelegramEntityTooLarge:
+            logger.warning("TelegramEntityTooLarge: файл слишком большой для Telegram")
+            raise DeliveryError(TOO_LARGE_MESSAGE)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке файла: {e}")
+            raise DeliveryError(f"❌ Ошибка при отправке файла: {e}")
+        return remember_sent_file(sent, video_id, format_spec)
+
+async def download_and_send_mp3(msg, video_id, title, reserve=None, size=0, prefetched=None, entry=None):
+    fetch = lambda job: download_mp3(job, video_id, size)
+    async with fetched_file(fetch, (video_id, 'mp3'), reserve, 'mp3', prefetched, entry) as file_path:
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            raise DeliveryError("❌ Не удалось скачать MP3: файл пустой. Попробуйте другой формат или ссылку.")
+        if file_size > UPLOAD_LIMIT:
+            raise DeliveryError(TOO_LARGE_MESSAGE)
+        try:
+            safe_filename = sanitize_filename(title) + ".mp3"
+            async with upload_source(file_path, safe_filename) as media:
+                sent = await msg.reply_audio(
+                    media,
+                    caption=f"Готово! {title}"
+                )
+        except Exception as e:
+            raise DeliveryError(f"❌ Ошибка при отправке MP3: {e}")
+        return remember_sent_file(sent, video_id, 'mp3')
+
+def format_height(info, quality):
+    video_format_id = quality.split('+')[0]
+    for f in info.get('formats', []):
+        if f.get('format_id') == video_format_id and f.get('height'):
+            return f['height']
+    return None
+
+def job_cost(info, quality):
+    # Стоимость для планировщика: MP3 и низкие разрешения дешевле
+    if quality in ('mp3', 'm4a'):
+        return 1.0
+    height = format_height(info, quality)
+    return max(1.0, height / 180) if height else MAX_HEIGHT / 180
+
+def choice_of(info, quality):
+    # Класс выбора для статистики упреждающей загрузки: mp3, m4a или высота видео
+    if quality in ('mp3', 'm4a'):
+        return quality
+    height = format_height(info, quality)
+    return str(height) if height else None
+
+def audio_reservation(info, quality, size, confidence):
+    reserve = scratch_reservation(size, confidence)
+    if quality == 'mp3':
+        # Обычный путь MP3 держит на диске и исходную дорожку
+        reserve += scratch_reservation(*estimate_audio_size(info, 'm4a'), copies=1)
+    return reserve
+
+def job_title(info, quality):
+    return info.get('title', 'YouTube Audio' if quality in ('mp3', 'm4a') else 'YouTube Video')
+
+def build_job(msg, info, video_id, quality, title):
+    # Скачивание и отправка выбранного формата; None — по оценке файл больше лимита Telegram
+    if quality in ('mp3', 'm4a'):
+        size, confidence = estimate_audio_size(info, quality)
+        if exceeds_limit(size, confidence):
+            return None
+        reserve = audio_reservation(info, quality, size, confidence)
+        send = download_and_send_mp3 if quality == 'mp3' else download_and_send_m4a
+        return lambda prefetched, entry: send(msg, video_id, title, reserve, size, prefetched, entry)
+    # Предпроверка до скачивания: не тратим трафик на то, что Telegram не примет
+    size, confidence = estimate_spec_size(info, quality)
+    if exceeds_limit(size, confidence):
+        logger.info(f"Отказ до скачивания {video_id}/{quality}: оценка {size} байт ({confidence})")
+        return None
+    kind = delivery_kind(size, confidence)
+    reserve = scratch_reservation(size, confidence)
+    return lambda prefetched, entry: download_and_send_video(
+        msg, video_id, quality, title, kind, reserve, size, prefetched, entry)
+
+def card_key(msg):
+    return msg.chat.id, msg.message_id
+
+def start_prefetch(card, info, deliverable):
+    if not prefetcher.enabled:
         return
-    file_size = os.path.getsize(temp_path)
-    if file_size == 0:
-        if msg:
-            await msg.reply("❌ Не удалось скачать видео: файл пустой. Попробуйте другой формат или ссылку.")
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    video_id = info['id']
+    candidates = {str(item['height']): (item['format_id'], item['size'], item['size_confidence']) for item in deliverable}
+    for quality in ('mp3', 'm4a'):
+        size, confidence = estimate_audio_size(info, quality)
+        if not exceeds_limit(size, confidence):
+            candidates[quality] = (quality, size, confidence)
+    choice = prefetcher.predict(candidates)
+    if choice is None:
         return
-    tg_limit = 2 * 1024 * 1024 * 1024
-    if file_size > tg_limit:
-        if msg:
-            await msg.reply("❗️ Файл слишком большой для отправки через Telegram (больше 2 ГБ).\nПопробуйте выбрать качество пониже!")
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    quality, size, confidence = candidates[choice]
+    # С неизвестным размером бюджет не оценить, а готовый file_id или файл из кэша отправится и так
+    if confidence == UNKNOWN or file_id_cache.get(video_id, quality, count=False) or media_cache.has(video_id, quality):
         return
-    title = info.get('title', 'YouTube Video')
-    if msg:
+    if quality == 'mp3':
+        fetch = lambda job: download_mp3(job, video_id, size)
+        reserve = audio_reservation(info, quality, size, confidence)
+    elif quality == 'm4a':
+        fetch = lambda job: download_m4a(job, video_id, size)
+        reserve = audio_reservation(info, quality, size, confidence)
+    else:
+        fetch = lambda job: download_video(job, video_id, quality, size)
+        reserve = scratch_reservation(size, confidence)
+    prefetcher.start(card_key(card), (video_id, quality), job_cost(info, quality), size, reserve, fetch)
+
+async def run_scheduled(msg, ticket, job):
+    position = scheduler.position(ticket)
+    if position:
+        waiting_since = time.perf_counter()
+        queue_msg = await msg.reply(f"⏳ Вы в очереди: позиция {position}")
+        while not await scheduler.wait(ticket, timeout=5):
+            new_position = scheduler.position(ticket)
+            if new_position != position:
+                position = new_position
+                try:
+                    await queue_msg.edit_text(f"⏳ Вы в очереди: позиция {position}")
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить позицию в очереди: {e}")
+        stage_seconds.observe(time.perf_counter() - waiting_since, stage='queue_wait')
         try:
-            logger.info(f"Пробую отправить видео: {temp_path}, размер: {file_size} байт")
-            try:
-                with open(temp_path, 'rb') as f:
-                    f.read(1024)
-                logger.info("Файл доступен для чтения")
-            except Exception as e:
-                logger.error(f"Файл не доступен для чтения: {e}")
-            safe_filename = sanitize_filename(title) + ".mp4"
-            if file_size <= 50 * 1024 * 1024:
-                await msg.reply_video(
-                    FSInputFile(temp_path, filename=safe_filename),
+            await queue_msg.delete()
+        except Exception:
+            pass
+    return await job()
+
+async def timed_job(job):
+    with timed('delivery'):
+        return await job()
+
+def start_scheduled(msg, ticket, job):
+    task = asyncio.ensure_future(run_scheduled(msg, ticket, lambda: timed_job(job)))
+    # Слот освобождается по завершении общей задачи, даже если она отменена до старта
+    task.add_done_callback(lambda _: scheduler.release(ticket))
+    return task
+
+async def download_and_send_m4a(msg, video_id, title, reserve=None, size=0, prefetched=None, entry=None):
+    fetch = lambda job: download_m4a(job, video_id, size)
+    async with fetched_file(fetch, (video_id, 'm4a'), reserve, 'm4a', prefetched, entry) as file_path:
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            raise DeliveryError("❌ Не удалось скачать аудио: файл пустой. Попробуйте MP3.")
+        if file_size > UPLOAD_LIMIT:
+            raise DeliveryError(TOO_LARGE_MESSAGE)
+        try:
+            safe_filename = sanitize_filename(title) + os.path.splitext(file_path)[1]
+            async with upload_source(file_path, safe_filename) as media:
+                sent = await msg.reply_audio(
+                    media,
                     caption=f"Готово! {title}"
                 )
-            else:
-                await msg.reply_document(
-                    FSInputFile(temp_path, filename=safe_filename),
-                    caption=f"Готово! {title} (отправлено как документ)"
-                )
-            logger.info("Видео успешно отправлено!")
-        except TelegramEntityTooLarge:
-            logger.warning("TelegramEntityTooLarge: файл слишком большой для Telegram")
-            await msg.reply("❗️ Файл слишком большой для отправки через Telegram (больше ~50 МБ).\nПопробуйте выбрать качество пониже или другой ролик.")
+        except Exception as e:
+            raise DeliveryError(f"❌ Ошибка при отправке аудио: {e}")
+        return remember_sent_file(sent, video_id, 'm4a')
+
+async def deliver(msg, user_id, video_id, quality, cost, caption, job, prefetched=None, entry=None):
+    # Одинаковые запросы разных пользователей ждут одну загрузку, остальным шлём file_id.
+    # prefetched — готовый файл (кэш на диске или упреждающая загрузка), entry — задача из журнала,
+    # продолжаемая после перезапуска
+    key = (video_id, quality)
+    ticket = None
+    if deliveries.has(key):
+        if prefetched is not None:
+            prefetched.discard()
+            prefetched = None
+    elif prefetched is None:
+        try:
+            ticket = scheduler.submit(user_id, cost)
+        except QueueFullError as e:
+            journal.finish(entry, str(e))
+            await msg.reply(str(e))
             return
+        if not ticket.granted.done():
+            prefetcher.preempt()
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке файла: {e}")
-            await msg.reply(f"❌ Ошибка при отправке файла: {e}")
-    if os.path.exists(temp_path):
+    def scheduled(ticket):
+        # Своя загрузка: слот планировщика и запись в журнале
+        nonlocal entry
         try:
-            os.remove(temp_path)
-        except PermissionError:
-            time.sleep(1)
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-
-@router.callback_query(F.data == "ytaudio_mp3")
+            if entry is None:
+                entry = journal.open(msg.chat.id, msg.chat.type, getattr(msg, 'message_thread_id', None),
+                                     msg.message_id, user_id, video_id, quality)
+            run = lambda: journal.track(entry, lambda: job(None, entry))
+            return start_scheduled(msg, ticket, run)
+        except Exception:
+            # Пока задача не создана, слот некому освободить: без этого пользователь теряет его навсегда
+            scheduler.release(ticket)
+            raise
+
+    async def ready_or_download():
+        # Готовый файл отправляется без слота планировщика и журнала. Неудачная упреждающая загрузка —
+        # не ошибка для пользователя: качаем как обычно
+        nonlocal prefetched
+        if await prefetched.wait():
+            return await timed_job(lambda: journal.track(entry, lambda: job(prefetched, entry)))
+        logger.info(f"Упреждающая загрузка {video_id}/{quality} не удалась, качаем заново")
+        prefetched.discard()
+        prefetched = None
+        try:
+            fallback = scheduler.submit(user_id, cost)
+        except QueueFullError as e:
+            raise DeliveryError(str(e))
+        return await scheduled(fallback)
+
+    def start():
+        return scheduled(ticket) if prefetched is None else ready_or_download()
+
+    try:
+        result, leader = await deliveries.run(key, start)
+    except DeliveryError as e:
+        journal.finish(entry, str(e))
+        await msg.reply(str(e))
+        return
+    except Exception as e:
+        journal.finish(entry, str(e))
+        logger.error(f"Ошибка общей задачи {video_id}/{quality}: {e}")
+        await msg.reply(f"❌ Ошибка: {e}")
+        return
+    deliveries_total.inc(source=(prefetched.source if prefetched else 'download') if leader else 'coalesced')
+    if leader:
+        return
+    if not result:
+        journal.finish(entry, "Общая загрузка не вернула файл")
+        await msg.reply("❌ Не удалось получить файл. Попробуйте ещё раз.")
+        return
+    kind, file_id = result
+    try:
+        await send_by_file_id(msg, kind, file_id, caption)
+    except Exception as e:
+        journal.finish(entry, str(e))
+        logger.error(f"Ошибка при пересылке общего файла {video_id}/{quality}: {e}")
+        await msg.reply(f"❌ Ошибка при отправке файла: {e}")
+        return
+    journal.finish(entry)
+
+def restore_message(bot, entry):
+    # Карточка, из которой запросили файл: после перезапуска ответ придёт туда же
+    message = Message(
+        message_id=entry.message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=entry.chat_id, type=entry.chat_type),
+        message_thread_id=entry.thread_id,
+        is_topic_message=True if entry.thread_id else None,
+    )
+    return message.as_(bot)
+
+async def recover_deliveries():
+    # До первой уборки временных файлов: каталоги продолжаемых задач уборщик не тронет
+    resumed, dropped = journal.recover()
+    for entry in dropped:
+        await scratch.discard(entry.staging)
+    for entry in resumed:
+        scratch.keep(entry.staging)
+    return resumed
+
+async def resume_delivery(bot, entry):
+    new_trace_id()
+    msg = restore_message(bot, entry)
+    video_id, quality = entry.video_id, entry.quality
+    logger.info(f"Продолжаем загрузку {video_id}/{quality} после перезапуска (попытка {entry.attempts})")
+    try:
+        info = await YouTubeService.get_cached_info(video_id)
+        if not info:
+            journal.finish(entry, "Не удалось получить информацию о видео")
+            await scratch.discard(entry.staging)
+            await msg.reply("❌ Не удалось продолжить загрузку после перезапуска бота. Попробуйте ещё раз.")
+            return
+        title = job_title(info, quality)
+        if await send_cached_file(msg, video_id, quality, f"Готово! {title}"):
+            journal.finish(entry)
+            await scratch.discard(entry.staging)
+            return
+        job = build_job(msg, info, video_id, quality, title)
+        if job is None:
+            journal.finish(entry, "Файл больше лимита Telegram")
+            await scratch.discard(entry.staging)
+            await msg.reply(TOO_LARGE_MESSAGE)
+            return
+        cached = media_cache.get(video_id, quality)
+        if cached is not None:
+            # Файл успел попасть в кэш: недокачанное больше не нужно
+            await scratch.discard(entry.staging)
+        await msg.reply("🔄 Бот перезапускался — продолжаю загрузку.")
+        await deliver(msg, entry.user_id, video_id, quality, job_cost(info, quality), f"Готово! {title}", job,
+                      cached, entry)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Не удалось продолжить загрузку {video_id}/{quality}: {e}")
+        journal.finish(entry, str(e))
+
+def resume_deliveries(bot, entries):
+    return [asyncio.create_task(resume_delivery(bot, entry)) for entry in entries]
+
+@router.callback_query(F.data.startswith("download:yt:") & ~F.data.endswith(":mp3") & ~F.data.endswith(":m4a"))
+async def process_video_format(callback: CallbackQuery):
+    msg = getattr(callback, 'message', None)
+    parsed = parse_download_callback(callback.data)
+    if not parsed or msg is None:
+        await callback.answer("Не удалось найти ссылку на видео.", show_alert=True)
+        return
+    video_id, format_spec = parsed
+    prefetcher.chosen(card_key(msg), (video_id, format_spec))
+    await callback.answer("Скачиваю видео...")
+    info = await YouTubeService.get_cached_info(video_id)
+    if not info:
+        await msg.reply("❌ Не удалось получить информацию о видео.")
+        return
+    title = job_title(info, format_spec)
+    prefetcher.record(choice_of(info, format_spec))
+    if await send_cached_file(msg, video_id, format_spec, f"Готово! {title}"):
+        return
+    job = build_job(msg, info, video_id, format_spec, title)
+    if job is None:
+        await msg.reply(TOO_LARGE_MESSAGE)
+        return
+    prefetched = media_cache.get(video_id, format_spec) or prefetcher.claim((video_id, format_spec))
+    await deliver(msg, callback.from_user.id, video_id, format_spec, job_cost(info, format_spec), f"Готово! {title}",
+                  job, prefetched)
+
+@router.callback_query(F.data.startswith("download:yt:") & F.data.endswith(":mp3"))
 async def process_audio_mp3(callback: CallbackQuery):
     msg = getattr(callback, 'message', None)
-    url = None
-    if msg is not None:
-        reply_msg = getattr(msg, 'reply_to_message', None)
-        if reply_msg is not None and getattr(reply_msg, 'text', None):
-            url = reply_msg.text
-        elif hasattr(msg, 'caption') and msg.caption:
-            url = msg.caption.split('\n')[0]
-    if not url or not isinstance(url, str):
+    parsed = parse_download_callback(callback.data)
+    if not parsed or msg is None:
         await callback.answer("Не удалось найти ссылку на видео.", show_alert=True)
         return
-    url = str(url)
+    video_id, _ = parsed
+    prefetcher.chosen(card_key(msg), (video_id, 'mp3'))
     await callback.answer("Скачиваю MP3...")
-    info = await YouTubeService.get_video_info(url)
+    info = await YouTubeService.get_cached_info(video_id)
     if not info:
-        if msg:
-            await msg.reply("❌ Не удалось получить информацию о видео.")
+        await msg.reply("❌ Не удалось получить информацию о видео.")
         return
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-        temp_path = f.name
-    success = await YouTubeService.download_audio_mp3(url, temp_path)
-    if not success:
-        if msg:
-            await msg.reply("❌ Не удалось скачать MP3.")
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    title = job_title(info, 'mp3')
+    prefetcher.record('mp3')
+    if await send_cached_file(msg, video_id, 'mp3', f"Готово! {title}"):
         return
-    # --- Исправление: ищем реальный mp3-файл, если temp_path не существует ---
-    file_path = temp_path
-    if not os.path.exists(file_path):
-        candidates = glob.glob(file_path.replace('.mp3', '*.mp3'))
-        if candidates:
-            file_path = candidates[0]
-        else:
-            if msg:
-                await msg.reply("❌ Не удалось найти скачанный MP3-файл.")
-            return
-    file_size = os.path.getsize(file_path)
-    if file_size == 0:
-        if msg:
-            await msg.reply("❌ Не удалось скачать MP3: файл пустой. Попробуйте другой формат или ссылку.")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    job = build_job(msg, info, video_id, 'mp3', title)
+    if job is None:
+        await msg.reply(TOO_LARGE_MESSAGE)
         return
-    tg_limit = 2 * 1024 * 1024 * 1024
-    if file_size > tg_limit:
-        if msg:
-            await msg.reply("❗️ Файл слишком большой для отправки через Telegram (больше 2 ГБ).\nПопробуйте выбрать качество пониже!")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    prefetched = media_cache.get(video_id, 'mp3') or prefetcher.claim((video_id, 'mp3'))
+    await deliver(msg, callback.from_user.id, video_id, 'mp3', job_cost(info, 'mp3'), f"Готово! {title}",
+                  job, prefetched)
+
+@router.callback_query(F.data.startswith("download:yt:") & F.data.endswith(":m4a"))
+async def process_audio_m4a(callback: CallbackQuery):
+    msg = getattr(callback, 'message', None)
+    parsed = parse_download_callback(callback.data)
+    if not parsed or msg is None:
+        await callback.answer("Не удалось найти ссылку на видео.", show_alert=True)
         return
-    title = info.get('title', 'YouTube Audio')
-    duration = info.get('duration', 0)
-    minutes = duration // 60
-    seconds = duration % 60
-    if msg:
-        try:
-            safe_filename = sanitize_filename(title) + ".mp3"
-            await msg.reply_audio(
-                FSInputFile(file_path, filename=safe_filename),
-                caption=f"Готово! {title}"
-            )
-        except Exception as e:
-            await msg.reply(f"❌ Ошибка при отправке MP3: {e}")
-    if os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-        except PermissionError:
-            time.sleep(1)
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
\ No newline at end of file
+    video_id, _ = parsed
+    prefetcher.chosen(card_key(msg), (video_id, 'm4a'))
+    await callback.answer("Скачиваю аудио...")
+    info = await YouTubeService.get_cached_info(video_id)
+    if not info:
+        await msg.reply("❌ Не удалось получить информацию о видео.")
+        return
+    title = job_title(info, 'm4a')
+    prefetcher.record('m4a')
+    if await send_cached_file(msg, video_id, 'm4a', f"Готово! {title}"):
+        return
+    job = build_job(msg, info, video_id, 'm4a', title)
+    if job is None:
+        await msg.reply(TOO_LARGE_MESSAGE)
+        return
+    prefetched = media_cache.get(video_id, 'm4a') or prefetcher.claim((video_id, 'm4a'))
+    await deliver(msg, callback.from_user.id, video_id, 'm4a', job_cost(info, 'm4a'), f"Готово! {title}",
+                  job, prefetched)
+
+@router.callback_query(F.data.startswith("ytvideo_") | F.data.startswith("ytaudio_"))
+async def process_stale_callback(callback: CallbackQuery):
+    # Кнопки карточек, отправленных до перехода на download:yt:<id>:<формат>: ссылки на видео в них нет
+    await callback.answer("Эта карточка устарела — пришлите ссылку ещё раз и выберите формат заново.", show_alert=True)
@@ -11,17 +11,24 @@ def _format_size(size):
         size /= 1024
     return f"{size:.1f} ПБ"
 
-def build_quality_keyboard(formats: list, short_id: str, source: str, audio_items=None) -> InlineKeyboardMarkup:
-    buttons = []
+def _fmt_size(fmt):
+    return fmt.get('size') or fmt.get('filesize') or fmt.get('filesize_approx') or 0
+
+def pick_formats_by_height(formats: list, max_height: int = 1080) -> dict:
     best_by_height = {}
     for fmt in formats:
         height = fmt.get('height')
         if not height or height not in MAIN_HEIGHTS:
             continue
-        if height > 1080:
+        if height > max_height:
             continue
-        if height not in best_by_height or (fmt.get('size') and fmt.get('size') > (best_by_height[height].get('size') or 0)):
+        if height not in best_by_height or _fmt_size(fmt) > _fmt_size(best_by_height[height]):
             best_by_height[height] = fmt
+    return best_by_height
+
+def build_quality_keyboard(formats: list, short_id: str, source: str, audio_items=None) -> InlineKeyboardMarkup:
+    buttons = []
+    best_by_height = pick_formats_by_height(formats)
     for h in MAIN_HEIGHTS:
         fmt = best_by_height.get(h)
         if not fmt:
@@ -30,7 +37,7 @@ def build_quality_keyboard(formats: list, short_id: str, source: str, audio_item
         buttons.append(
             InlineKeyboardButton(
                 text=label,
-                callback_data=f"download:{source}:{short_id}:{h}"
+                callback_data=f"download:{source}:{short_id}:{fmt.get('format_id', h)}"
             )
         )
     # MP3 кнопка с эмодзи нотки
@@ -41,4 +48,18 @@ def build_quality_keyboard(formats: list, short_id: str, source: str, audio_item
             callback_data=f"download:{source}:{short_id}:mp3"
         )
     )
-    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i+3] for i in range(0, len(buttons), 3)])
\ No newline at end of file
+    # Быстрое аудио без перекодирования
+    buttons.append(
+        InlineKeyboardButton(
+            text="⚡ M4A",
+            callback_data=f"download:{source}:{short_id}:m4a"
+        )
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i+3] for i in range(0, len(buttons), 3)])
+
+def build_playlist_keyboard(playlist_id: str, source: str) -> InlineKeyboardMarkup:
+    # Один формат для всех роликов плейлиста: альбом из MP3 или аудио без перекодирования
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="🎵 Все в MP3", callback_data=f"batch:{source}:{playlist_id}:mp3"),
+        InlineKeyboardButton(text="⚡ Все в M4A", callback_data=f"batch:{source}:{playlist_id}:m4a"),
+    ]])
@@ -0,0 +1,110 @@
+from typing import Dict, Optional, Tuple
+import logging
+import sqlite3
+import threading
+import time
+
+from config import FILE_CACHE_PATH, FILE_CACHE_TTL_DAYS
+
+
+logger = logging.getLogger("FILE_CACHE")
+
+PURGE_INTERVAL = 60 * 60
+# Счётчики попаданий копятся в памяти и пишутся в базу не чаще раза в FLUSH_INTERVAL секунд
+FLUSH_INTERVAL = 60
+
+
+class FileIdCache:
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # С WAL запись переживает падение процесса и без fsync на каждый коммит; для кэша этого достаточно
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " video_id TEXT NOT NULL,"
+            " quality TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " file_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (video_id, quality))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._last_purge = 0.0
+        self._counts = {'hits': 0, 'misses': 0}
+        self._last_flush = time.time()
+        self.purge_expired()
+
+    def _flush(self) -> None:
+        # Вызывается под self._lock
+        pending = [(name, value) for name, value in self._counts.items() if value]
+        if pending:
+            self._conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                pending,
+            )
+        self._counts = dict.fromkeys(self._counts, 0)
+        self._last_flush = time.time()
+
+    def get(self, video_id: str, quality: str, count: bool = True) -> Optional[Tuple[str, str]]:
+        # count=False — проверка без учёта в статистике попаданий (например, перед упреждающей загрузкой)
+        if time.time() - self._last_purge > PURGE_INTERVAL:
+            self.purge_expired()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, file_id FROM files WHERE video_id = ? AND quality = ? AND created_at >= ?",
+                (video_id, quality, time.time() - self.ttl_seconds),
+            ).fetchone()
+            if count:
+                # Клик не ждёт записи в базу: счётчик в памяти, сброс раз в FLUSH_INTERVAL
+                self._counts['hits' if row else 'misses'] += 1
+                if time.time() - self._last_flush > FLUSH_INTERVAL:
+                    self._flush()
+        if row:
+            logger.info(f"Кэш file_id: попадание {video_id}/{quality}")
+            return row[0], row[1]
+        return None
+
+    def put(self, video_id: str, quality: str, kind: str, file_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (video_id, quality, kind, file_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (video_id, quality, kind, file_id, time.time()),
+            )
+        logger.info(f"Кэш file_id: сохранён {video_id}/{quality} ({kind})")
+
+    def invalidate(self, video_id: str, quality: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE video_id = ? AND quality = ?", (video_id, quality))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM files WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._last_purge = time.time()
+        if cursor.rowcount:
+            logger.info(f"Кэш file_id: удалено устаревших записей: {cursor.rowcount}")
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name, value FROM stats").fetchall()
+            size = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            result = {'hits': 0, 'misses': 0}
+            result.update(dict(rows))
+            for name, value in self._counts.items():
+                result[name] = result.get(name, 0) + value
+        result['entries'] = size
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+
+
+file_id_cache = FileIdCache(FILE_CACHE_PATH, FILE_CACHE_TTL_DAYS * 24 * 60 * 60)
@@ -0,0 +1,211 @@
+from typing import Dict, List, Optional
+import contextlib
+import logging
+import os
+import time
+
+from config import (
+    YTDLP_COOKIE_FILES,
+    YTDLP_USER_AGENTS,
+    IDENTITY_BENCH_BASE,
+    IDENTITY_BENCH_MAX,
+)
+from app.services.metrics import identity_requests
+
+
+logger = logging.getLogger("IDENTITY")
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9,ru;q=0.8',
+}
+
+# Вес последнего результата в скользящих средних успешности и скорости
+EWMA_ALPHA = 0.2
+
+# Признаки того, что YouTube ограничил именно эту идентичность, а не что ролик недоступен
+BLOCK_MARKERS = (
+    ('429', ('HTTP Error 429', 'Too Many Requests')),
+    ('403', ('HTTP Error 403', 'Forbidden')),
+    ('bot_check', ("confirm you're not a bot", 'confirm you’re not a bot', 'Sign in to confirm')),
+)
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    text = str(error)
+    for reason, markers in BLOCK_MARKERS:
+        if any(marker in text for marker in markers):
+            return reason
+    return None
+
+
+class Identity:
+    # Файл cookies и заголовки, с которыми yt-dlp ходит в YouTube, и их здоровье
+    def __init__(self, name: str, cookiefile: Optional[str], headers: Dict[str, str]):
+        self.name = name
+        self.cookiefile = cookiefile
+        self.headers = headers
+        self.active = 0
+        self.successes = 0
+        self.failures = 0
+        self.blocks = 0
+        self.success_rate = 1.0
+        self.throughput = 0.0
+        self.strikes = 0
+        self.benched_at = 0.0
+        self.benched_until = 0.0
+        self.benched = False
+
+    @property
+    def options(self) -> Dict:
+        options = {'http_headers': dict(self.headers)}
+        if self.cookiefile:
+            options['cookiefile'] = self.cookiefile
+        return options
+
+    def bench_left(self, now: float) -> float:
+        return max(0.0, self.benched_until - now)
+
+    def transferred(self, size: int, seconds: float) -> None:
+        if size and seconds > 0:
+            rate = size / seconds
+            self.throughput = rate if not self.throughput else self.throughput + EWMA_ALPHA * (rate - self.throughput)
+
+    def stats(self, now: float) -> Dict:
+        return {
+            'active': self.active,
+            'successes': self.successes,
+            'failures': self.failures,
+            'blocks': self.blocks,
+            'success_rate': round(self.success_rate, 3),
+            'throughput': int(self.throughput),
+            'bench_left': round(self.bench_left(now), 1),
+        }
+
+
+class IdentityPool:
+    # Новые задачи расходятся по здоровым идентичностям: меньше активных задач на единицу
+    # успешности — раньше в очереди. После 403/429, проверки на бота или урезанной скорости
+    # идентичность уходит на скамейку, и каждый следующий такой случай подряд удваивает срок.
+    # Если на скамейке все, берём ту, что вернётся раньше всех: лучше попытка, чем отказ.
+
+    def __init__(self, identities: List[Identity], bench_base: float, bench_max: float):
+        if not identities:
+            raise ValueError("Пул идентичностей пуст")
+        self.identities = identities
+        self.bench_base = bench_base
+        self.bench_max = bench_max
+        self._exhausted = False
+
+    @classmethod
+    def from_config(cls, cookie_files: List[str], user_agents: List[str],
+                    bench_base: float, bench_max: float) -> 'IdentityPool':
+        # Cookies привязаны к сессии браузера, поэтому у файла cookies постоянный User-Agent:
+        # пары составляются по порядку, более короткий список идёт по кругу
+        count = max(len(cookie_files), len(user_agents), 1)
+        identities = []
+        for i in range(count):
+            cookiefile = cookie_files[i % len(cookie_files)] if cookie_files else None
+            headers = dict(DEFAULT_HEADERS)
+            if user_agents:
+                headers['User-Agent'] = user_agents[i % len(user_agents)]
+            name = f"{i}:{os.path.basename(cookiefile)}" if cookiefile else str(i)
+            identities.append(Identity(name, cookiefile, headers))
+        return cls(identities, bench_base, bench_max)
+
+    def _available(self, now: float) -> List[Identity]:
+        available = []
+        for identity in self.identities:
+            if identity.benched and not identity.bench_left(now):
+                identity.benched = False
+                logger.info(f"Идентичность {identity.name} снова в работе после скамейки")
+            if not identity.benched:
+                available.append(identity)
+        return available
+
+    def pick(self) -> Identity:
+        now = time.monotonic()
+        available = self._available(now)
+        if not available:
+            identity = min(self.identities, key=lambda i: i.benched_until)
+            if not self._exhausted:
+                self._exhausted = True
+                logger.warning(f"Все идентичности на скамейке, используем {identity.name} "
+                               f"(осталось {identity.bench_left(now):.0f} c)")
+            return identity
+        self._exhausted = False
+        return min(available, key=lambda i: ((i.active + 1) / max(i.success_rate, 0.05), -i.throughput))
+
+    def _bench(self, identity: Identity, reason: str, started: float) -> None:
+        # Задачи, начатые до ухода на скамейку, срок не продлевают: одна вспышка 429 — один случай
+        if identity.benched and started < identity.benched_at:
+            return
+        now = time.monotonic()
+        identity.strikes += 1
+        duration = min(self.bench_max, self.bench_base * 2 ** (identity.strikes - 1))
+        identity.benched_at = now
+        identity.benched_until = now + duration
+        identity.benched = True
+        logger.warning(f"Идентичность {identity.name} на скамейке {duration:.0f} c: {reason} "
+                       f"(подряд: {identity.strikes}, успешность {identity.success_rate:.2f})")
+
+    def _record(self, identity: Identity, ok: bool) -> None:
+        identity.success_rate += EWMA_ALPHA * ((1.0 if ok else 0.0) - identity.success_rate)
+        if ok:
+            identity.successes += 1
+        else:
+            identity.failures += 1
+
+    def succeeded(self, identity: Identity, started: float) -> None:
+        self._record(identity, True)
+        identity_requests.inc(identity=identity.name, outcome='ok')
+        if not identity.benched:
+            identity.strikes = 0
+        elif started >= identity.benched_at:
+            # Взяли со скамейки, потому что свободных не было, и запрос прошёл
+            identity.benched = False
+            identity.strikes = 0
+            logger.info(f"Идентичность {identity.name} снова в работе: запрос со скамейки прошёл")
+
+    def failed(self, identity: Identity, error: BaseException, started: float) -> None:
+        self._record(identity, False)
+        reason = classify_error(error)
+        if reason is None:
+            identity_requests.inc(identity=identity.name, outcome='error')
+            return
+        identity.blocks += 1
+        identity_requests.inc(identity=identity.name, outcome=reason)
+        self._bench(identity, reason, started)
+
+    def throttled(self, identity: Identity, started: float) -> None:
+        # Загрузка прошла, но скорость упала ниже throttledratelimit и ссылки пришлось извлекать заново
+        identity_requests.inc(identity=identity.name, outcome='throttled')
+        self._bench(identity, 'throttled', started)
+
+    @contextlib.contextmanager
+    def use(self):
+        # Отмена задачи не говорит ничего о здоровье идентичности и не учитывается
+        identity = self.pick()
+        identity.active += 1
+        started = time.monotonic()
+        try:
+            yield identity
+        except Exception as e:
+            self.failed(identity, e, started)
+            raise
+        else:
+            self.succeeded(identity, started)
+        finally:
+            identity.active -= 1
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        return {identity.name: identity.stats(now) for identity in self.identities}
+
+
+identities = IdentityPool.from_config(
+    YTDLP_COOKIE_FILES,
+    YTDLP_USER_AGENTS,
+    IDENTITY_BENCH_BASE,
+    IDENTITY_BENCH_MAX,
+)
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import json
+import logging
+import time
+
+from config import INFO_CACHE_MAX_ENTRIES, INFO_CACHE_MAX_MB, INFO_CACHE_TTL
+
+
+logger = logging.getLogger("INFO_CACHE")
+
+
+class InfoCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, size, value = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        # Приблизительный размер: сериализованный JSON того, что лежит в кэше
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            logger.warning(f"Запись {key} ({size} байт) больше лимита кэша, не кэшируем")
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+        }
+
+
+info_cache = InfoCache(INFO_CACHE_MAX_ENTRIES, INFO_CACHE_MAX_MB * 1024 * 1024, INFO_CACHE_TTL)
@@ -0,0 +1,221 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import JOURNAL_PATH, JOURNAL_MAX_AGE, JOURNAL_MAX_ATTEMPTS, JOURNAL_DRAIN_TIMEOUT
+from app.services.metrics import journal_events
+from app.services.scratch import HOSTNAME
+
+
+logger = logging.getLogger("JOURNAL")
+
+T = TypeVar('T')
+
+DOWNLOADING = 'downloading'
+UPLOADING = 'uploading'
+DONE = 'done'
+FAILED = 'failed'
+UNFINISHED = (DOWNLOADING, UPLOADING)
+
+COLUMNS = ('id', 'chat_id', 'chat_type', 'thread_id', 'message_id', 'user_id', 'video_id', 'quality',
+           'state', 'owner', 'attempts', 'path', 'error', 'created_at', 'updated_at')
+
+
+class JournalEntry:
+    def __init__(self, row: Dict):
+        self.__dict__.update(row)
+
+    @property
+    def staging(self) -> str:
+        # Имя каталога во временном хранилище не зависит от процесса: после перезапуска он тот же
+        return f"journal-{self.id}"
+
+
+def _owner() -> str:
+    return f"{HOSTNAME}-{os.getpid()}"
+
+
+def _owner_alive(owner: str) -> bool:
+    # Журнал принадлежит одному развёртыванию: запись другого хоста (прежнего контейнера) считаем брошенной
+    host, _, pid = owner.rpartition('-')
+    if host != HOSTNAME or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DeliveryJournal:
+    # Журнал своих загрузок: что, кому и на каком этапе. После падения или деплоя незавершённые
+    # задачи продолжаются с .part-файлов в том же каталоге и отправляются в исходный чат;
+    # слишком старые и те, что уже несколько раз не пережили перезапуск, списываются.
+
+    def __init__(self, path: str, max_age: float, max_attempts: int, drain_timeout: float):
+        self.path = path
+        self.max_age = max_age
+        self.max_attempts = max_attempts
+        self.drain_timeout = drain_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Журнал спасает от падения и перезапуска процесса, для этого WAL без fsync на каждый коммит
+        # достаточно: запись не держит цикл событий на диске
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER NOT NULL,"
+            " chat_type TEXT NOT NULL,"
+            " thread_id INTEGER,"
+            " message_id INTEGER NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " quality TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " owner TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 1,"
+            " path TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS deliveries_state ON deliveries (state, id)")
+        self._entries: Dict[int, JournalEntry] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.draining = False
+
+    def _get(self, entry_id: int) -> JournalEntry:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM deliveries WHERE id = ?", (entry_id,)
+            ).fetchone()
+        return JournalEntry(dict(zip(COLUMNS, row)))
+
+    def open(self, chat_id: int, chat_type: str, thread_id: Optional[int], message_id: int, user_id: int,
+             video_id: str, quality: str) -> JournalEntry:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO deliveries (chat_id, chat_type, thread_id, message_id, user_id, video_id, quality,"
+                " state, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, chat_type, thread_id, message_id, user_id, video_id, quality,
+                 DOWNLOADING, _owner(), now, now),
+            )
+        entry = self._get(cursor.lastrowid)
+        self._entries[entry.id] = entry
+        return entry
+
+    def _update(self, entry: JournalEntry, **fields) -> None:
+        fields['updated_at'] = time.time()
+        entry.__dict__.update(fields)
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE deliveries SET {assignments} WHERE id = ?", (*fields.values(), entry.id))
+
+    def uploading(self, entry: Optional[JournalEntry], path: str) -> None:
+        # Файл готов: если процесс остановится посреди отправки, после перезапуска скачивать его не нужно
+        if entry is not None:
+            self._update(entry, state=UPLOADING, path=path)
+
+    def _delete(self, entry: JournalEntry, state: str, error: Optional[str] = None) -> None:
+        # Завершённая задача для продолжения не нужна: запись удаляем, чтобы журнал не копил историю
+        # загрузок пользователей. Состояние остаётся только у объекта в памяти
+        entry.__dict__.update(state=state, error=error, updated_at=time.time())
+        with self._lock:
+            self._conn.execute("DELETE FROM deliveries WHERE id = ?", (entry.id,))
+        self._entries.pop(entry.id, None)
+
+    def finish(self, entry: Optional[JournalEntry], error: Optional[str] = None) -> None:
+        # Во время остановки ошибки (закрытая сессия Bot API) не повод списывать задачу
+        if entry is None or entry.state not in UNFINISHED or (error and self.draining):
+            return
+        self._delete(entry, FAILED if error else DONE, error)
+
+    async def track(self, entry: Optional[JournalEntry], func: Callable[[], Awaitable[T]]) -> T:
+        # Отмена (остановка бота) оставляет запись незавершённой — её продолжит следующий запуск
+        if entry is None:
+            return await func()
+        if self.draining:
+            # Задача дождалась слота, пока бот останавливается: начнём её после перезапуска
+            raise asyncio.CancelledError()
+        self._tasks[entry.id] = asyncio.current_task()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.finish(entry, str(e) or type(e).__name__)
+            raise
+        else:
+            self.finish(entry)
+            return result
+        finally:
+            self._tasks.pop(entry.id, None)
+
+    def recover(self) -> Tuple[List[JournalEntry], List[JournalEntry]]:
+        # Незавершённые задачи умерших процессов этого хоста: продолжить или списать
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM deliveries WHERE state IN (?, ?) ORDER BY id", UNFINISHED
+            ).fetchall()
+            # Завершённые записи прежних версий, которые ещё не удаляли их сразу
+            self._conn.execute("DELETE FROM deliveries WHERE state NOT IN (?, ?)", UNFINISHED)
+        resumed, dropped = [], []
+        for row in rows:
+            entry = JournalEntry(dict(zip(COLUMNS, row)))
+            if entry.id in self._entries or _owner_alive(entry.owner):
+                continue
+            if now - entry.created_at > self.max_age:
+                self._delete(entry, FAILED, "Задача устарела")
+                journal_events.inc(event='expired')
+                dropped.append(entry)
+            elif entry.attempts >= self.max_attempts:
+                self._delete(entry, FAILED, "Задача не пережила несколько перезапусков")
+                journal_events.inc(event='abandoned')
+                dropped.append(entry)
+            else:
+                self._update(entry, owner=_owner(), attempts=entry.attempts + 1)
+                self._entries[entry.id] = entry
+                journal_events.inc(event='resumed')
+                resumed.append(entry)
+        if resumed or dropped:
+            logger.info(f"Журнал загрузок: продолжаем {len(resumed)}, списано {len(dropped)}")
+        return resumed, dropped
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        # Остановка: скачивание прерываем сразу (продолжится после запуска), отправке даём закончиться
+        timeout = self.drain_timeout if timeout is None else timeout
+        self.draining = True
+        tasks = [(self._entries[entry_id].state, task) for entry_id, task in self._tasks.items()]
+        downloads = [task for state, task in tasks if state == DOWNLOADING]
+        for task in downloads:
+            task.cancel()
+        uploads = [task for state, task in tasks if state == UPLOADING]
+        if uploads:
+            logger.info(f"Ждём завершения отправки файлов: {len(uploads)} (до {timeout:.0f} c)")
+            _, pending = await asyncio.wait(uploads, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            journal_events.inc(len(uploads) - len(pending), event='drained')
+        await asyncio.gather(*downloads, *uploads, return_exceptions=True)
+        if downloads:
+            journal_events.inc(len(downloads), event='interrupted')
+            logger.info(f"Прервано загрузок до следующего запуска: {len(downloads)}")
+
+    def stats(self) -> Dict[str, int]:
+        counts = {DOWNLOADING: 0, UPLOADING: 0}
+        for entry in self._entries.values():
+            counts[entry.state] = counts.get(entry.state, 0) + 1
+        return counts
+
+
+journal = DeliveryJournal(JOURNAL_PATH, JOURNAL_MAX_AGE, JOURNAL_MAX_ATTEMPTS, JOURNAL_DRAIN_TIMEOUT)
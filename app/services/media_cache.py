@@ -0,0 +1,224 @@
+from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import uuid
+
+from config import MEDIA_CACHE_DIR, MEDIA_CACHE_MB
+from app.services.scratch import remove_path
+
+
+logger = logging.getLogger("MEDIA_CACHE")
+
+MB = 1024 * 1024
+TMP_PREFIX = '.tmp-'
+# Один файл занимает не больше этой доли кэша, иначе длинное видео вытеснит десятки треков
+MAX_FILE_SHARE = 0.25
+
+
+class CachedFile:
+    def __init__(self, key: Tuple[str, str], path: str, size: int):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.pins = 0
+
+
+class CachedMedia:
+    # Файл из кэша для обработчика, как готовая упреждающая загрузка: пока он отправляется,
+    # вытеснение его не трогает
+    source = 'media_cache'
+
+    def __init__(self, cache: 'MediaCache', entry: CachedFile):
+        self._cache = cache
+        self._entry = entry
+        self._released = False
+        entry.pins += 1
+
+    async def wait(self) -> bool:
+        return True
+
+    @contextlib.asynccontextmanager
+    async def use(self):
+        try:
+            yield self._entry.path
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        if not self._released:
+            self._released = True
+            self._entry.pins -= 1
+
+
+class MediaCache:
+    # Готовые файлы по (video_id, качество) в пределах max_bytes. Новый файл пишется под временным
+    # именем и переименовывается, поэтому читатели видят только целые файлы. При нехватке места
+    # удаляются давно не запрошенные; порядок хранится во времени изменения файлов и переживает
+    # перезапуск. File_id привязан к токену бота, а файл на диске годится и после смены токена.
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_file_bytes = int(max_bytes * MAX_FILE_SHARE)
+        self._entries: 'OrderedDict[Tuple[str, str], CachedFile]' = OrderedDict()
+        self._writing: Set[Tuple[str, str]] = set()
+        self._loaded = False
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, video_id: str, quality: str, ext: str) -> str:
+        return os.path.join(self.root, f"{video_id}@{quality}{ext}")
+
+    def _load(self) -> None:
+        # При первом обращении: файлы прошлых запусков в порядке последнего использования
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                # Каталог ссылок локального Bot API, оставшийся от прерванной отправки
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            if name.startswith(TMP_PREFIX):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            video_id, sep, rest = name.partition('@')
+            quality = os.path.splitext(rest)[0]
+            if not sep or not quality:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, CachedFile((video_id, quality), path, stat.st_size)))
+        for _, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[entry.key] = entry
+            self.size += entry.size
+        # Лимит могли уменьшить с прошлого запуска
+        _, victims = self._evict(0)
+        for victim in victims:
+            with contextlib.suppress(OSError):
+                os.remove(victim.path)
+        if self._entries:
+            logger.info(f"Кэш файлов: {len(self._entries)} файлов, {self.size / MB:.0f} МБ")
+
+    def _evict(self, incoming: int) -> Tuple[bool, List[CachedFile]]:
+        # Освобождает место под incoming байт, начиная с давно не запрошенных; отправляемые пропускает
+        victims = []
+        for entry in list(self._entries.values()):
+            if self.size + incoming <= self.max_bytes:
+                break
+            if entry.pins:
+                continue
+            del self._entries[entry.key]
+            self.size -= entry.size
+            self.evicted += 1
+            victims.append(entry)
+        if victims:
+            logger.info(f"Кэш файлов: вытеснено {len(victims)} ({sum(v.size for v in victims) / MB:.1f} МБ)")
+        return self.size + incoming <= self.max_bytes, victims
+
+    def has(self, video_id: str, quality: str) -> bool:
+        if not self.enabled:
+            return False
+        self._load()
+        return (video_id, quality) in self._entries
+
+    def get(self, video_id: str, quality: str) -> Optional[CachedMedia]:
+        if not self.enabled:
+            return None
+        self._load()
+        entry = self._entries.get((video_id, quality))
+        if entry is not None and not os.path.exists(entry.path):
+            # Файл удалили снаружи
+            del self._entries[entry.key]
+            self.size -= entry.size
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry.key)
+        with contextlib.suppress(OSError):
+            os.utime(entry.path)
+        self.hits += 1
+        logger.info(f"Кэш файлов: попадание {video_id}/{quality}")
+        return CachedMedia(self, entry)
+
+    def _write(self, source: str, path: str) -> None:
+        tmp_path = os.path.join(self.root, f"{TMP_PREFIX}{uuid.uuid4().hex[:12]}")
+        try:
+            try:
+                # Та же файловая система — жёсткая ссылка, данные не копируются
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    async def put(self, video_id: str, quality: str, source: str) -> bool:
+        if not self.enabled:
+            return False
+        self._load()
+        key = (video_id, quality)
+        if key in self._entries or key in self._writing:
+            return False
+        try:
+            size = os.path.getsize(source)
+        except OSError:
+            return False
+        if not size or size > self.max_file_bytes:
+            return False
+        fits, victims = self._evict(size)
+        for victim in victims:
+            await remove_path(victim.path)
+        if not fits:
+            return False
+        path = self._path(video_id, quality, os.path.splitext(source)[1])
+        # Место занято сразу, чтобы параллельная запись не вышла за лимит
+        self._writing.add(key)
+        self.size += size
+        stored = False
+        try:
+            await asyncio.to_thread(self._write, source, path)
+            stored = True
+        except OSError as e:
+            logger.warning(f"Кэш файлов: не удалось сохранить {video_id}/{quality}: {e}")
+        finally:
+            self._writing.discard(key)
+            if not stored:
+                self.size -= size
+        if stored:
+            self._entries[key] = CachedFile(key, path, size)
+            self.stored += 1
+        return stored
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'stored': self.stored,
+            'evicted': self.evicted,
+        }
+
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MB * MB)
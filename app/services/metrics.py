@@ -0,0 +1,306 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import bisect
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+import uuid
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+
+logger = logging.getLogger("METRICS")
+
+# Формат Prometheus text exposition 0.0.4 без prometheus_client: метрик немного, хватает своих счётчиков
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900)
+
+trace_id: contextvars.ContextVar[str] = contextvars.ContextVar('trace_id', default='-')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        # callback возвращает {значения меток: число} и вызывается при каждом опросе
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                items = list(self.callback().items())
+            except Exception as e:
+                logger.warning(f"Не удалось снять метрику {self.name}: {e}")
+                return []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class CallbackCounter(Gauge):
+    # Счётчик, значение которого хранится в другом объекте (например, hits у кэшей)
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    'bsaver_stage_seconds', 'Длительность этапов обработки', ('stage',)))
+errors_total = registry.register(Counter(
+    'bsaver_errors_total', 'Ошибки по этапам и типам', ('stage', 'type')))
+downloaded_bytes = registry.register(Counter(
+    'bsaver_downloaded_bytes_total', 'Скачано байт с YouTube', ('kind',)))
+uploaded_bytes = registry.register(Counter(
+    'bsaver_uploaded_bytes_total', 'Отправлено байт в Telegram', ('kind',)))
+deliveries_total = registry.register(Counter(
+    'bsaver_deliveries_total', 'Запросы файлов по источнику: file_id, кэш на диске, упреждающая, общая загрузка или своя', ('source',)))
+prefetch_total = registry.register(Counter(
+    'bsaver_prefetch_total', 'Упреждающие загрузки: started, hit, miss, expired, preempted, failed', ('outcome',)))
+prefetch_bytes = registry.register(Counter(
+    'bsaver_prefetch_bytes_total', 'Байты упреждающих загрузок: пригодившиеся и впустую', ('result',)))
+journal_events = registry.register(Counter(
+    'bsaver_journal_events_total', 'Журнал загрузок: resumed, expired, abandoned, drained, interrupted', ('event',)))
+identity_requests = registry.register(Counter(
+    'bsaver_identity_requests_total', 'Запросы к YouTube по идентичностям: ok, error, 403, 429, bot_check, throttled',
+    ('identity', 'outcome')))
+
+
+@contextlib.contextmanager
+def timed(stage: str):
+    # Время этапа пишется и при ошибке; отмена задачи ошибкой не считается
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        errors_total.inc(stage=stage, type=type(e).__name__)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+def new_trace_id() -> str:
+    value = uuid.uuid4().hex[:8]
+    trace_id.set(value)
+    return value
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id.get()
+        return True
+
+
+class TraceMiddleware(BaseMiddleware):
+    # Каждый апдейт получает свой trace_id; задачи, созданные из хендлера, наследуют его через contextvars
+    async def __call__(self, handler, event, data):
+        new_trace_id()
+        return await handler(event, data)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики Prometheus: http://{host}:{port}/metrics")
+    return runner
+
+
+def register_service_metrics() -> None:
+    from app.services.file_cache import file_id_cache
+    from app.services.identities import identities
+    from app.services.info_cache import info_cache
+    from app.services.journal import journal
+    from app.services.media_cache import media_cache
+    from app.services.prefetch import prefetcher
+    from app.services.scheduler import scheduler
+    from app.services.scratch import scratch
+    from app.services.send_queue import send_queue
+    from app.services.youtube_service import YouTubeService
+
+    def cache_stats(field: str) -> Callable[[], Dict[Tuple, float]]:
+        return lambda: {
+            ('info',): info_cache.stats()[field],
+            ('file_id',): file_id_cache.stats()[field],
+            ('media',): media_cache.stats()[field],
+        }
+
+    registry.register(Gauge(
+        'bsaver_jobs', 'Загрузки в планировщике', ('state',),
+        callback=lambda: {('active',): scheduler.active, ('queued',): scheduler.queued}))
+    registry.register(CallbackCounter(
+        'bsaver_jobs_rejected_total', 'Отказы планировщика из-за переполнения',
+        callback=lambda: {(): scheduler.rejected}))
+    registry.register(CallbackCounter(
+        'bsaver_cache_hits_total', 'Попадания в кэши', ('cache',), callback=cache_stats('hits')))
+    registry.register(CallbackCounter(
+        'bsaver_cache_misses_total', 'Промахи кэшей', ('cache',), callback=cache_stats('misses')))
+    registry.register(Gauge(
+        'bsaver_send_queue_depth', 'Запросы в очереди отправки Telegram', ('priority',),
+        callback=lambda: {(k,): v for k, v in send_queue.stats()['pending'].items()}))
+    registry.register(CallbackCounter(
+        'bsaver_send_retries_total', 'Повторы после 429 от Telegram', callback=lambda: {(): send_queue.retried}))
+    registry.register(Gauge(
+        'bsaver_scratch_reserved_bytes', 'Зарезервировано во временном хранилище',
+        callback=lambda: {(): scratch.stats()['reserved_bytes']}))
+    registry.register(Gauge(
+        'bsaver_media_cache_bytes', 'Объём кэша готовых файлов на диске',
+        callback=lambda: {(): media_cache.stats()['bytes']}))
+    registry.register(CallbackCounter(
+        'bsaver_media_cache_evictions_total', 'Файлы, вытесненные из кэша на диске',
+        callback=lambda: {(): media_cache.stats()['evicted']}))
+    registry.register(Gauge(
+        'bsaver_journal_jobs', 'Незавершённые загрузки в журнале этого процесса', ('state',),
+        callback=lambda: {(k,): v for k, v in journal.stats().items()}))
+    registry.register(Gauge(
+        'bsaver_prefetch_active', 'Упреждающие загрузки: идут или ждут клика',
+        callback=lambda: {(): prefetcher.active}))
+
+    def identity_stats(field: str) -> Callable[[], Dict[Tuple, float]]:
+        return lambda: {(name,): stats[field] for name, stats in identities.stats().items()}
+
+    registry.register(Gauge(
+        'bsaver_identity_success_ratio', 'Скользящая доля успешных запросов идентичности', ('identity',),
+        callback=identity_stats('success_rate')))
+    registry.register(Gauge(
+        'bsaver_identity_throughput_bytes', 'Скользящая скорость скачивания идентичности, байт/с', ('identity',),
+        callback=identity_stats('throughput')))
+    registry.register(Gauge(
+        'bsaver_identity_active', 'Запросы, идущие через идентичность', ('identity',),
+        callback=identity_stats('active')))
+    registry.register(Gauge(
+        'bsaver_identity_bench_seconds', 'Сколько идентичности осталось на скамейке', ('identity',),
+        callback=identity_stats('bench_left')))
+    registry.register(Gauge(
+        'bsaver_ytdlp_instances', 'Экземпляры YoutubeDL в пуле бота', ('state',),
+        callback=lambda: {(k,): YouTubeService.pool_stats()[k] for k in ('idle', 'busy')}))
+    registry.register(CallbackCounter(
+        'bsaver_ytdlp_instances_total', 'Создание и переиспользование экземпляров YoutubeDL', ('event',),
+        callback=lambda: {(k,): YouTubeService.pool_stats()[k] for k in ('created', 'reused', 'discarded')}))
@@ -0,0 +1,217 @@
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+import asyncio
+import contextlib
+import logging
+import os
+
+from config import (
+    PREFETCH_ENABLED,
+    PREFETCH_MAX_ACTIVE,
+    PREFETCH_MAX_MB,
+    PREFETCH_TTL,
+    PREFETCH_MIN_SHARE,
+)
+from app.services.metrics import prefetch_total, prefetch_bytes
+from app.services.scheduler import scheduler
+from app.services.scratch import scratch, ScratchJob
+
+
+logger = logging.getLogger("PREFETCH")
+
+MB = 1024 * 1024
+
+# Условный пользователь планировщика: упреждающие загрузки идут в общей справедливой очереди
+PREFETCH_USER = 0
+
+# Начальная статистика кликов, пока не набралась своя: чаще всего берут MP3, 360p и 720p
+PRIOR_CHOICES = {'mp3': 4.0, '360': 3.0, '720': 3.0, '480': 1.0, 'm4a': 1.0, '240': 0.5, '144': 0.5}
+
+
+class Prefetch:
+    source = 'prefetch'
+
+    def __init__(self, key: Tuple, card: Hashable):
+        self.key = key
+        self.cards: Set[Hashable] = {card}
+        self.result = asyncio.get_running_loop().create_future()
+        self.released = asyncio.Event()
+        self.claimed = False
+        self.size = 0
+        self.ticket = None
+        self.task: Optional[asyncio.Task] = None
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    async def wait(self) -> bool:
+        # Дожидаемся загрузки; False — она не удалась или отменена, обработчик скачает файл сам
+        try:
+            await asyncio.shield(self.result)
+        except asyncio.CancelledError:
+            if not self.result.cancelled():
+                raise
+            return False
+        except Exception:
+            return False
+        return True
+
+    @contextlib.asynccontextmanager
+    async def use(self):
+        # Путь к файлу; если загрузка ещё идёт — дожидаемся её, ошибка загрузки приходит сюда же
+        try:
+            yield await asyncio.shield(self.result)
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        self.released.set()
+        if not self.result.done() and self.task is not None:
+            self.task.cancel()
+
+
+class Prefetcher:
+    # Пока пользователь смотрит на карточку, при свободных слотах планировщика скачиваем самый
+    # вероятный формат. Совпал клик — файл отдаётся обработчику, другой выбор или истёкший TTL —
+    # загрузка отменяется и каталог удаляется. Если реальной задаче не хватило слота, упреждающая
+    # загрузка уступает его.
+
+    def __init__(self, enabled: bool, max_active: int, max_bytes: int, ttl: float, min_share: float):
+        self.enabled = enabled
+        self.max_active = max_active
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_share = min_share
+        self.choices: Dict[str, float] = dict(PRIOR_CHOICES)
+        self._entries: Dict[Tuple, Prefetch] = {}
+
+    @property
+    def active(self) -> int:
+        return len(self._entries)
+
+    def record(self, choice: Optional[str]) -> None:
+        if not choice:
+            return
+        self.choices[choice] = self.choices.get(choice, 0.0) + 1
+        if sum(self.choices.values()) > 10000:
+            # Старые клики постепенно теряют вес
+            self.choices = {k: v / 2 for k, v in self.choices.items()}
+
+    def predict(self, available: Iterable[str]) -> Optional[str]:
+        weights = {c: self.choices.get(c, 0.0) for c in available}
+        total = sum(weights.values())
+        if not total:
+            return None
+        choice = max(weights, key=weights.get)
+        return choice if weights[choice] / total >= self.min_share else None
+
+    def _downloading(self) -> int:
+        return sum(1 for entry in self._entries.values() if entry.ticket is not None and not entry.ticket.released)
+
+    def start(self, card: Hashable, key: Tuple, cost: float, size: int, reserve: int,
+              fetch: Callable[[ScratchJob], Awaitable[str]]) -> bool:
+        if not self.enabled:
+            return False
+        entry = self._entries.get(key)
+        if entry is not None:
+            # То же видео в другой карточке: ждём клика в любой из них
+            if not entry.claimed:
+                entry.cards.add(card)
+            return False
+        if len(self._entries) >= self.max_active or not size or size > self.max_bytes:
+            return False
+        if not scheduler.has_capacity() or self._downloading() >= scheduler.max_per_user or not scratch.fits(reserve):
+            return False
+        entry = Prefetch(key, card)
+        entry.ticket = scheduler.submit(PREFETCH_USER, cost)
+        self._entries[key] = entry
+        entry.expiry = asyncio.get_running_loop().call_later(self.ttl, self._cancel, entry, 'expired')
+        entry.task = asyncio.create_task(self._run(entry, reserve, fetch))
+        entry.task.add_done_callback(lambda _: self._finish(entry))
+        prefetch_total.inc(outcome='started')
+        logger.info(f"Упреждающая загрузка {key[0]}/{key[1]} (~{size / MB:.1f} МБ)")
+        return True
+
+    async def _run(self, entry: Prefetch, reserve: int, fetch: Callable[[ScratchJob], Awaitable[str]]) -> None:
+        try:
+            async with scratch.job(reserve, 'prefetch') as job:
+                try:
+                    path = await fetch(job)
+                finally:
+                    scheduler.release(entry.ticket)
+                entry.size = os.path.getsize(path)
+                entry.result.set_result(path)
+                # Каталог живёт, пока обработчик не отправит файл или пока загрузку не отменят
+                await entry.released.wait()
+        except Exception as e:
+            prefetch_total.inc(outcome='failed')
+            logger.warning(f"Упреждающая загрузка {entry.key[0]}/{entry.key[1]} не удалась: {e}")
+            if entry.claimed:
+                entry.result.set_exception(e)
+            else:
+                entry.result.cancel()
+
+    def _finish(self, entry: Prefetch) -> None:
+        # Колбэк задачи: срабатывает и когда её отменили до первого шага
+        scheduler.release(entry.ticket)
+        entry.expiry.cancel()
+        if not entry.result.done():
+            entry.result.cancel()
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        if entry.size:
+            prefetch_bytes.inc(entry.size, result='used' if entry.claimed else 'wasted')
+
+    def _cancel(self, entry: Prefetch, outcome: str) -> None:
+        if entry.claimed or entry.task.done():
+            return
+        prefetch_total.inc(outcome=outcome)
+        logger.info(f"Упреждающая загрузка {entry.key[0]}/{entry.key[1]} отменена: {outcome}")
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        entry.task.cancel()
+
+    def chosen(self, card: Hashable, key: Tuple) -> None:
+        # Пользователь выбрал формат в карточке: загрузки других форматов для неё больше не нужны
+        for entry in list(self._entries.values()):
+            if entry.key != key and card in entry.cards:
+                entry.cards.discard(card)
+                if not entry.cards:
+                    self._cancel(entry, 'miss')
+
+    def claim(self, key: Tuple) -> Optional[Prefetch]:
+        entry = self._entries.get(key)
+        if entry is None or entry.claimed or entry.task.done():
+            return None
+        entry.claimed = True
+        entry.expiry.cancel()
+        prefetch_total.inc(outcome='hit')
+        logger.info(f"Упреждающая загрузка {key[0]}/{key[1]} пригодилась")
+        return entry
+
+    def preempt(self) -> bool:
+        # Реальная задача ждёт слот — отдаём ей слот незатребованной упреждающей загрузки
+        for entry in self._entries.values():
+            if not entry.claimed and entry.ticket is not None and not entry.ticket.released:
+                self._cancel(entry, 'preempted')
+                return True
+        return False
+
+    def stats(self) -> Dict:
+        return {
+            'active': self.active,
+            'downloading': self._downloading(),
+            'claimed': sum(1 for entry in self._entries.values() if entry.claimed),
+        }
+
+    async def close(self) -> None:
+        tasks = [entry.task for entry in self._entries.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+prefetcher = Prefetcher(
+    PREFETCH_ENABLED,
+    PREFETCH_MAX_ACTIVE,
+    PREFETCH_MAX_MB * MB,
+    PREFETCH_TTL,
+    PREFETCH_MIN_SHARE,
+)
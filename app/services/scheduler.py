@@ -0,0 +1,114 @@
+from typing import Dict, List, Optional
+import asyncio
+import itertools
+import logging
+
+from config import SCHEDULER_MAX_ACTIVE, SCHEDULER_MAX_QUEUED, SCHEDULER_MAX_PER_USER
+
+
+logger = logging.getLogger("SCHEDULER")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Ticket:
+    def __init__(self, user_id: int, cost: float, finish_tag: float, seq: int):
+        self.user_id = user_id
+        self.cost = cost
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.granted = asyncio.get_running_loop().create_future()
+        self.released = False
+
+    def sort_key(self):
+        return self.finish_tag, self.seq
+
+
+class DownloadScheduler:
+    # Взвешенная справедливая очередь: у каждого пользователя своя «виртуальная» очередь,
+    # задача получает метку окончания start + cost, слот достаётся минимальной метке.
+    # Поэтому 20 кликов одного пользователя не блокируют остальных, а MP3/низкие качества дешевле.
+
+    def __init__(self, max_active: int, max_queued: int, max_per_user: int):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self._active = 0
+        self._pending: List[Ticket] = []
+        self._per_user: Dict[int, int] = {}
+        self._user_finish: Dict[int, float] = {}
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def has_capacity(self) -> bool:
+        return self._active < self.max_active and not self._pending
+
+    def submit(self, user_id: int, cost: float) -> Ticket:
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            self.rejected += 1
+            raise QueueFullError("⏳ У вас уже есть загрузки в очереди. Дождитесь их завершения.")
+        if self._active >= self.max_active and len(self._pending) >= self.max_queued:
+            self.rejected += 1
+            raise QueueFullError("⏳ Бот сейчас перегружен. Попробуйте через пару минут.")
+        start = max(self._vtime, self._user_finish.get(user_id, 0.0))
+        ticket = Ticket(user_id, cost, start + cost, next(self._seq))
+        self._user_finish[user_id] = ticket.finish_tag
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._pending.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        if ticket.granted.done():
+            return 0
+        key = ticket.sort_key()
+        return 1 + sum(1 for t in self._pending if t.sort_key() < key)
+
+    async def wait(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.granted), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted.done():
+            self._active -= 1
+        else:
+            self._pending.remove(ticket)
+            ticket.granted.cancel()
+        left = self._per_user.get(ticket.user_id, 1) - 1
+        if left:
+            self._per_user[ticket.user_id] = left
+        else:
+            self._per_user.pop(ticket.user_id, None)
+            if self._user_finish.get(ticket.user_id, 0.0) <= self._vtime:
+                self._user_finish.pop(ticket.user_id, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_active and self._pending:
+            ticket = min(self._pending, key=Ticket.sort_key)
+            self._pending.remove(ticket)
+            self._vtime = max(self._vtime, ticket.finish_tag - ticket.cost)
+            self._active += 1
+            ticket.granted.set_result(True)
+            logger.info(f"Слот выдан пользователю {ticket.user_id} (стоимость {ticket.cost}), "
+                        f"активно {self._active}, в очереди {len(self._pending)}")
+
+
+scheduler = DownloadScheduler(SCHEDULER_MAX_ACTIVE, SCHEDULER_MAX_QUEUED, SCHEDULER_MAX_PER_USER)
@@ -0,0 +1,273 @@
+from typing import Dict, List, Optional, Set
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+
+from config import (
+    SCRATCH_DIR,
+    SCRATCH_QUOTA_MB,
+    SCRATCH_TMPFS_DIR,
+    SCRATCH_TMPFS_QUOTA_MB,
+    SCRATCH_TMPFS_JOB_MAX_MB,
+    SCRATCH_RESERVE_TIMEOUT,
+    SCRATCH_SWEEP_INTERVAL,
+    SCRATCH_ORPHAN_AGE,
+)
+
+
+logger = logging.getLogger("SCRATCH")
+
+MB = 1024 * 1024
+HOSTNAME = socket.gethostname().replace('-', '_')
+
+
+class ScratchQuotaError(Exception):
+    pass
+
+
+class ScratchArea:
+    # Каталог с квотой: задача резервирует ожидаемый объём до начала скачивания
+    def __init__(self, root: str, quota_bytes: int):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.reserved = 0
+        self._changed = asyncio.Condition()
+
+    def _disk_free(self) -> int:
+        # Каталог создаётся при первом резерве, до этого смотрим на ближайший существующий родитель
+        path = self.root
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        try:
+            return shutil.disk_usage(path).free
+        except OSError:
+            return 0
+
+    def fits(self, size: int) -> bool:
+        return self.reserved + size <= self.quota_bytes and size <= self._disk_free()
+
+    async def reserve(self, size: int, timeout: Optional[float]) -> None:
+        if size > self.quota_bytes:
+            raise ScratchQuotaError("❗️ Файл не помещается во временное хранилище бота.")
+        os.makedirs(self.root, exist_ok=True)
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.fits(size)), timeout)
+            except asyncio.TimeoutError:
+                raise ScratchQuotaError("⏳ Временное хранилище бота заполнено. Попробуйте через пару минут.")
+            self.reserved += size
+
+    async def release(self, size: int) -> None:
+        async with self._changed:
+            self.reserved -= size
+            self._changed.notify_all()
+
+
+class ScratchJob:
+    def __init__(self, path: str, area: ScratchArea, reserved: int):
+        self.path = path
+        self.area = area
+        self.reserved = reserved
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+
+def _remove_tree(path: str, attempts: int = 3) -> bool:
+    for _ in range(attempts):
+        try:
+            shutil.rmtree(path)
+            return True
+        except FileNotFoundError:
+            return True
+        except PermissionError:
+            # Файл ещё держит другой процесс (ffmpeg/загрузка)
+            time.sleep(1)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить {path}: {e}")
+            return False
+    logger.warning(f"Каталог не удалён после {attempts} попыток: {path}")
+    return False
+
+
+async def remove_path(path: str) -> None:
+    # Удаление в потоке, но дожидаемся его даже при отмене вызывающей задачи
+    task = asyncio.ensure_future(asyncio.to_thread(
+        _remove_tree if os.path.isdir(path) else _remove_file, path
+    ))
+    try:
+        await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await task
+        raise
+
+
+def _remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Не удалось удалить файл {path}: {e}")
+        return False
+    return True
+
+
+class ScratchStorage:
+    # Каждая задача получает свой каталог <host>-<pid>-<id>: всё, что туда напишут yt-dlp и ffmpeg,
+    # удаляется целиком. Каталоги умерших процессов и забытые дольше orphan_age подчищает уборщик.
+
+    def __init__(self, root: str, quota_bytes: int, tmpfs_root: str = "", tmpfs_quota_bytes: int = 0,
+                 tmpfs_job_max_bytes: int = 0, reserve_timeout: Optional[float] = None, orphan_age: float = 3600):
+        self.disk = ScratchArea(root, quota_bytes)
+        self.tmpfs = ScratchArea(tmpfs_root, tmpfs_quota_bytes) if tmpfs_root and tmpfs_quota_bytes else None
+        self.tmpfs_job_max_bytes = tmpfs_job_max_bytes
+        self.reserve_timeout = reserve_timeout
+        self.orphan_age = orphan_age
+        self._active: Dict[str, ScratchJob] = {}
+        self._kept: Set[str] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.swept = 0
+
+    def _areas(self) -> List[ScratchArea]:
+        return [area for area in (self.disk, self.tmpfs) if area is not None]
+
+    def _pick_area(self, size: int) -> ScratchArea:
+        if self.tmpfs is not None and 0 < size <= self.tmpfs_job_max_bytes and self.tmpfs.fits(size):
+            return self.tmpfs
+        return self.disk
+
+    def fits(self, size: int) -> bool:
+        return self._pick_area(size).fits(size)
+
+    def _existing_area(self, name: str) -> Optional[ScratchArea]:
+        for area in self._areas():
+            if os.path.isdir(os.path.join(area.root, name)):
+                return area
+        return None
+
+    @contextlib.asynccontextmanager
+    async def job(self, size: int, tag: str = "job", name: Optional[str] = None):
+        # name — постоянный каталог задачи из журнала: после перезапуска берётся тот же каталог
+        # с недокачанными файлами, а при отмене задачи он не удаляется
+        area = (self._existing_area(name) if name else None) or self._pick_area(size)
+        await area.reserve(size, self.reserve_timeout)
+        path = os.path.join(area.root, name or f"{HOSTNAME}-{os.getpid()}-{uuid.uuid4().hex[:12]}-{tag}")
+        job = ScratchJob(path, area, size)
+        # Регистрируем до создания, чтобы уборщик в другом потоке не принял каталог за сироту
+        self._active[path] = job
+        kept = False
+        try:
+            os.makedirs(path, exist_ok=name is not None)
+            yield job
+        except asyncio.CancelledError:
+            kept = name is not None
+            raise
+        finally:
+            self._active.pop(path, None)
+            try:
+                if kept:
+                    self._kept.add(name)
+                else:
+                    self._kept.discard(name)
+                    await remove_path(path)
+            finally:
+                await area.release(size)
+
+    def keep(self, name: str) -> None:
+        # Каталог задачи, которую продолжат позже: уборщик его не трогает
+        self._kept.add(name)
+
+    async def discard(self, name: str) -> None:
+        self._kept.discard(name)
+        for area in self._areas():
+            path = os.path.join(area.root, name)
+            if os.path.exists(path):
+                await remove_path(path)
+
+    def _is_orphan(self, name: str, full_path: str, now: float) -> bool:
+        if full_path in self._active or name in self._kept:
+            return False
+        try:
+            age = now - os.path.getmtime(full_path)
+        except OSError:
+            return False
+        if age > self.orphan_age:
+            return True
+        parts = name.split('-')
+        if len(parts) < 3 or parts[0] != HOSTNAME or not parts[1].isdigit():
+            return False
+        pid = int(parts[1])
+        if pid == os.getpid():
+            # Свой каталог вне активных — задача уже завершилась, а удаление не удалось
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    def _sweep_sync(self) -> int:
+        removed = 0
+        now = time.time()
+        for area in self._areas():
+            os.makedirs(area.root, exist_ok=True)
+            for name in os.listdir(area.root):
+                full_path = os.path.join(area.root, name)
+                if self._is_orphan(name, full_path, now):
+                    if (_remove_tree if os.path.isdir(full_path) else _remove_file)(full_path):
+                        removed += 1
+        return removed
+
+    async def sweep(self) -> int:
+        removed = await asyncio.to_thread(self._sweep_sync)
+        if removed:
+            self.swept += removed
+            logger.info(f"Удалено осиротевших временных файлов: {removed}")
+        return removed
+
+    async def _sweep_forever(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка уборки временных файлов: {e}")
+
+    async def start(self, interval: float = SCRATCH_SWEEP_INTERVAL) -> None:
+        await self.sweep()
+        if self._sweeper is None and interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_forever(interval))
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweeper
+            self._sweeper = None
+
+    def stats(self) -> Dict:
+        return {
+            'active_jobs': len(self._active),
+            'reserved_bytes': sum(area.reserved for area in self._areas()),
+            'tmpfs_reserved_bytes': self.tmpfs.reserved if self.tmpfs else 0,
+            'swept': self.swept,
+        }
+
+
+scratch = ScratchStorage(
+    SCRATCH_DIR,
+    SCRATCH_QUOTA_MB * MB,
+    SCRATCH_TMPFS_DIR,
+    SCRATCH_TMPFS_QUOTA_MB * MB,
+    SCRATCH_TMPFS_JOB_MAX_MB * MB,
+    SCRATCH_RESERVE_TIMEOUT,
+    SCRATCH_ORPHAN_AGE,
+)
@@ -0,0 +1,268 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    DeleteMessage,
+    EditMessageCaption,
+    EditMessageText,
+    SendAudio,
+    SendDocument,
+    SendMediaGroup,
+    SendVideo,
+)
+
+from config import (
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SEND_GROUP_RATE_PER_MIN,
+    SEND_MAX_RETRIES,
+)
+
+
+logger = logging.getLogger("SEND_QUEUE")
+
+# Чем меньше, тем раньше: готовые файлы важнее карточек, карточки важнее статусов
+PRIORITY_FILE = 0
+PRIORITY_MESSAGE = 1
+PRIORITY_STATUS = 2
+
+FILE_METHODS = (SendVideo, SendAudio, SendDocument, SendMediaGroup)
+STATUS_METHODS = (EditMessageText, EditMessageCaption, DeleteMessage)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class _Request:
+    def __init__(self, make_request, bot, method, chat_id, priority: int, seq: int):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.attempts = 0
+        self.waiters = 1
+        self.result = asyncio.get_running_loop().create_future()
+
+    def sort_key(self) -> Tuple[int, int]:
+        return self.priority, self.seq
+
+
+def _status_key(method) -> Optional[Tuple]:
+    # Склеиваются только запросы одного типа: у правки и удаления разные результаты (Message и bool)
+    if isinstance(method, STATUS_METHODS) and getattr(method, 'message_id', None):
+        return type(method), method.chat_id, method.message_id
+    return None
+
+
+class SendQueue(BaseRequestMiddleware):
+    # Middleware сессии aiogram: все исходящие запросы с chat_id проходят через общую очередь.
+    # Глобальное и початовое ведро токенов держат бота в лимитах Telegram, 429 ставит чат на паузу
+    # на retry_after и возвращает запрос в очередь, правки одного статуса склеиваются в одну.
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, group_rate: float,
+                 max_retries: int):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chats: Dict = {}
+        self._pending: List[_Request] = []
+        self._status: Dict[Tuple, _Request] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict:
+        by_priority = {'file': 0, 'message': 0, 'status': 0}
+        names = {PRIORITY_FILE: 'file', PRIORITY_MESSAGE: 'message', PRIORITY_STATUS: 'status'}
+        for request in self._pending:
+            by_priority[names[request.priority]] += 1
+        return {
+            'depth': self.depth,
+            'pending': by_priority,
+            'in_flight': self.in_flight,
+            'sent': self.sent,
+            'merged': self.merged,
+            'retried': self.retried,
+        }
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                now = time.monotonic()
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle(now)}
+            # В группах Telegram пускает около 20 сообщений в минуту
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _merge(self, method) -> Optional[_Request]:
+        key = _status_key(method)
+        if key is None:
+            return None
+        queued = self._status.get(key)
+        if queued is None or queued not in self._pending:
+            return None
+        # Новая правка заменяет старую, повторное удаление присоединяется к первому
+        queued.method = method
+        queued.waiters += 1
+        self.merged += 1
+        return queued
+
+    def _enqueue(self, make_request, bot, method, chat_id) -> _Request:
+        if isinstance(method, FILE_METHODS):
+            priority = PRIORITY_FILE
+        elif isinstance(method, STATUS_METHODS):
+            priority = PRIORITY_STATUS
+        else:
+            priority = PRIORITY_MESSAGE
+        request = _Request(make_request, bot, method, chat_id, priority, next(self._seq))
+        key = _status_key(method)
+        if key is not None:
+            self._status[key] = request
+        self._pending.append(request)
+        return request
+
+    def _wake(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery и служебные методы не ограничены по чатам
+            return await make_request(bot, method)
+        request = self._merge(method) or self._enqueue(make_request, bot, method, chat_id)
+        self._wake()
+        try:
+            return await asyncio.shield(request.result)
+        except asyncio.CancelledError:
+            request.waiters -= 1
+            if request.waiters == 0 and request in self._pending:
+                self._remove(request)
+                request.result.cancel()
+            raise
+
+    def _remove(self, request: _Request) -> None:
+        self._pending.remove(request)
+        key = _status_key(request.method)
+        if key is not None and self._status.get(key) is request:
+            del self._status[key]
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = None
+            for request in sorted(self._pending, key=_Request.sort_key):
+                chat_bucket = self._chat_bucket(request.chat_id)
+                delay = max(self.global_bucket.delay(now), chat_bucket.delay(now))
+                if delay <= 0:
+                    self.global_bucket.take()
+                    chat_bucket.take()
+                    self._remove(request)
+                    asyncio.create_task(self._execute(request))
+                    wait = 0
+                    break
+                wait = delay if wait is None else min(wait, delay)
+            if wait == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, request: _Request) -> None:
+        self.in_flight += 1
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            request.attempts += 1
+            self._chat_bucket(request.chat_id).pause(e.retry_after)
+            if request.result.done():
+                return
+            if request.attempts > self.max_retries:
+                logger.error(f"Флуд-контроль: {type(request.method).__name__} в чат {request.chat_id} не отправлен")
+                request.result.set_exception(e)
+                return
+            self.retried += 1
+            logger.warning(f"Флуд-контроль в чате {request.chat_id}: пауза {e.retry_after} c, повтор")
+            # Запрос сохраняет своё место в очереди (seq прежний)
+            self._pending.append(request)
+            key = _status_key(request.method)
+            if key is not None:
+                self._status.setdefault(key, request)
+            self._wake()
+        except Exception as e:
+            if not request.result.done():
+                request.result.set_exception(e)
+        else:
+            self.sent += 1
+            if not request.result.done():
+                request.result.set_result(result)
+        finally:
+            self.in_flight -= 1
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+
+send_queue = SendQueue(
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SEND_GROUP_RATE_PER_MIN / 60,
+    SEND_MAX_RETRIES,
+)
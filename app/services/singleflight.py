@@ -0,0 +1,57 @@
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+import asyncio
+import logging
+
+
+logger = logging.getLogger("SINGLEFLIGHT")
+
+T = TypeVar('T')
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def has(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"[{self.name}] Присоединяемся к уже идущей задаче {key}")
+        flight.waiters += 1
+        try:
+            # shield: отмена одного ожидающего не должна ронять общую задачу для остальных
+            return await asyncio.shield(flight.task), leader
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                logger.info(f"[{self.name}] Все ожидающие ушли, отменяем задачу {key}")
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled() and flight.task.exception() is not None and flight.waiters == 0:
+            logger.warning(f"[{self.name}] Задача {key} завершилась ошибкой без ожидающих: {flight.task.exception()}")
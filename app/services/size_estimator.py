@@ -0,0 +1,97 @@
+from typing import Dict, Optional, Tuple
+
+from config import TELEGRAM_UPLOAD_LIMIT_MB, TELEGRAM_VIDEO_LIMIT_MB
+
+
+EXACT = 'exact'
+APPROX = 'approx'
+BITRATE = 'bitrate'
+UNKNOWN = 'unknown'
+
+# От самой надёжной оценки к самой грубой
+CONFIDENCE_ORDER = [EXACT, APPROX, BITRATE, UNKNOWN]
+
+# Запас на контейнер mp4 при склейке
+MUX_OVERHEAD = 1.01
+MP3_BITRATE_KBPS = 192
+
+UPLOAD_LIMIT = TELEGRAM_UPLOAD_LIMIT_MB * 1024 * 1024
+VIDEO_LIMIT = TELEGRAM_VIDEO_LIMIT_MB * 1024 * 1024
+
+
+def _worst(*levels: str) -> str:
+    return max(levels, key=CONFIDENCE_ORDER.index)
+
+
+def estimate_format_size(fmt: Optional[Dict], duration: Optional[float]) -> Tuple[int, str]:
+    if not fmt:
+        return 0, EXACT
+    if fmt.get('filesize'):
+        return int(fmt['filesize']), EXACT
+    if fmt.get('filesize_approx'):
+        return int(fmt['filesize_approx']), APPROX
+    tbr = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration), BITRATE
+    return 0, UNKNOWN
+
+
+def estimate_selection_size(selection: Dict, duration: Optional[float]) -> Tuple[int, str]:
+    video_size, video_conf = estimate_format_size(selection.get('video'), duration)
+    audio_size, audio_conf = estimate_format_size(selection.get('audio'), duration)
+    confidence = _worst(video_conf, audio_conf)
+    if confidence == UNKNOWN:
+        return 0, UNKNOWN
+    return int((video_size + audio_size) * MUX_OVERHEAD), confidence
+
+
+def estimate_mp3_size(duration: Optional[float]) -> Tuple[int, str]:
+    if not duration:
+        return 0, UNKNOWN
+    return int(MP3_BITRATE_KBPS * 1000 / 8 * duration), BITRATE
+
+
+def exceeds_limit(size: int, confidence: str, limit: int = UPLOAD_LIMIT) -> bool:
+    # Оценку по битрейту считаем грубой и отказываем только с запасом
+    if confidence in (EXACT, APPROX):
+        return size > limit
+    if confidence == BITRATE:
+        return size * 0.8 > limit
+    return False
+
+
+def delivery_kind(size: int, confidence: str) -> str:
+    if confidence != UNKNOWN and size > VIDEO_LIMIT:
+        return 'document'
+    return 'video'
+
+
+def format_size_label(size: int, confidence: str) -> str:
+    if confidence == UNKNOWN or not size:
+        return "?MB"
+    mb = max(1, round(size / (1024 * 1024)))
+    return f"{mb}MB" if confidence == EXACT else f"~{mb}MB"
+
+
+def estimate_spec_size(info: Dict, format_spec: str) -> Tuple[int, str]:
+    formats = {f.get('format_id'): f for f in info.get('formats', [])}
+    parts = [formats.get(format_id) for format_id in format_spec.split('+')]
+    # Пропавшая часть склейки — размер неизвестен, а не «точно равен видео без звука»
+    if any(fmt is None for fmt in parts):
+        return 0, UNKNOWN
+    video, audio = parts[0], parts[1] if len(parts) > 1 else None
+    return estimate_selection_size({'video': video, 'audio': audio}, info.get('duration'))
+
+
+def estimate_audio_size(info: Dict, quality: str) -> Tuple[int, str]:
+    duration = info.get('duration')
+    if quality == 'mp3':
+        return estimate_mp3_size(duration)
+    audio = [
+        f for f in info.get('formats', [])
+        if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')
+    ]
+    m4a = [f for f in audio if f.get('ext') == 'm4a'] or audio
+    if not m4a:
+        return 0, UNKNOWN
+    return estimate_format_size(max(m4a, key=lambda f: f.get('abr') or f.get('tbr') or 0), duration)
@@ -0,0 +1,101 @@
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import re
+
+
+# Разбор ссылок без yt-dlp: сообщение без ссылки на ролик отклоняется сразу, а не после
+# многосекундного extract_info. Канонический id — ключ для дедупликации и кэшей.
+
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+# PL…, OLAK5uy_… (альбомы YouTube Music), RD… (миксы); длиннее не влезет в callback_data
+PLAYLIST_ID_RE = re.compile(r'[A-Za-z0-9_-]{10,50}')
+
+# Кандидаты в тексте: со схемой и без, с любыми поддоменами (www, m, music);
+# ссылка не может начинаться посреди другого адреса (evil.com/youtube.com/..., notyoutube.com)
+URL_RE = re.compile(
+    r'(?<![\w./@-])(?:https?://)?(?:[a-z0-9-]+\.)*(?:youtube\.com|youtube-nocookie\.com|youtu\.be)(?:/[^\s<>"\']*)?',
+    re.IGNORECASE,
+)
+
+YOUTUBE_HOSTS = ('youtube.com', 'youtube-nocookie.com')
+YOUTUBE_SUBDOMAINS = tuple('.' + host for host in YOUTUBE_HOSTS)
+SHORT_HOST = 'youtu.be'
+# /shorts/<id>, /embed/<id>, /live/<id>, /v/<id>, /e/<id>
+PATH_PREFIXES = ('shorts', 'embed', 'live', 'v', 'e')
+
+
+def _valid_id(value: Optional[str]) -> Optional[str]:
+    if value and len(value) == 11 and VIDEO_ID_RE.fullmatch(value):
+        return value
+    return None
+
+
+def _host(netloc: str) -> str:
+    host = netloc.rsplit('@', 1)[-1].split(':', 1)[0].lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def _split(url: str) -> Optional[Tuple[str, List[str], str]]:
+    if '://' not in url:
+        url = 'https://' + url
+    try:
+        parts = urlsplit(url.strip().rstrip('.,;:!?)»'))
+    except ValueError:
+        return None
+    return _host(parts.netloc), [s for s in parts.path.split('/') if s], parts.query
+
+
+def parse_video_id(url: str) -> Optional[str]:
+    split = _split(url)
+    if split is None:
+        return None
+    host, segments, query = split
+    if host == SHORT_HOST:
+        return _valid_id(segments[0]) if segments else None
+    if not (host in YOUTUBE_HOSTS or host.endswith(YOUTUBE_SUBDOMAINS)):
+        return None
+    if not segments or segments[0] == 'watch':
+        # /watch?v=<id>&t=42s, а также /?v=<id> у старых ссылок
+        return _valid_id(parse_qs(query).get('v', [None])[0])
+    if len(segments) >= 2 and segments[0] in PATH_PREFIXES:
+        return _valid_id(segments[1])
+    return None
+
+
+def parse_playlist_id(url: str) -> Optional[str]:
+    # Ссылка на сам плейлист или альбом; у ролика из плейлиста (watch?v=...&list=...) главный ролик
+    split = _split(url)
+    if split is None or parse_video_id(url):
+        return None
+    host, segments, query = split
+    if not (host in YOUTUBE_HOSTS or host.endswith(YOUTUBE_SUBDOMAINS)):
+        return None
+    if segments and segments[0] not in ('playlist', 'watch'):
+        return None
+    value = parse_qs(query).get('list', [None])[0]
+    return value if value and PLAYLIST_ID_RE.fullmatch(value) else None
+
+
+def _extract(text: Optional[str], parse: Callable[[str], Optional[str]], limit: Optional[int]) -> List[str]:
+    ids: List[str] = []
+    for match in URL_RE.finditer(text or ''):
+        value = parse(match.group(0))
+        if value and value not in ids:
+            ids.append(value)
+            if limit and len(ids) >= limit:
+                break
+    return ids
+
+
+def has_youtube_link(text: Optional[str]) -> bool:
+    # Фильтр хендлера: те же хосты, что понимает разбор (youtube-nocookie.com, YOUTU.BE и т. п.)
+    return bool(text) and URL_RE.search(text) is not None
+
+
+def extract_video_ids(text: Optional[str], limit: Optional[int] = None) -> List[str]:
+    # Id в порядке появления, без повторов; каналы, плейлисты без v= и битые ссылки пропускаются
+    return _extract(text, parse_video_id, limit)
+
+
+def extract_playlist_ids(text: Optional[str], limit: Optional[int] = None) -> List[str]:
+    return _extract(text, parse_playlist_id, limit)
@@ -0,0 +1,143 @@
+from typing import Callable, Dict, List, Optional
+import contextlib
+import json
+import logging
+import threading
+
+
+logger = logging.getLogger("YDL_POOL")
+
+# Хуки задачи подключаются через постоянные хуки экземпляра (_Entry), всё остальное — формат, шаблон
+# имени, cookies, заголовки — задаёт профиль. Экземпляр переиспользуется только при точном совпадении
+# профиля: менять параметры уже созданного YoutubeDL можно лишь через его приватные поля
+PER_JOB_OPTIONS = ('progress_hooks', 'postprocessor_hooks')
+
+
+def profile_key(ydl_opts: Dict) -> str:
+    options = {k: v for k, v in ydl_opts.items() if k not in PER_JOB_OPTIONS}
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+class _Entry:
+    # Хуки экземпляра регистрируются один раз при создании и передают события хукам текущей задачи
+    def __init__(self, key: str):
+        self.key = key
+        self.ydl = None
+        self.uses = 0
+        self.progress_hooks: List[Callable] = []
+        self.postprocessor_hooks: List[Callable] = []
+
+    def on_progress(self, d: Dict) -> None:
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def on_postprocessor(self, d: Dict) -> None:
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+
+class YoutubeDLPool:
+    # Создание YoutubeDL загружает экстракторы, читает cookies.txt и строит HTTP-обработчики;
+    # экземпляр из пула держит всё это (и открытые соединения) между задачами.
+    # Экземпляр выдаётся одной задаче за раз: YoutubeDL не рассчитан на параллельное использование.
+
+    def __init__(self, factory: Callable[[Dict], object], max_idle: int, max_uses: int):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._idle: Dict[str, List[_Entry]] = {}
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _create(self, key: str, ydl_opts: Dict) -> _Entry:
+        entry = _Entry(key)
+        params = {k: v for k, v in ydl_opts.items() if k not in PER_JOB_OPTIONS}
+        params['progress_hooks'] = [entry.on_progress]
+        params['postprocessor_hooks'] = [entry.on_postprocessor]
+        entry.ydl = self.factory(params)
+        with self._lock:
+            self.created += 1
+        return entry
+
+    def _take(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            idle = self._idle.get(key)
+            entry = idle.pop() if idle else None
+            self.busy += 1
+            if entry is not None:
+                self.reused += 1
+            return entry
+
+    def _prepare(self, entry: _Entry, ydl_opts: Dict) -> None:
+        entry.progress_hooks = list(ydl_opts.get('progress_hooks', []))
+        entry.postprocessor_hooks = list(ydl_opts.get('postprocessor_hooks', []))
+
+    def _close(self, entry: _Entry) -> None:
+        try:
+            entry.ydl.close()
+        except Exception as e:
+            logger.warning(f"Не удалось закрыть YoutubeDL: {e}")
+
+    def _release(self, entry: _Entry, healthy: bool, keep: bool) -> None:
+        entry.uses += 1
+        entry.progress_hooks = []
+        entry.postprocessor_hooks = []
+        keep = keep and healthy and entry.uses < self.max_uses
+        with self._lock:
+            self.busy -= 1
+            idle = self._idle.setdefault(entry.key, [])
+            if keep and len(idle) < self.max_idle:
+                idle.append(entry)
+                return
+            if not idle:
+                del self._idle[entry.key]
+            self.discarded += 1
+        self._close(entry)
+
+    @contextlib.contextmanager
+    def acquire(self, ydl_opts: Dict, keep: bool = True):
+        # keep=False — профиль одноразовый (свой outtmpl у каждой загрузки), экземпляр после задачи закрываем
+        key = profile_key(ydl_opts)
+        entry = self._take(key)
+        try:
+            if entry is None:
+                entry = self._create(key, ydl_opts)
+            self._prepare(entry, ydl_opts)
+        except BaseException:
+            with self._lock:
+                self.busy -= 1
+            if entry is not None:
+                self._close(entry)
+            raise
+        healthy = False
+        try:
+            yield entry.ydl
+            healthy = True
+        finally:
+            # После ошибки или отмены состояние экземпляра не гарантировано — его закрываем
+            self._release(entry, healthy, keep)
+
+    def warm_up(self, ydl_opts: Dict) -> None:
+        with self.acquire(ydl_opts):
+            pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'idle': sum(len(v) for v in self._idle.values()),
+                'busy': self.busy,
+                'profiles': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            entries = [e for idle in self._idle.values() for e in idle]
+            self._idle.clear()
+        for entry in entries:
+            self._close(entry)
@@ -1,39 +1,446 @@
 from typing import Dict, Optional, List
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import contextvars
+import copy
+import functools
 import logging
+import multiprocessing
 import os
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
 
-import yt_dlp
+from config import (
+    YTDLP_EXECUTOR,
+    YTDLP_POOL_IDLE,
+    YTDLP_POOL_MAX_USES,
+    YTDLP_EXTRACT_WORKERS,
+    YTDLP_DOWNLOAD_WORKERS,
+    YTDLP_EXTRACT_TIMEOUT,
+    YTDLP_DOWNLOAD_TIMEOUT,
+    WORKER_POLL_INTERVAL,
+    AUDIO_MP3_MODE,
+    DOWNLOAD_SMALL_MB,
+    DOWNLOAD_LARGE_MB,
+    DOWNLOAD_FRAGMENTS,
+    DOWNLOAD_FRAGMENTS_LARGE,
+    DOWNLOAD_CHUNK_MB,
+    DOWNLOAD_THROTTLED_RATE_KB,
+    BATCH_MAX_ITEMS,
+)
+from app.services.identities import identities, DEFAULT_HEADERS
+from app.services.info_cache import info_cache
+from app.services.metrics import timed, stage_seconds, errors_total, downloaded_bytes
+from app.services.singleflight import SingleFlight
+from app.services.size_estimator import estimate_selection_size
+from app.services.ydl_pool import YoutubeDLPool
 
 
 logger = logging.getLogger("YOUTUBE")
 
+MB = 1024 * 1024
+
+# Профили скачивания: мелким файлам параллельность не нужна, крупным — больше фрагментов
+DOWNLOAD_PROFILES = {
+    'small': {
+        'concurrent_fragment_downloads': 1,
+        'retries': 3,
+        'fragment_retries': 3,
+    },
+    'default': {
+        'concurrent_fragment_downloads': DOWNLOAD_FRAGMENTS,
+        'http_chunk_size': DOWNLOAD_CHUNK_MB * MB,
+        'throttledratelimit': DOWNLOAD_THROTTLED_RATE_KB * 1024,
+        'retries': 5,
+        'fragment_retries': 5,
+    },
+    'large': {
+        'concurrent_fragment_downloads': DOWNLOAD_FRAGMENTS_LARGE,
+        'http_chunk_size': DOWNLOAD_CHUNK_MB * MB,
+        'throttledratelimit': DOWNLOAD_THROTTLED_RATE_KB * 1024,
+        'retries': 10,
+        'fragment_retries': 10,
+    },
+}
+
+EXTRACT_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+}
+
+# Плейлист без извлечения каждого ролика: только id, названия и длительности
+PLAYLIST_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': 'in_playlist',
+    'playlistend': BATCH_MAX_ITEMS,
+}
+
+# Так в плоском списке помечены ролики, которые скачать нельзя
+UNAVAILABLE_TITLES = ('[Private video]', '[Deleted video]')
+
+_executors: Dict[str, Executor] = {}
+# Одновременные запросы одного ролика (по каноническому id) ждут одно извлечение
+_extractions = SingleFlight("extract")
+_manager = None
+_job_queue = None
+
+# yt-dlp импортируется при первом обращении: бот начинает отвечать раньше, чем загрузятся экстракторы
+yt_dlp = None
+
+
+def _yt_dlp():
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+        yt_dlp = module
+    return yt_dlp
+
+
+# Свой пул в каждом процессе: в режимах process/queue экземпляры живут в процессах-исполнителях
+_ydl_pool = YoutubeDLPool(lambda params: _yt_dlp().YoutubeDL(params), YTDLP_POOL_IDLE, YTDLP_POOL_MAX_USES)
+
+
+def _get_executor(kind: str) -> Executor:
+    executor = _executors.get(kind)
+    if executor is None:
+        workers = YTDLP_EXTRACT_WORKERS if kind == 'extract' else YTDLP_DOWNLOAD_WORKERS
+        if YTDLP_EXECUTOR == 'process':
+            executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"ytdlp-{kind}")
+        _executors[kind] = executor
+        logger.info(f"Создан исполнитель {YTDLP_EXECUTOR} для '{kind}' на {workers} воркеров")
+    return executor
+
+
+def _new_cancel_event():
+    # Событие должно пересекать границу процесса в режиме process
+    global _manager
+    if YTDLP_EXECUTOR == 'process':
+        if _manager is None:
+            _manager = multiprocessing.Manager()
+        return _manager.Event()
+    return threading.Event()
+
+
+async def _run_blocking(kind: str, func, *args, timeout: Optional[float] = None, cancel_event=None):
+    loop = asyncio.get_running_loop()
+    executor = _get_executor(kind)
+    if isinstance(executor, ThreadPoolExecutor):
+        # trace_id из contextvars попадает и в логи, написанные в потоке
+        func = functools.partial(contextvars.copy_context().run, func)
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        # Хендлер отменён или завис — просим yt-dlp прерваться на ближайшем хуке
+        if cancel_event is not None:
+            cancel_event.set()
+        raise
+
+
+async def _run_queued(url: str, ydl_opts: Dict, info: Optional[Dict], timeout: Optional[float] = None) -> Optional[Dict]:
+    # Режим queue: скачивают отдельные процессы-воркеры (python worker.py), бот только ждёт результат
+    global _job_queue
+    from app.workers.job_queue import open_job_queue, DONE, FAILED, CANCELLED
+
+    if _job_queue is None:
+        _job_queue = open_job_queue()
+
+    async def wait_job(job_id: int) -> Optional[Dict]:
+        while True:
+            state, result, error = _job_queue.status(job_id)
+            if state == DONE:
+                return result
+            if state in (FAILED, CANCELLED):
+                raise RuntimeError(error or f"Задача {job_id}: {state}")
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+
+    job_id = _job_queue.put('download', {'url': url, 'opts': ydl_opts, 'info': info})
+    logger.info(f"Задача {job_id} поставлена в очередь воркеров: {url}")
+    try:
+        return await asyncio.wait_for(wait_job(job_id), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        _job_queue.cancel(job_id)
+        raise
+
+
+async def _run_download(url: str, ydl_opts: Dict, info: Optional[Dict], kind: str = 'video') -> Optional[str]:
+    started = time.monotonic()
+    try:
+        with identities.use() as identity:
+            ydl_opts = dict(ydl_opts, **identity.options)
+            if YTDLP_EXECUTOR == 'queue':
+                result = await _run_queued(url, ydl_opts, info, timeout=YTDLP_DOWNLOAD_TIMEOUT)
+            else:
+                cancel_event = _new_cancel_event()
+                result = await _run_blocking('download', _download_sync, url, ydl_opts, cancel_event, info,
+                                             timeout=YTDLP_DOWNLOAD_TIMEOUT, cancel_event=cancel_event)
+            result = result or {}
+            if result.get('throttled'):
+                identities.throttled(identity, started)
+    except Exception as e:
+        errors_total.inc(stage='download', type=type(e).__name__)
+        raise
+    # Склейку/извлечение аудио ffmpeg считаем отдельно от сетевой части
+    postprocess = result.get('postprocess_seconds', 0)
+    network = time.monotonic() - started - postprocess
+    stage_seconds.observe(network, stage='download')
+    if postprocess:
+        stage_seconds.observe(postprocess, stage='postprocess')
+    downloaded_bytes.inc(result.get('downloaded_bytes', 0), kind=kind)
+    identity.transferred(result.get('downloaded_bytes', 0), network)
+    return result.get('filepath')
+
+
+def _extract_info_sync(url: str, ydl_opts: Dict) -> Optional[Dict]:
+    with _ydl_pool.acquire(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        if not isinstance(info, dict):
+            logger.error(f"yt-dlp вернул не dict: {type(info)}")
+            return None
+        # Полный info сохраняется в кэш и потом отдаётся в process_ie_result без повторного извлечения
+        return ydl.sanitize_info(info)
+
+
+def _extract_playlist_sync(url: str, ydl_opts: Dict) -> Optional[Dict]:
+    with _ydl_pool.acquire(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if not isinstance(info, dict):
+        return None
+    entries = []
+    for entry in info.get('entries') or []:
+        if not isinstance(entry, dict) or not entry.get('id') or entry.get('title') in UNAVAILABLE_TITLES:
+            continue
+        entries.append({'id': entry['id'], 'title': entry.get('title'), 'duration': entry.get('duration')})
+    return {
+        'id': info.get('id'),
+        'title': info.get('title') or 'YouTube Playlist',
+        'uploader': info.get('uploader') or info.get('channel'),
+        'entries': entries,
+    }
+
+
+def _summarize_info(info: Dict) -> Dict:
+    return {
+        'id': info.get('id'),
+        'title': info.get('title', 'YouTube Video'),
+        'duration': info.get('duration', 0),
+        'thumbnail': info.get('thumbnail'),
+        'webpage_url': info.get('webpage_url'),
+        'uploader': info.get('uploader'),
+        'uploader_url': info.get('uploader_url'),
+        'channel_url': info.get('channel_url'),
+        'formats': info.get('formats', [])
+    }
+
+
+# Чем меньше ранг, тем лучше: avc1/mp4a копируются в mp4 без перекодирования и играют везде
+VIDEO_CODEC_RANK = {'avc1': 0, 'av01': 1, 'vp09': 2, 'vp9': 2}
+MP4_COMPATIBLE_AUDIO = ('mp4a',)
+
+
+def _codec(fmt: Dict, key: str) -> str:
+    return (fmt.get(key) or 'none').split('.')[0]
+
+
+def _is_http(fmt: Dict) -> bool:
+    return (fmt.get('protocol') or 'https').startswith('http')
+
+
+def _pick_audio(audio: List[Dict], mp4_only: bool) -> Optional[Dict]:
+    candidates = [a for a in audio if not mp4_only or _codec(a, 'acodec') in MP4_COMPATIBLE_AUDIO]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda a: (_is_http(a), a.get('abr') or a.get('tbr') or 0))
+
+
+def _candidate_rank(video: Dict, audio: Optional[Dict], progressive: bool):
+    vcodec = _codec(video, 'vcodec')
+    copyable = progressive or (
+        video.get('ext') == 'mp4' and audio is not None and audio.get('ext') == 'm4a'
+    )
+    if progressive and video.get('ext') == 'mp4':
+        tier = 0
+    elif copyable and vcodec == 'avc1':
+        tier = 1
+    elif copyable:
+        tier = 2
+    else:
+        tier = 3
+    fps = video.get('fps') or 30
+    return (
+        tier,
+        not _is_http(video),
+        VIDEO_CODEC_RANK.get(vcodec, 9),
+        fps > 30,
+        -(video.get('tbr') or 0),
+    )
+
+
+def _best_audio_format(formats: List[Dict]) -> Optional[Dict]:
+    candidates = [
+        f for f in formats
+        if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none') and f.get('url')
+        and (f.get('protocol') or 'https').startswith('http')
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: (f.get('ext') == 'm4a', f.get('abr') or f.get('tbr') or 0))
+
+
+def _ffmpeg_cookies(cookies: Optional[str]) -> str:
+    # fmt['cookies'] от yt-dlp — «name=value; Domain=...; Path=...» подряд для всех cookies,
+    # ffmpeg ждёт по строке на cookie в формате Set-Cookie, и без domain он cookie не отправит
+    parsed = []
+    for part in (cookies or '').split('; '):
+        name, _, value = part.partition('=')
+        attribute = name.lower()
+        if attribute in ('domain', 'path') and parsed:
+            parsed[-1][attribute] = value
+        elif attribute not in ('secure', 'expires', 'version') and name:
+            parsed.append({'cookie': part, 'path': '/'})
+    return ''.join(
+        f"{c['cookie']}; path={c['path']}; domain={c['domain']};\r\n" for c in parsed if c.get('domain')
+    )
+
+
+def _urls_ttl(info: Dict) -> Optional[float]:
+    # Подписанные ссылки YouTube содержат ?expire=<unix time>
+    expires = []
+    for f in info.get('formats', []):
+        expire = parse_qs(urlparse(f.get('url') or '').query).get('expire')
+        if expire and expire[0].isdigit():
+            expires.append(int(expire[0]))
+    if not expires:
+        return None
+    return min(expires) - time.time() - 600
+
+
+def _download_sync(url: str, ydl_opts: Dict, cancel_event, info: Optional[Dict] = None) -> Dict:
+    final_path = []
+    stats = {'downloaded_bytes': 0, 'postprocess_seconds': 0.0, 'throttled': False}
+    pp_started = {}
+
+    def check_cancel(d):
+        if cancel_event.is_set():
+            raise _yt_dlp().utils.DownloadCancelled("Загрузка отменена")
+        if d.get('status') == 'finished':
+            stats['downloaded_bytes'] += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+
+    def track_path(d):
+        if cancel_event.is_set():
+            raise _yt_dlp().utils.DownloadCancelled("Загрузка отменена")
+        if d.get('status') == 'started':
+            pp_started[d.get('postprocessor')] = time.perf_counter()
+        elif d.get('status') == 'finished':
+            started = pp_started.pop(d.get('postprocessor'), None)
+            if started is not None:
+                stats['postprocess_seconds'] += time.perf_counter() - started
+            # Последний завершившийся постпроцессор (MoveFiles) знает итоговое имя файла
+            if d.get('info_dict', {}).get('filepath'):
+                final_path.append(d['info_dict']['filepath'])
+
+    def result() -> Dict:
+        return dict(stats, filepath=final_path[-1] if final_path else None)
+
+    ydl_opts = dict(ydl_opts, progress_hooks=[check_cancel], postprocessor_hooks=[track_path])
+    with _ydl_pool.acquire(ydl_opts, keep=False) as ydl:
+        if info is None:
+            ydl.download([url])
+            return result()
+        try:
+            # yt-dlp мутирует info при выборе форматов, а кэшированный объект общий
+            ydl.process_ie_result(copy.deepcopy(info), download=True)
+        except _yt_dlp().utils.ReExtractInfo as e:
+            # Скорость ниже throttledratelimit: ссылки из кэша урезаны, download() извлечёт новые
+            logger.warning(f"{e}: повторно извлекаем информацию о видео {url}")
+            stats['throttled'] = True
+            ydl.download([url])
+    return result()
+
+
+def _warm_up_sync(ydl_opts: Dict) -> None:
+    _ydl_pool.warm_up(ydl_opts)
+
+
+def _settle_output(path: Optional[str], output_path: str) -> None:
+    # yt-dlp сам выбирает расширение (.webm/.m4a/.mp3.mp3), итог переносим на ожидаемое имя
+    if path and path != output_path and os.path.exists(path):
+        os.replace(path, output_path)
+
+
 class YouTubeService:
+    @staticmethod
+    def canonical_url(video_id: str) -> str:
+        return f"https://www.youtube.com/watch?v={video_id}"
+
     @staticmethod
     async def get_video_info(url: str) -> Optional[Dict]:
         logger.info(f"Получаем информацию о видео с YouTube: {url}")
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'cookiefile': 'cookies.txt',
-        }
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not isinstance(info, dict):
-                    logger.error(f"yt-dlp вернул не dict: {type(info)}")
-                    return None
-                return {
-                    'title': info.get('title', 'YouTube Video'),
-                    'duration': info.get('duration', 0),
-                    'thumbnail': info.get('thumbnail'),
-                    'webpage_url': info.get('webpage_url', url),
-                    'uploader': info.get('uploader'),
-                    'formats': info.get('formats', [])
-                }
+            with timed('extract'), identities.use() as identity:
+                ydl_opts = dict(EXTRACT_OPTIONS, **identity.options)
+                info = await _run_blocking('extract', _extract_info_sync, url, ydl_opts, timeout=YTDLP_EXTRACT_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут получения информации о видео: {url}")
+            return None
         except Exception as e:
             logger.error(f"Ошибка при получении информации о видео: {e}")
             return None
+        if not info:
+            return None
+        if info.get('id'):
+            info_cache.put(info['id'], info, _urls_ttl(info))
+        return _summarize_info(info)
+
+    @staticmethod
+    async def get_cached_info(video_id: str) -> Optional[Dict]:
+        info = info_cache.get(video_id)
+        if info is not None:
+            logger.info(f"Информация о видео {video_id} взята из кэша")
+            return _summarize_info(info)
+        url = YouTubeService.canonical_url(video_id)
+        info, _ = await _extractions.run(video_id, lambda: YouTubeService.get_video_info(url))
+        return info
+
+    @staticmethod
+    def playlist_url(playlist_id: str) -> str:
+        return f"https://www.youtube.com/playlist?list={playlist_id}"
+
+    @staticmethod
+    async def get_playlist(playlist_id: str) -> Optional[Dict]:
+        key = f"playlist:{playlist_id}"
+        playlist = info_cache.get(key)
+        if playlist is not None:
+            return playlist
+        playlist, _ = await _extractions.run(key, lambda: YouTubeService._extract_playlist(playlist_id))
+        return playlist
+
+    @staticmethod
+    async def _extract_playlist(playlist_id: str) -> Optional[Dict]:
+        url = YouTubeService.playlist_url(playlist_id)
+        logger.info(f"Получаем список роликов плейлиста: {url}")
+        try:
+            with timed('playlist'), identities.use() as identity:
+                ydl_opts = dict(PLAYLIST_OPTIONS, **identity.options)
+                playlist = await _run_blocking('extract', _extract_playlist_sync, url, ydl_opts,
+                                               timeout=YTDLP_EXTRACT_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут получения плейлиста: {url}")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при получении плейлиста: {e}")
+            return None
+        if playlist and playlist['entries']:
+            info_cache.put(f"playlist:{playlist_id}", playlist)
+        return playlist
 
     @staticmethod
     def extract_video_audio_formats(formats: List[Dict]) -> Dict[str, List[Dict]]:
@@ -47,88 +454,257 @@ class YouTubeService:
         return {'video': video, 'audio': audio}
 
     @staticmethod
-    async def download_format(url: str, format_id: str, output_path: str) -> bool:
-        logger.info(f"Скачиваем формат {format_id} с YouTube: {url}")
-        logger.info(f"Путь для сохранения: {output_path}")
-        
-        try:
+    def select_formats(formats: List[Dict], max_height: int = 1080, duration: Optional[float] = None) -> Dict[int, Dict]:
+        # Для каждой высоты: прогрессивный mp4, затем пара avc1+m4a (склейка копированием),
+        # затем прочие совместимые кодеки; внутри — https, кодек, fps до 30 и битрейт
+        split = YouTubeService.extract_video_audio_formats(formats)
+        audio = split['audio']
+        mp4_audio = _pick_audio(audio, mp4_only=True)
+        any_audio = _pick_audio(audio, mp4_only=False)
+        ranked: Dict[int, tuple] = {}
+        for video in split['video']:
+            height = video.get('height')
+            if not height or height > max_height:
+                continue
+            progressive = video.get('acodec') not in (None, 'none')
+            if progressive:
+                pair_audio = None
+            elif video.get('ext') == 'mp4' and mp4_audio:
+                pair_audio = mp4_audio
+            else:
+                pair_audio = any_audio
+            if not progressive and pair_audio is None:
+                continue
+            rank = _candidate_rank(video, pair_audio, progressive)
+            if height in ranked and ranked[height][0] <= rank:
+                continue
+            spec = video['format_id'] if progressive else f"{video['format_id']}+{pair_audio['format_id']}"
+            ranked[height] = (rank, {
+                'height': height,
+                'format_id': spec,
+                'video': video,
+                'audio': pair_audio,
+                'progressive': progressive,
+                'stream_copy': rank[0] <= 2,
+            })
+        selections = {height: item for height, (_, item) in sorted(ranked.items())}
+        for item in selections.values():
+            item['size'], item['size_confidence'] = estimate_selection_size(item, duration)
+        return selections
 
-            if os.path.exists(output_path):
-                try:
-                    os.remove(output_path)
-                    logger.info("Удалён существующий файл")
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить существующий файл: {e}")
-            
+    @staticmethod
+    def format_selector(format_spec: str, info: Optional[Dict] = None) -> str:
+        if '+' in format_spec:
+            return f"{format_spec}/{format_spec.split('+')[0]}+bestaudio/best"
+        for f in (info or {}).get('formats', []):
+            if f.get('format_id') == format_spec and f.get('acodec') not in (None, 'none'):
+                return f"{format_spec}/best"
+        # Старые карточки передавали только видеодорожку
+        return f"{format_spec}+bestaudio/best"
+
+    @staticmethod
+    def download_profile(size: int = 0) -> Dict:
+        # Размер неизвестен — считаем файл средним
+        if size and size <= DOWNLOAD_SMALL_MB * MB:
+            name = 'small'
+        elif size > DOWNLOAD_LARGE_MB * MB:
+            name = 'large'
+        else:
+            name = 'default'
+        return dict(DOWNLOAD_PROFILES[name])
+
+    @staticmethod
+    async def download_format(video_id: str, format_spec: str, output_path: str, size: int = 0) -> bool:
+        url = YouTubeService.canonical_url(video_id)
+        logger.info(f"Скачиваем формат {format_spec} с YouTube: {url}")
+        logger.info(f"Путь для сохранения: {output_path}")
 
+        try:
+            info = info_cache.get(video_id)
             ydl_opts = {
-                'format': f'{format_id}+bestaudio/best',
-                'outtmpl': output_path.replace('.webm', '.mp4'),
-                'quiet': False,
+                'format': YouTubeService.format_selector(format_spec, info),
+                'outtmpl': f"{os.path.splitext(output_path)[0]}.%(ext)s",
+                'quiet': True,
                 'no_warnings': False,
-                'verbose': True,
+                'noprogress': True,
                 'overwrites': True,
+                # Недокачанные .part-файлы из каталога задачи в журнале продолжаются с места остановки
+                'continuedl': True,
                 'noplaylist': True,
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-                    'Accept-Language': 'en-US,en;q=0.9,ru;q=0.8',
-                },
                 'merge_output_format': 'mp4',
-                'cookiefile': 'cookies.txt',
+                **YouTubeService.download_profile(size),
             }
-            
+
             logger.info(f"Настройки yt-dlp: {ydl_opts}")
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                logger.info("Начинаем скачивание...")
-                ydl.download([url])
+
+            logger.info("Начинаем скачивание...")
+            _settle_output(await _run_download(url, ydl_opts, info), output_path)
             return True
-                
+
+        except asyncio.CancelledError:
+            logger.warning(f"Скачивание формата {format_spec} отменено: {url}")
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут скачивания формата {format_spec}: {url}")
+            return False
         except Exception as e:
             logger.error(f"Ошибка при скачивании формата: {e}")
             return False
 
     @staticmethod
-    async def download_audio_mp3(url: str, output_path: str) -> bool:
+    async def download_audio_mp3(video_id: str, output_path: str, mode: str = AUDIO_MP3_MODE, size: int = 0) -> bool:
+        started = time.monotonic()
+        if mode == 'pipe':
+            if await YouTubeService.transcode_audio_pipe(video_id, output_path):
+                logger.info(f"MP3 (pipe) готов за {time.monotonic() - started:.1f} c")
+                return True
+            logger.warning("Потоковое перекодирование не удалось, скачиваем MP3 обычным способом")
+        success = await YouTubeService.download_audio_mp3_classic(video_id, output_path, size)
+        if success:
+            logger.info(f"MP3 (classic) готов за {time.monotonic() - started:.1f} c")
+        return success
+
+    @staticmethod
+    async def download_audio_mp3_classic(video_id: str, output_path: str, size: int = 0) -> bool:
+        url = YouTubeService.canonical_url(video_id)
         logger.info(f"Скачиваем mp3 с YouTube: {url}")
         logger.info(f"Путь для сохранения: {output_path}")
-        
 
-        if os.path.exists(output_path):
-            try:
-                os.remove(output_path)
-                logger.info("Удалён существующий файл")
-            except Exception as e:
-                logger.warning(f"Не удалось удалить существующий файл: {e}")
-        
         try:
 
             ydl_opts = {
                 'format': 'bestaudio[ext=m4a]/bestaudio/best',
-                'outtmpl': output_path,
-                'quiet': False,
+                'outtmpl': f"{os.path.splitext(output_path)[0]}.%(ext)s",
+                'quiet': True,
                 'no_warnings': False,
-                'verbose': True,
+                'noprogress': True,
                 'overwrites': True,
+                'continuedl': True,
                 'postprocessors': [{
                     'key': 'FFmpegExtractAudio',
                     'preferredcodec': 'mp3',
                     'preferredquality': '192',
                 }],
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-                    'Accept-Language': 'en-US,en;q=0.9,ru;q=0.8',
-                },
-                'cookiefile': 'cookies.txt',
+                **YouTubeService.download_profile(size),
             }
-            
+
             logger.info(f"Настройки yt-dlp для MP3: {ydl_opts}")
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                logger.info("Начинаем скачивание MP3...")
-                ydl.download([url])
+
+            logger.info("Начинаем скачивание MP3...")
+            _settle_output(await _run_download(url, ydl_opts, info_cache.get(video_id), 'audio'), output_path)
             return True
-                
+
+        except asyncio.CancelledError:
+            logger.warning(f"Скачивание mp3 отменено: {url}")
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут скачивания mp3: {url}")
+            return False
         except Exception as e:
             logger.error(f"Ошибка при скачивании mp3: {e}")
-            return False 
+            return False
+
+    @staticmethod
+    async def transcode_audio_pipe(video_id: str, output_path: str) -> bool:
+        # ffmpeg сам читает поток по прямой ссылке: перекодирование идёт параллельно со скачиванием
+        info = info_cache.get(video_id)
+        if info is None:
+            if not await YouTubeService.get_cached_info(video_id):
+                return False
+            info = info_cache.get(video_id)
+        fmt = _best_audio_format((info or {}).get('formats', []))
+        if not fmt:
+            logger.warning(f"Нет подходящей аудиодорожки для потокового MP3: {video_id}")
+            return False
+        # Заголовки и cookies того профиля, с которым получена ссылка: без них YouTube отвечает 403
+        headers = ''.join(f"{k}: {v}\r\n" for k, v in (fmt.get('http_headers') or DEFAULT_HEADERS).items())
+        cookies = _ffmpeg_cookies(fmt.get('cookies'))
+        args = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-headers', headers,
+            *(['-cookies', cookies] if cookies else []),
+            '-i', fmt['url'],
+            '-vn', '-c:a', 'libmp3lame', '-b:a', '192k',
+            output_path,
+        ]
+        logger.info(f"Потоковое перекодирование в MP3: формат {fmt.get('format_id')} -> {output_path}")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            logger.error(f"Не удалось запустить ffmpeg: {e}")
+            return False
+        try:
+            with timed('transcode'):
+                _, stderr = await asyncio.wait_for(process.communicate(), YTDLP_DOWNLOAD_TIMEOUT)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            process.kill()
+            await process.wait()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        if process.returncode != 0:
+            errors_total.inc(stage='transcode', type='FFmpegExitCode')
+            logger.error(f"ffmpeg завершился с кодом {process.returncode}: {stderr.decode(errors='ignore')[-500:]}")
+            return False
+        return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+
+    @staticmethod
+    async def download_audio_copy(video_id: str, output_base: str, size: int = 0) -> Optional[str]:
+        # Без перекодирования: m4a/opus как есть, только перепаковка контейнера
+        url = YouTubeService.canonical_url(video_id)
+        logger.info(f"Скачиваем аудио без перекодирования с YouTube: {url}")
+        started = time.monotonic()
+        ydl_opts = {
+            'format': 'bestaudio[ext=m4a]/bestaudio',
+            'outtmpl': f"{output_base}.%(ext)s",
+            'quiet': True,
+            'no_warnings': True,
+            'overwrites': True,
+            'continuedl': True,
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }],
+            **YouTubeService.download_profile(size),
+        }
+        try:
+            path = await _run_download(url, ydl_opts, info_cache.get(video_id), 'audio')
+        except asyncio.CancelledError:
+            logger.warning(f"Скачивание аудио отменено: {url}")
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут скачивания аудио: {url}")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при скачивании аудио: {e}")
+            return None
+        logger.info(f"Аудио (copy) готово за {time.monotonic() - started:.1f} c: {path}")
+        return path
+
+    @staticmethod
+    async def warm_up() -> None:
+        # Импорт yt-dlp и первый экземпляр для извлечения — в фоне после старта бота
+        started = time.monotonic()
+        try:
+            await _run_blocking('extract', _warm_up_sync, dict(EXTRACT_OPTIONS, **identities.pick().options))
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть yt-dlp: {e}")
+            return
+        logger.info(f"yt-dlp прогрет за {time.monotonic() - started:.1f} c")
+
+    @staticmethod
+    def pool_stats() -> Dict:
+        return _ydl_pool.stats()
+
+    @staticmethod
+    def shutdown() -> None:
+        global _manager
+        _ydl_pool.close()
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
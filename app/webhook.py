@@ -0,0 +1,49 @@
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_SET_ON_START
+from app.services.scheduler import scheduler
+from app.services.send_queue import send_queue
+from app.services.metrics import metrics_handler
+
+
+logger = logging.getLogger("WEBHOOK")
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        'status': 'ok',
+        'active_jobs': scheduler.active,
+        'queued_jobs': scheduler.queued,
+        'send_queue': send_queue.stats(),
+    })
+
+
+async def register_webhook(bot: Bot, dp: Dispatcher) -> None:
+    if not WEBHOOK_SET_ON_START:
+        logger.info("Регистрация вебхука пропущена (WEBHOOK_SET_ON_START=0)")
+        return
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("WEBHOOK_BASE_URL не задан")
+    url = f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}"
+    await bot.set_webhook(
+        url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Вебхук зарегистрирован: {url}")
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    # Фронтенд без состояния: апдейт обрабатывается в фоне, Telegram сразу получает 200
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан — запросы к вебхуку не проверяются")
+    app = web.Application()
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/metrics", metrics_handler)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
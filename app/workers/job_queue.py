@@ -0,0 +1,164 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from config import WORKER_QUEUE_URL
+
+
+logger = logging.getLogger("JOB_QUEUE")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobQueue(ABC):
+    # Интерфейс бэкенда очереди: open_job_queue() выбирает реализацию по WORKER_QUEUE_URL
+
+    @abstractmethod
+    def put(self, kind: str, payload: Dict) -> int:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[Tuple[int, str, Dict]]:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_id: int) -> None:
+        ...
+
+    @abstractmethod
+    def finish(self, job_id: int, result: Optional[Dict] = None) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: int, error: str) -> None:
+        ...
+
+    @abstractmethod
+    def cancel(self, job_id: int) -> None:
+        ...
+
+    @abstractmethod
+    def status(self, job_id: int) -> Tuple[str, Optional[Dict], Optional[str]]:
+        ...
+
+    @abstractmethod
+    def requeue_stale(self, timeout: float, max_attempts: int = 2) -> int:
+        ...
+
+
+class SQLiteJobQueue(JobQueue):
+    # Подходит и для нескольких процессов на одной машине, и для нескольких хостов с общей ФС
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " worker TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " heartbeat REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+
+    def put(self, kind: str, payload: Dict) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, state, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), QUEUED, time.time()),
+            )
+        return cursor.lastrowid
+
+    def claim(self, worker_id: str) -> Optional[Tuple[int, str, Dict]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload FROM jobs WHERE state = ? ORDER BY id LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, worker = ?, attempts = attempts + 1, heartbeat = ? WHERE id = ?",
+                        (RUNNING, worker_id, time.time(), row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def heartbeat(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND state = ?", (time.time(), job_id, RUNNING))
+
+    def finish(self, job_id: int, result: Optional[Dict] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, result = ? WHERE id = ? AND state = ?",
+                (DONE, json.dumps(result), job_id, RUNNING),
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ? WHERE id = ? AND state IN (?, ?)",
+                (FAILED, error, job_id, QUEUED, RUNNING),
+            )
+
+    def cancel(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ? WHERE id = ? AND state IN (?, ?)",
+                (CANCELLED, job_id, QUEUED, RUNNING),
+            )
+
+    def status(self, job_id: int) -> Tuple[str, Optional[Dict], Optional[str]]:
+        with self._lock:
+            row = self._conn.execute("SELECT state, result, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return FAILED, None, "Задача пропала из очереди"
+        return row[0], json.loads(row[1]) if row[1] else None, row[2]
+
+    def requeue_stale(self, timeout: float, max_attempts: int = 2) -> int:
+        # Воркер умер посреди задачи: возвращаем её в очередь или окончательно проваливаем
+        deadline = time.time() - timeout
+        with self._lock:
+            requeued = self._conn.execute(
+                "UPDATE jobs SET state = ?, worker = NULL WHERE state = ? AND heartbeat < ? AND attempts < ?",
+                (QUEUED, RUNNING, deadline, max_attempts),
+            ).rowcount
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ? WHERE state = ? AND heartbeat < ?",
+                (FAILED, "Воркер перестал отвечать", RUNNING, deadline),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?, ?) AND created_at < ?",
+                (DONE, FAILED, CANCELLED, time.time() - 24 * 60 * 60),
+            )
+        if requeued:
+            logger.warning(f"Возвращено в очередь зависших задач: {requeued}")
+        return requeued
+
+
+def open_job_queue(url: str = WORKER_QUEUE_URL) -> JobQueue:
+    if url.startswith('sqlite:///'):
+        return SQLiteJobQueue(url[len('sqlite:///'):])
+    raise ValueError(f"Неизвестный бэкенд очереди задач: {url}")
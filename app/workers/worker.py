@@ -0,0 +1,102 @@
+from typing import Dict, List
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from config import WORKER_PROCESSES, WORKER_MAX_JOBS, WORKER_POLL_INTERVAL, WORKER_STALE_TIMEOUT
+from app.workers.job_queue import open_job_queue, CANCELLED
+
+
+logger = logging.getLogger("WORKER")
+
+HEARTBEAT_INTERVAL = 5
+
+
+class _QueueCancelEvent:
+    # Совместим с threading.Event по is_set(): yt-dlp проверяет его в progress-хуке
+    def __init__(self, queue, job_id: int):
+        self.queue = queue
+        self.job_id = job_id
+        self._checked_at = 0.0
+        self._cancelled = False
+
+    def is_set(self) -> bool:
+        if not self._cancelled and time.monotonic() - self._checked_at > 1:
+            self._checked_at = time.monotonic()
+            self._cancelled = self.queue.status(self.job_id)[0] == CANCELLED
+        return self._cancelled
+
+
+def _heartbeat(queue, job_id: int, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        queue.heartbeat(job_id)
+
+
+def _run_job(queue, job_id: int, kind: str, payload: Dict) -> None:
+    # Импорт здесь, чтобы yt-dlp грузился только в процессах воркеров
+    from app.services.youtube_service import _download_sync
+
+    if kind != 'download':
+        queue.fail(job_id, f"Неизвестный тип задачи: {kind}")
+        return
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(queue, job_id, stop), daemon=True)
+    beat.start()
+    try:
+        result = _download_sync(payload['url'], payload['opts'], _QueueCancelEvent(queue, job_id), payload.get('info'))
+        queue.finish(job_id, result)
+        logger.info(f"Задача {job_id} выполнена")
+    except Exception as e:
+        logger.error(f"Задача {job_id} завершилась ошибкой: {e}")
+        queue.fail(job_id, str(e))
+    finally:
+        stop.set()
+
+
+def run_worker(max_jobs: int = WORKER_MAX_JOBS) -> None:
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = open_job_queue()
+    logger.info(f"Воркер {worker_id} запущен, лимит задач до перезапуска: {max_jobs}")
+    done = 0
+    while done < max_jobs:
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+        job_id, kind, payload = job
+        logger.info(f"Воркер {worker_id} взял задачу {job_id}")
+        _run_job(queue, job_id, kind, payload)
+        done += 1
+    # Перезапуск процесса освобождает память, которую накапливает yt-dlp
+    logger.info(f"Воркер {worker_id} выполнил {done} задач и завершается для перезапуска")
+
+
+def supervise(processes: int = WORKER_PROCESSES) -> None:
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    queue = open_job_queue()
+    workers: List[multiprocessing.Process] = []
+    logger.info(f"Запускаем {processes} воркеров")
+    try:
+        while True:
+            workers = [w for w in workers if w.is_alive()]
+            while len(workers) < processes:
+                worker = multiprocessing.Process(target=run_worker, daemon=True)
+                worker.start()
+                workers.append(worker)
+            queue.requeue_stale(WORKER_STALE_TIMEOUT)
+            time.sleep(1)
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+def start_local_workers() -> multiprocessing.Process:
+    # Супервизор не может быть daemon: у него свои дочерние процессы
+    supervisor = multiprocessing.Process(target=supervise, name="worker-supervisor")
+    supervisor.start()
+    return supervisor
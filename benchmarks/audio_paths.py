@@ -0,0 +1,63 @@
+"""Сравнение путей получения аудио: classic MP3, потоковый MP3 (pipe) и m4a без перекодирования.
+
+    python -m benchmarks.audio_paths <video_id> [--runs 3]
+
+Нужны сеть и ffmpeg. Печатает время, CPU дочерних процессов (ffmpeg) и размер файла.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+from app.services.youtube_service import YouTubeService
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def _run_path(name: str, video_id: str, workdir: str):
+    base = os.path.join(workdir, name)
+    cpu_before = _children_cpu()
+    started = time.perf_counter()
+    if name == 'copy':
+        path = await YouTubeService.download_audio_copy(video_id, base)
+    else:
+        path = base + '.mp3'
+        ok = await YouTubeService.download_audio_mp3(video_id, path, mode=name)
+        if not ok:
+            path = None
+    elapsed = time.perf_counter() - started
+    cpu = _children_cpu() - cpu_before
+    size = os.path.getsize(path) if path and os.path.exists(path) else 0
+    if path and os.path.exists(path):
+        os.remove(path)
+    return elapsed, cpu, size
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_id')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    # Метаданные извлекаются один раз и не входят в замер
+    if not await YouTubeService.get_cached_info(args.video_id):
+        raise SystemExit("Не удалось получить информацию о видео")
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'путь':<8} {'время, c':>10} {'CPU ffmpeg, c':>14} {'размер, МБ':>11}")
+        for name in ('classic', 'pipe', 'copy'):
+            results = [await _run_path(name, args.video_id, workdir) for _ in range(args.runs)]
+            times = [r[0] for r in results]
+            print(f"{name:<8} {statistics.median(times):>10.2f} "
+                  f"{statistics.median(r[1] for r in results):>14.2f} "
+                  f"{results[-1][2] / 1024 / 1024:>11.1f}")
+    YouTubeService.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
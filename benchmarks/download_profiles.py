@@ -0,0 +1,150 @@
+"""Профили скачивания на локальном фикстурном сервере, без сети.
+
+    python -m benchmarks.download_profiles [--runs 2] [--rate-kb 2048]
+
+Сервер имитирует YouTube: каждое соединение ограничено по скорости (rate-kb),
+а ответ на диапазон длиннее burst-mb после первых burst-mb отдаётся медленно.
+HLS-плейлист из segments фрагментов показывает выигрыш от параллельных фрагментов,
+одиночный файл — от HTTP-запросов кусками (http_chunk_size).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+from app.services.youtube_service import DOWNLOAD_PROFILES, _download_sync
+
+CHUNK = 64 * 1024
+
+
+class FixtureServer:
+    def __init__(self, segments: int, segment_kb: int, file_mb: int, rate_kb: int, burst_mb: int):
+        self.segments = segments
+        self.segment = os.urandom(segment_kb * 1024)
+        self.file = os.urandom(file_mb * 1024 * 1024)
+        self.rate = rate_kb * 1024
+        self.burst = burst_mb * 1024 * 1024
+        self.base_url = ""
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    async def _send(self, request: web.Request, data: bytes, headers, status: int = 200,
+                    burst: int = 0) -> web.StreamResponse:
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(data)
+        await response.prepare(request)
+        started = time.monotonic()
+        try:
+            for offset in range(0, len(data), CHUNK):
+                await response.write(data[offset:offset + CHUNK])
+                # Сверх burst байт соединение упирается в rate
+                slow = max(0, offset + CHUNK - burst)
+                delay = slow / self.rate - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await response.write_eof()
+        except ConnectionError:
+            # yt-dlp закрывает соединение после проверки заголовков
+            pass
+        return response
+
+    async def playlist(self, request: web.Request) -> web.Response:
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(self.segments):
+            lines += ['#EXTINF:4.0,', f'seg{i}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        return web.Response(text='\n'.join(lines) + '\n', content_type='application/vnd.apple.mpegurl')
+
+    async def segment_handler(self, request: web.Request) -> web.StreamResponse:
+        # Фрагмент целиком отдаётся на скорости rate
+        return await self._send(request, self.segment, {'Content-Type': 'video/mp2t'})
+
+    async def file_handler(self, request: web.Request) -> web.StreamResponse:
+        size = len(self.file)
+        headers = {'Accept-Ranges': 'bytes', 'Content-Type': 'video/mp4'}
+        if request.method == 'HEAD':
+            return web.Response(headers=dict(headers, **{'Content-Length': str(size)}))
+        if request.http_range.start is None:
+            return await self._send(request, self.file, headers, burst=self.burst)
+        start = request.http_range.start
+        stop = min(request.http_range.stop or size, size)
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+        return await self._send(request, self.file[start:stop], headers, 206, self.burst)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get('/hls/index.m3u8', self.playlist)
+        app.router.add_get('/hls/{name}', self.segment_handler)
+        app.router.add_route('*', '/file.mp4', self.file_handler)
+        runner = web.AppRunner(app)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        self.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> str:
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def _download(url: str, profile: str, workdir: str) -> float:
+    opts = {
+        'outtmpl': os.path.join(workdir, f"{profile}.%(ext)s"),
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'overwrites': True,
+        # Фрагменты — случайные байты, ffmpeg-фиксапы к ним неприменимы
+        'fixup': 'never',
+        **DOWNLOAD_PROFILES[profile],
+    }
+    started = time.perf_counter()
+    path = _download_sync(url, opts, threading.Event())['filepath']
+    elapsed = time.perf_counter() - started
+    if path and os.path.exists(path):
+        os.remove(path)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--segments', type=int, default=40)
+    parser.add_argument('--segment-kb', type=int, default=512)
+    parser.add_argument('--file-mb', type=int, default=30)
+    parser.add_argument('--rate-kb', type=int, default=2048)
+    parser.add_argument('--burst-mb', type=int, default=10)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.segments, args.segment_kb, args.file_mb, args.rate_kb, args.burst_mb)
+    base_url = server.start()
+    media = {
+        'hls': (f"{base_url}/hls/index.m3u8", args.segments * args.segment_kb / 1024),
+        'file': (f"{base_url}/file.mp4", args.file_mb),
+    }
+    print(f"Скорость соединения {args.rate_kb} КБ/с, burst {args.burst_mb} МБ, {args.runs} прогона(ов)")
+    print(f"{'источник':<8} {'профиль':<8} {'время, c':>9} {'МБ/с':>7}")
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, (url, size_mb) in media.items():
+                for profile in DOWNLOAD_PROFILES:
+                    elapsed = statistics.median(_download(url, profile, workdir) for _ in range(args.runs))
+                    print(f"{name:<8} {profile:<8} {elapsed:>9.2f} {size_mb / elapsed:>7.1f}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Нагрузочный прогон хендлеров без сети: N пользователей присылают ссылку и выбирают формат.
+
+    python -m benchmarks.pipeline [--users 50] [--videos 50] [--mp3-share 0.3]
+
+yt-dlp заменён на tools.fake_ytdlp (синтетические форматы, скорость --download-mbps),
+Telegram — на tools.fake_telegram в отдельном потоке со своим циклом событий, чтобы
+разбор загрузок не попадал в замер задержек цикла бота. Апдейты идут через настоящий
+Dispatcher, поэтому в прогон входят планировщик, очередь отправки и кэши.
+Печатает перцентили задержки (карточка, файл, всего), пропускную способность,
+пиковый RSS и задержку цикла событий.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def _percentiles(values):
+    if not values:
+        return "—"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return f"p50 {pick(0.5):7.3f}  p90 {pick(0.9):7.3f}  p99 {pick(0.99):7.3f}  max {values[-1]:7.3f}"
+
+
+class LoopMonitor:
+    # Задержка цикла: насколько позже срока просыпается sleep(interval)
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self.peak_rss = 0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - started - self.interval)
+            self.peak_rss = max(self.peak_rss, _rss())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class FakeTelegramThread:
+    def __init__(self, latency: float):
+        from tools.fake_telegram import FakeTelegram
+        self.fake = FakeTelegram(latency)
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.fake.start())
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> str:
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self.fake.base_url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.fake.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def _card_buttons(fake, chat_id: int):
+    for method, params in reversed(fake.calls):
+        if method in ('sendPhoto', 'sendMessage') and params.get('chat_id') == str(chat_id) and params.get('reply_markup'):
+            markup = json.loads(params['reply_markup'])
+            buttons = [b['callback_data'] for row in markup['inline_keyboard'] for b in row if b.get('callback_data')]
+            return buttons, params.get('_message_id')
+    return [], None
+
+
+async def run_user(index, args, bot, dp, fake, results, updates):
+    from aiogram.types import Update
+    from tools.fake_telegram import make_callback_update, make_message_update
+
+    chat_id = 10000 + index
+    video_id = f"vid{index % args.videos:08d}"
+    started = time.perf_counter()
+    await dp.feed_update(bot, Update.model_validate(
+        make_message_update(next(updates), chat_id, f"https://www.youtube.com/watch?v={video_id}"),
+        context={'bot': bot}))
+    card = time.perf_counter()
+    if args.think:
+        # Пользователь читает карточку — в это время может идти упреждающая загрузка
+        await asyncio.sleep(args.think)
+    clicked = time.perf_counter()
+    buttons, card_id = _card_buttons(fake, chat_id)
+    want_mp3 = (index % 100) < args.mp3_share * 100
+    choice = next((b for b in buttons if b.endswith(':mp3')), None) if want_mp3 else None
+    choice = choice or next((b for b in buttons if b.split(':')[-1] == args.format), None) or (buttons[0] if buttons else None)
+    if choice is None:
+        results['failed'] += 1
+        return
+    await dp.feed_update(bot, Update.model_validate(
+        make_callback_update(next(updates), chat_id, choice, message_id=card_id or index + 1), context={'bot': bot}))
+    done = time.perf_counter()
+    media = [p for m, p in fake.calls if m in ('sendVideo', 'sendAudio', 'sendDocument') and p.get('chat_id') == str(chat_id)]
+    if not media:
+        results['failed'] += 1
+        return
+    results['card'].append(card - started)
+    results['file'].append(done - clicked)
+    results['total'].append(done - started)
+
+
+async def run(args):
+    import itertools
+    from main import create_bot, create_dispatcher
+    from app.services.identities import identities
+    from app.services.media_cache import media_cache
+    from app.services.metrics import registry, register_service_metrics, prefetch_total
+    from app.services.scheduler import scheduler
+    from app.services.send_queue import send_queue
+    from app.services.youtube_service import YouTubeService
+    from tools import fake_ytdlp
+    from tools.fake_telegram import TOKEN
+
+    # Логи бота на каждый апдейт сами по себе заметно грузят цикл
+    logging.getLogger().setLevel(args.log_level)
+    fake_ytdlp.install()
+    register_service_metrics()
+    fake_ytdlp.FakeYoutubeDL.extract_latency = args.extract_latency
+    fake_ytdlp.FakeYoutubeDL.download_speed = args.download_mbps * 1024 * 1024
+    fake_ytdlp.FakeYoutubeDL.video_size = int(args.video_mb * 1024 * 1024)
+    fake_ytdlp.FakeYoutubeDL.blocked_cookiefiles = {f'cookies{i}.txt' for i in range(args.blocked)}
+
+    telegram = FakeTelegramThread(args.api_latency)
+    api_url = telegram.start()
+    bot = create_bot(TOKEN, api_url, is_local=False, rate_limited=not args.no_rate_limit)
+    dp = create_dispatcher()
+    updates = itertools.count(1)
+    results = {'card': [], 'file': [], 'total': [], 'failed': 0}
+    monitor = LoopMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    users = []
+    for i in range(args.users):
+        users.append(asyncio.create_task(run_user(i, args, bot, dp, telegram.fake, results, updates)))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.users)
+    await asyncio.gather(*users, return_exceptions=False)
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+
+    fake = telegram.fake
+    completed = len(results['total'])
+    print(f"Пользователей: {args.users}, видео: {args.videos}, MP3: {args.mp3_share:.0%}, "
+          f"скачиваний: {args.workers} одновременно, лимиты отправки: {'нет' if args.no_rate_limit else 'да'}")
+    print(f"Готово: {completed}, ошибок: {results['failed']}, за {elapsed:.2f} c")
+    print(f"Пропускная способность: {completed / elapsed:.2f} доставок/с, "
+          f"{fake.uploaded_bytes / 1024 / 1024 / elapsed:.1f} МБ/с в Telegram")
+    print(f"Извлечений yt-dlp: {fake_ytdlp.FakeYoutubeDL.extracted}, скачиваний: {fake_ytdlp.FakeYoutubeDL.downloaded}")
+    print(f"Задержка, c   карточка: {_percentiles(results['card'])}")
+    print(f"              файл:     {_percentiles(results['file'])}")
+    print(f"              всего:    {_percentiles(results['total'])}")
+    print(f"Задержка цикла событий, мс: {_percentiles([lag * 1000 for lag in monitor.lags])}")
+    print(f"Пиковый RSS: {monitor.peak_rss / 1024 / 1024:.0f} МБ "
+          f"(ru_maxrss {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ)")
+    print(f"Планировщик: отказов {scheduler.rejected}; очередь отправки: {send_queue.stats()}")
+    if args.media_cache_mb:
+        print(f"Кэш файлов: {media_cache.stats()}")
+    if args.identities > 1 or args.blocked:
+        for name, stats in identities.stats().items():
+            print(f"Идентичность {name}: {stats}")
+    if args.prefetch:
+        outcomes = {k[0]: v for k, v in prefetch_total._values.items()}
+        print(f"Упреждающие загрузки: {outcomes}")
+    if args.metrics:
+        print(registry.render())
+
+    await send_queue.close()
+    await bot.session.close()
+    telegram.stop()
+    YouTubeService.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--videos', type=int, default=50, help="число разных видео; меньше users — общие загрузки")
+    parser.add_argument('--mp3-share', type=float, default=0.3)
+    parser.add_argument('--format', default='136+140', help="какую кнопку видео нажимать")
+    parser.add_argument('--video-mb', type=float, default=8)
+    parser.add_argument('--download-mbps', type=float, default=20)
+    parser.add_argument('--extract-latency', type=float, default=0.3)
+    parser.add_argument('--api-latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--think', type=float, default=0.0, help="пауза между карточкой и кликом, c")
+    parser.add_argument('--prefetch', action='store_true', help="включить упреждающую загрузку")
+    parser.add_argument('--prefetch-max', type=int, default=20, help="PREFETCH_MAX_ACTIVE")
+    parser.add_argument('--identities', type=int, default=1, help="число файлов cookies в пуле идентичностей")
+    parser.add_argument('--blocked', type=int, default=0, help="сколько из них получают 429 на каждый запрос")
+    parser.add_argument('--media-cache-mb', type=int, default=2048, help="MEDIA_CACHE_MB, 0 — без кэша файлов")
+    parser.add_argument('--no-file-ids', action='store_true',
+                        help="кэш file_id всегда промахивается, как после смены токена бота")
+    parser.add_argument('--ramp', type=float, default=0.0, help="за сколько секунд подключить всех пользователей")
+    parser.add_argument('--no-rate-limit', action='store_true')
+    parser.add_argument('--metrics', action='store_true', help="напечатать /metrics после прогона")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    # Настройки читаются config.py при импорте, поэтому выставляем их до импорта бота
+    workdir = tempfile.mkdtemp(prefix='bsaver-bench-')
+    os.environ.update({
+        'BOT_TOKEN': os.environ.get('BOT_TOKEN', '42:FAKE-TOKEN'),
+        'YTDLP_EXECUTOR': 'thread',
+        'YTDLP_DOWNLOAD_WORKERS': str(args.workers),
+        'SCHEDULER_MAX_ACTIVE': str(args.workers),
+        'SCHEDULER_MAX_QUEUED': str(max(50, args.users)),
+        'AUDIO_MP3_MODE': 'classic',
+        'FILE_CACHE_PATH': os.path.join(workdir, 'file_cache.sqlite3'),
+        'JOURNAL_PATH': os.path.join(workdir, 'journal.sqlite3'),
+        'SCRATCH_DIR': os.path.join(workdir, 'scratch'),
+        'MEDIA_CACHE_DIR': os.path.join(workdir, 'media'),
+        'MEDIA_CACHE_MB': str(args.media_cache_mb),
+        'FILE_CACHE_TTL_DAYS': '0' if args.no_file_ids else os.environ.get('FILE_CACHE_TTL_DAYS', '45'),
+        'METRICS_PORT': '0',
+        'PREFETCH_ENABLED': '1' if args.prefetch else '0',
+        'PREFETCH_MAX_ACTIVE': str(args.prefetch_max),
+        'YTDLP_COOKIE_FILES': ','.join(f'cookies{i}.txt' for i in range(args.identities)),
+    })
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
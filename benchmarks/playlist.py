@@ -0,0 +1,169 @@
+"""Плейлист целиком против ссылок по одной, без сети.
+
+    python -m benchmarks.playlist [--items 30] [--quality mp3] [--download-mbps 5]
+
+Сначала пользователь присылает ролики по одному и ждёт каждый файл (карточка, кнопка, файл),
+затем присылает ссылку на плейлист такого же размера и нажимает «Все в MP3». yt-dlp и Telegram
+фейковые (tools.fake_ytdlp, tools.fake_telegram), апдейты идут через настоящий Dispatcher.
+Печатает время до первого и последнего файла, число запросов отправки и правок статуса.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+CHAT_ID = 100
+
+
+def _sent_files(fake, since: int) -> int:
+    count = 0
+    for method, params in fake.calls[since:]:
+        if method == 'sendMediaGroup':
+            count += len(json.loads(params.get('media', '[]')))
+        elif method in ('sendAudio', 'sendVideo', 'sendDocument'):
+            count += 1
+    return count
+
+
+def _buttons(fake, since: int):
+    for method, params in reversed(fake.calls[since:]):
+        if params.get('reply_markup'):
+            markup = json.loads(params['reply_markup'])
+            return [b['callback_data'] for row in markup['inline_keyboard'] for b in row], params.get('_message_id')
+    return [], None
+
+
+async def _wait_files(fake, since: int, count: int, started: float, timeout: float = 600):
+    first = None
+    while time.perf_counter() - started < timeout:
+        sent = _sent_files(fake, since)
+        if sent and first is None:
+            first = time.perf_counter() - started
+        if sent >= count:
+            return first, time.perf_counter() - started
+        await asyncio.sleep(0.01)
+    return first, None
+
+
+async def _one_by_one(args, bot, dp, fake, updates, video_ids):
+    from aiogram.types import Update
+    from tools.fake_telegram import make_callback_update, make_message_update
+
+    since = len(fake.calls)
+    started = time.perf_counter()
+    first = None
+    for video_id in video_ids:
+        mark = len(fake.calls)
+        await dp.feed_update(bot, Update.model_validate(
+            make_message_update(next(updates), CHAT_ID, f"https://youtu.be/{video_id}"), context={'bot': bot}))
+        buttons, card_id = _buttons(fake, mark)
+        choice = next(b for b in buttons if b.endswith(f":{args.quality}"))
+        await dp.feed_update(bot, Update.model_validate(
+            make_callback_update(next(updates), CHAT_ID, choice, message_id=card_id), context={'bot': bot}))
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started, len(fake.calls) - since
+
+
+async def _batch(args, bot, dp, fake, updates, playlist_id):
+    from aiogram.types import Update
+    from tools.fake_telegram import make_callback_update, make_message_update
+
+    since = len(fake.calls)
+    started = time.perf_counter()
+    await dp.feed_update(bot, Update.model_validate(
+        make_message_update(next(updates), CHAT_ID, f"https://www.youtube.com/playlist?list={playlist_id}"),
+        context={'bot': bot}))
+    buttons, card_id = _buttons(fake, since)
+    choice = next(b for b in buttons if b.endswith(f":{args.quality}"))
+    # Хендлер кнопки ждёт весь плейлист, первый файл ловим параллельно
+    clicked = asyncio.create_task(dp.feed_update(bot, Update.model_validate(
+        make_callback_update(next(updates), CHAT_ID, choice, message_id=card_id), context={'bot': bot})))
+    first, _ = await _wait_files(fake, since, 1, started)
+    await clicked
+    return first, time.perf_counter() - started, fake.calls[since:]
+
+
+async def run(args):
+    from benchmarks.pipeline import FakeTelegramThread
+    from main import create_bot, create_dispatcher
+    from app.services.send_queue import send_queue
+    from app.services.youtube_service import YouTubeService
+    from tools import fake_ytdlp
+    from tools.fake_telegram import TOKEN
+
+    logging.getLogger().setLevel(args.log_level)
+    fake_ytdlp.install()
+    fake_ytdlp.FakeYoutubeDL.extract_latency = args.extract_latency
+    fake_ytdlp.FakeYoutubeDL.download_speed = args.download_mbps * 1024 * 1024
+    fake_ytdlp.FakeYoutubeDL.playlist_size = args.items
+
+    telegram = FakeTelegramThread(args.api_latency)
+    api_url = telegram.start()
+    bot = create_bot(TOKEN, api_url, is_local=False)
+    dp = create_dispatcher()
+    updates = itertools.count(1)
+    fake = telegram.fake
+
+    # Ролики с другим префиксом id, чтобы прогоны не делили кэши
+    serial_ids = [f"SERI{i:07d}" for i in range(args.items)]
+    s_first, s_total, s_calls = await _one_by_one(args, bot, dp, fake, updates, serial_ids)
+    b_first, b_total, calls = await _batch(args, bot, dp, fake, updates, 'PLbatchbenchmark')
+    groups = sum(1 for method, _ in calls if method == 'sendMediaGroup')
+    singles = sum(1 for method, _ in calls if method == 'sendAudio')
+    edits = sum(1 for method, _ in calls if method == 'editMessageText')
+    delivered = _sent_files(fake, len(fake.calls) - len(calls))
+
+    print(f"{args.items} роликов в {args.quality}, скачивание {args.download_mbps:.0f} МБ/с, "
+          f"извлечение {args.extract_latency:.1f} c")
+    print(f"  по одной ссылке: первый файл {s_first:.2f} c, все {s_total:.2f} c, запросов к Telegram {s_calls}")
+    print(f"  плейлистом:      первый файл {b_first:.2f} c, все {b_total:.2f} c, запросов к Telegram {len(calls)} "
+          f"(альбомов {groups}, одиночных файлов {singles}, правок статуса {edits}), доставлено {delivered}")
+    print(f"  ускорение: ×{s_total / b_total:.1f}")
+
+    await send_queue.close()
+    await bot.session.close()
+    telegram.stop()
+    YouTubeService.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=30)
+    parser.add_argument('--quality', choices=('mp3', 'm4a'), default='mp3')
+    parser.add_argument('--download-mbps', type=float, default=5)
+    parser.add_argument('--extract-latency', type=float, default=0.5)
+    parser.add_argument('--api-latency', type=float, default=0.05)
+    parser.add_argument('--extracts', type=int, default=2, help="BATCH_EXTRACTS")
+    parser.add_argument('--downloads', type=int, default=2, help="BATCH_DOWNLOADS")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bsaver-playlist-')
+    os.environ.update({
+        'BOT_TOKEN': os.environ.get('BOT_TOKEN', '42:FAKE-TOKEN'),
+        'YTDLP_EXECUTOR': 'thread',
+        'AUDIO_MP3_MODE': 'classic',
+        'FILE_CACHE_PATH': os.path.join(workdir, 'file_cache.sqlite3'),
+        'JOURNAL_PATH': os.path.join(workdir, 'journal.sqlite3'),
+        'SCRATCH_DIR': os.path.join(workdir, 'scratch'),
+        'MEDIA_CACHE_DIR': os.path.join(workdir, 'media'),
+        'METRICS_PORT': '0',
+        'BATCH_MAX_ITEMS': str(args.items),
+        'BATCH_EXTRACTS': str(args.extracts),
+        'BATCH_DOWNLOADS': str(args.downloads),
+        'BATCH_PROGRESS_INTERVAL': '1',
+    })
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Перезапуск бота посреди загрузки: сколько приходится качать заново.
+
+    python -m benchmarks.restart [--video-mb 30] [--download-mbps 10] [--stop-at 0.5]
+
+Бот в отдельном процессе (фейковые yt-dlp и Telegram) получает нажатие кнопки и на доле
+--stop-at скачивания останавливается двумя способами: SIGKILL (падение) и SIGTERM (деплой,
+с отработкой shutdown диспетчера). Второй запуск с тем же журналом и временным каталогом
+продолжает задачу сам. Печатает, сколько байт скачано после перезапуска, за сколько файл
+дошёл до исходного чата и получил ли его пользователь без повторного нажатия.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+CHAT_ID = 100
+CARD_ID = 777
+VIDEO_ID = 'dQw4w9WgXcQ'
+FORMAT = '136+140'
+
+
+async def _child(args) -> None:
+    from aiogram.types import Update
+    import main
+    from app.handlers import youtube
+    from app.services.scratch import scratch
+    from app.services.send_queue import send_queue
+    from app.services.youtube_service import YouTubeService
+    from tools import fake_ytdlp
+    from tools.fake_telegram import TOKEN, make_callback_update
+
+    fake_ytdlp.install()
+    fake_ytdlp.FakeYoutubeDL.extract_latency = 0.05
+    fake_ytdlp.FakeYoutubeDL.download_speed = args.download_mbps * 1024 * 1024
+    fake_ytdlp.FakeYoutubeDL.video_size = int(args.video_mb * 1024 * 1024)
+
+    unfinished = await youtube.recover_deliveries()
+    await scratch.start()
+    bot = main.create_bot(TOKEN, args.child, is_local=False)
+    dp = main.create_dispatcher()
+    started = time.perf_counter()
+    resumed = youtube.resume_deliveries(bot, unfinished)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    if not resumed:
+        update = make_callback_update(1, CHAT_ID, f"download:yt:{VIDEO_ID}:{FORMAT}", message_id=CARD_ID)
+        asyncio.create_task(dp.feed_update(bot, Update.model_validate(update, context={'bot': bot})))
+        print(json.dumps({'ready': True}), flush=True)
+        # Ждём остановки от родителя, как бот в polling
+        await stop.wait()
+        await dp.emit_shutdown(bot=bot)
+    else:
+        await asyncio.gather(*resumed)
+        print(json.dumps({
+            'resumed': len(resumed),
+            'transferred': fake_ytdlp.FakeYoutubeDL.transferred,
+            'delivered_in': time.perf_counter() - started,
+        }), flush=True)
+    await send_queue.close()
+    await bot.session.close()
+    YouTubeService.shutdown()
+
+
+async def _scenario(how: str, args, api_url: str, fake) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bsaver-restart-')
+    env = dict(
+        os.environ,
+        BOT_TOKEN='42:FAKE-TOKEN',
+        METRICS_PORT='0',
+        YTDLP_EXECUTOR='thread',
+        JOURNAL_PATH=os.path.join(workdir, 'journal.sqlite3'),
+        FILE_CACHE_PATH=os.path.join(workdir, 'file_cache.sqlite3'),
+        SCRATCH_DIR=os.path.join(workdir, 'scratch'),
+        MEDIA_CACHE_DIR=os.path.join(workdir, 'media'),
+    )
+    command = [sys.executable, '-m', 'benchmarks.restart', '--child', api_url,
+               '--video-mb', str(args.video_mb), '--download-mbps', str(args.download_mbps)]
+    try:
+        first = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL, env=env)
+        await first.stdout.readline()
+        # Скачивание начинается после извлечения; останавливаем на нужной доле
+        await asyncio.sleep(0.3 + args.stop_at * args.video_mb / args.download_mbps)
+        sent_before = len(fake.calls_of('sendVideo'))
+        if how == 'kill':
+            first.kill()
+        else:
+            first.send_signal(signal.SIGTERM)
+        await first.wait()
+
+        second = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL, env=env)
+        stdout, _ = await second.communicate()
+        report = json.loads(stdout.decode().strip().splitlines()[-1])
+        videos = fake.calls_of('sendVideo')[sent_before:]
+        report['to_card'] = any(json.loads(v.get('reply_parameters', '{}')).get('message_id') == CARD_ID
+                                for v in videos)
+        report['leftover'] = sum(len(files) for _, _, files in os.walk(os.path.join(workdir, 'scratch')))
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _run(args) -> None:
+    from tools.fake_telegram import FakeTelegram
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    size = args.video_mb * 1024 * 1024
+    print(f"Видео {args.video_mb:.0f} МБ при {args.download_mbps:.0f} МБ/с, остановка на {args.stop_at:.0%} скачивания")
+    for how, label in (('kill', 'SIGKILL'), ('term', 'SIGTERM')):
+        report = await _scenario(how, args, api_url, fake)
+        if not report.get('resumed'):
+            print(f"  {label}: задача не продолжена после перезапуска")
+            continue
+        print(f"  {label}: после перезапуска скачано {report['transferred'] / size:.0%} файла, "
+              f"доставлено за {report['delivered_in']:.2f} c, в исходную карточку: {report['to_card']}, "
+              f"файлов во временном каталоге: {report['leftover']}")
+    print(f"  без журнала: задача теряется, повторное нажатие качает 100% файла "
+          f"(~{args.video_mb / args.download_mbps:.1f} c)")
+    await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video-mb', type=float, default=30)
+    parser.add_argument('--download-mbps', type=float, default=10)
+    parser.add_argument('--stop-at', type=float, default=0.5)
+    parser.add_argument('--child', metavar='API_URL', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(_child(args))
+        return
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Холодный старт бота и стоимость создания YoutubeDL.
+
+    python -m benchmarks.startup [--runs 3] [--cookies 300] [--calls 20]
+
+1. В отдельном процессе импортирует main, создаёт бота на фейковом Bot API и прогоняет /start
+   через Dispatcher: время импорта, время до ответа на /start от запуска процесса и загружены ли
+   к этому моменту yt_dlp/requests. Затем — сколько занимает фоновый прогрев yt-dlp.
+2. В этом процессе сравнивает новый YoutubeDL на каждый вызов (как было) с пулом экземпляров:
+   создание с загрузкой cookies.txt и HTTP-обработчиков против взятия готового экземпляра.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+STARTED = time.perf_counter()
+
+
+async def _child(api_url: str) -> None:
+    began = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    from aiogram.types import Update
+    from app.services.youtube_service import YouTubeService
+    from tools.fake_telegram import TOKEN, make_message_update
+
+    bot = main.create_bot(TOKEN, api_url, is_local=False)
+    dp = main.create_dispatcher()
+    await dp.feed_update(bot, Update.model_validate(make_message_update(1, 100, "/start"), context={'bot': bot}))
+    answered = time.perf_counter()
+    report = {
+        'import_main': imported - began,
+        'start_reply': answered - STARTED,
+        'yt_dlp_loaded': 'yt_dlp' in sys.modules,
+        'requests_loaded': 'requests' in sys.modules,
+    }
+    warm_started = time.perf_counter()
+    await YouTubeService.warm_up()
+    report['warm_up'] = time.perf_counter() - warm_started
+    await main.send_queue.close()
+    await bot.session.close()
+    YouTubeService.shutdown()
+    print(json.dumps(report))
+
+
+async def _cold_start(runs: int) -> None:
+    from tools.fake_telegram import FakeTelegram
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    env = dict(os.environ, BOT_TOKEN=os.environ.get('BOT_TOKEN', '42:FAKE-TOKEN'), METRICS_PORT='0')
+    reports = []
+    for _ in range(runs):
+        spawned = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'benchmarks.startup', '--child', api_url,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL, env=env)
+        stdout, _ = await process.communicate()
+        report = json.loads(stdout.decode().strip().splitlines()[-1])
+        report['process'] = time.perf_counter() - spawned
+        reports.append(report)
+    await fake.stop()
+
+    answers = [m for m, p in fake.calls if m == 'sendMessage']
+    median = lambda key: statistics.median(r[key] for r in reports)
+    print(f"Холодный старт, медиана из {runs} (ответов на /start: {len(answers)}):")
+    print(f"  import main:                 {median('import_main'):.3f} c")
+    print(f"  ответ на /start от запуска:  {median('start_reply'):.3f} c")
+    print(f"  процесс целиком с прогревом: {median('process'):.3f} c")
+    print(f"  прогрев yt-dlp в фоне:       {median('warm_up'):.3f} c")
+    print(f"  yt_dlp загружен к /start: {reports[-1]['yt_dlp_loaded']}, requests: {reports[-1]['requests_loaded']}")
+
+
+def _pool(cookies: int, calls: int) -> None:
+    import yt_dlp
+    from app.services.ydl_pool import YoutubeDLPool
+
+    with tempfile.TemporaryDirectory(prefix='bsaver-startup-') as workdir:
+        cookiefile = os.path.join(workdir, 'cookies.txt')
+        with open(cookiefile, 'w') as f:
+            f.write("# Netscape HTTP Cookie File\n")
+            for i in range(cookies):
+                f.write(f".youtube.com\tTRUE\t/\tTRUE\t{int(time.time()) + 86400}\tCOOKIE{i}\t{'x' * 64}\n")
+        opts = {'quiet': True, 'no_warnings': True, 'cookiefile': cookiefile}
+
+        def use(ydl):
+            # То, что yt-dlp делает в начале каждого извлечения
+            ydl.cookiejar
+            ydl._request_director
+            ydl.get_info_extractor('Youtube')
+
+        started = time.perf_counter()
+        for _ in range(calls):
+            with yt_dlp.YoutubeDL(dict(opts)) as ydl:
+                use(ydl)
+        fresh = (time.perf_counter() - started) / calls
+
+        pool = YoutubeDLPool(yt_dlp.YoutubeDL, max_idle=1, max_uses=calls + 1)
+        started = time.perf_counter()
+        for _ in range(calls):
+            with pool.acquire(dict(opts)) as ydl:
+                use(ydl)
+        pooled = (time.perf_counter() - started) / calls
+        pool.close()
+
+    print(f"YoutubeDL на вызов ({cookies} cookies, {calls} вызовов):")
+    print(f"  новый экземпляр:  {fresh * 1000:7.1f} мс")
+    print(f"  из пула:          {pooled * 1000:7.1f} мс  (создано {pool.created}, переиспользовано {pool.reused})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--cookies', type=int, default=300)
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--child', metavar='API_URL', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(_child(args.child))
+        return
+    asyncio.run(_cold_start(args.runs))
+    _pool(args.cookies, args.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Загрузка через FSInputFile (multipart) против file:// для локального Bot API.
+
+    python -m benchmarks.upload_paths [--size-mb 200] [--runs 3]
+
+Фейковый Bot API (tools.fake_telegram) запускается отдельным процессом,
+поэтому замер памяти относится только к процессу бота.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiogram.types import FSInputFile
+
+from main import create_bot
+from tools.fake_telegram import TOKEN
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+async def _measure(send) -> tuple:
+    baseline = _rss()
+    peak = baseline
+    done = asyncio.Event()
+
+    async def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, _rss())
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    try:
+        await send()
+    finally:
+        done.set()
+        await sampler
+    return time.perf_counter() - started, peak - baseline
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8099)
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'tools.fake_telegram', '--serve', '--port', str(args.port)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    server.stdout.readline()
+    api_url = f"http://127.0.0.1:{args.port}"
+    try:
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(chunk)
+            f.flush()
+            paths = {
+                'multipart': (create_bot(TOKEN, api_url, is_local=False, rate_limited=False), lambda: FSInputFile(f.name, filename='video.mp4')),
+                'file://': (create_bot(TOKEN, api_url, is_local=True, rate_limited=False), lambda: f"file://{f.name}"),
+            }
+            print(f"Файл {args.size_mb} МБ, {args.runs} прогона(ов)")
+            print(f"{'путь':<10} {'время, c':>9} {'МБ/с':>8} {'прирост RSS, МБ':>16}")
+            for name, (bot, media) in paths.items():
+                results = [
+                    await _measure(lambda: bot.send_document(chat_id=1, document=media(), request_timeout=600))
+                    for _ in range(args.runs)
+                ]
+                elapsed = statistics.median(r[0] for r in results)
+                rss = max(r[1] for r in results)
+                print(f"{name:<10} {elapsed:>9.2f} {args.size_mb / elapsed:>8.1f} {rss / 1024 / 1024:>16.1f}")
+                await bot.session.close()
+        print(f"Пиковый RSS процесса: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
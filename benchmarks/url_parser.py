@@ -0,0 +1,85 @@
+"""Микробенчмарк разбора ссылок: app.services.url_parser против сопоставления URL экстракторами yt-dlp.
+
+    python -m benchmarks.url_parser [--iterations 20000]
+
+Сначала проверяет разбор на наборе типичных сообщений (ожидаемые id), затем меряет время на
+сообщение. Для yt-dlp берётся только проверка ссылки регулярками YoutubeIE/YoutubeTabIE — до
+сетевого запроса, который раньше делался для любого текста с «youtube.com».
+"""
+import argparse
+import time
+
+from app.services.url_parser import extract_video_ids
+
+ID = 'dQw4w9WgXcQ'
+
+CASES = [
+    (f"https://www.youtube.com/watch?v={ID}", [ID]),
+    (f"https://youtu.be/{ID}?t=42", [ID]),
+    (f"youtube.com/shorts/{ID}", [ID]),
+    (f"https://music.youtube.com/watch?v={ID}&list=RDAMVM{ID}", [ID]),
+    (f"https://www.youtube-nocookie.com/embed/{ID}?start=10", [ID]),
+    (f"https://m.youtube.com/watch?feature=share&v={ID}#t=1m30s", [ID]),
+    (f"https://www.youtube.com/live/{ID}?si=abc", [ID]),
+    (f"Глянь, как смешно 😂 https://youtu.be/{ID}. И вот ещё: youtube.com/watch?v=aaaaaaaaaaa&t=5", [ID, 'aaaaaaaaaaa']),
+    (f"два раза https://youtu.be/{ID} https://www.youtube.com/watch?v={ID}", [ID]),
+    ("https://www.youtube.com/@somechannel/videos", []),
+    ("https://www.youtube.com/playlist?list=PLabcdefghijk", []),
+    ("https://www.youtube.com/watch?v=tooshort", []),
+    (f"https://evil.example/youtube.com/watch?v={ID}", []),
+    ("я смотрю youtube.com каждый день, а ты?", []),
+]
+
+
+def _ytdlp_matcher():
+    try:
+        from yt_dlp.extractor.youtube import YoutubeIE, YoutubeTabIE
+    except ImportError:
+        return None
+
+    def match(text):
+        ids = []
+        for word in text.split():
+            if YoutubeIE.suitable(word):
+                ids.append(YoutubeIE.get_temp_id(word))
+            elif YoutubeTabIE.suitable(word):
+                ids.append(None)
+        return ids
+
+    return match
+
+
+def _per_message(func, iterations: int) -> float:
+    messages = [text for text, _ in CASES]
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in messages:
+            func(text)
+    return (time.perf_counter() - started) / (iterations * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    failures = 0
+    for text, expected in CASES:
+        got = extract_video_ids(text)
+        if got != expected:
+            failures += 1
+            print(f"  ✗ {text!r}: {got} вместо {expected}")
+    print(f"Разбор: {len(CASES) - failures}/{len(CASES)} сообщений верно")
+
+    parsed = _per_message(extract_video_ids, args.iterations)
+    print(f"url_parser:      {parsed * 1e6:7.2f} мкс на сообщение")
+    match = _ytdlp_matcher()
+    if match is not None:
+        # Первый вызов компилирует регулярки экстракторов — его в замер не включаем
+        match(CASES[0][0])
+        matched = _per_message(match, max(1, args.iterations // 10))
+        print(f"yt-dlp suitable: {matched * 1e6:7.2f} мкс на сообщение (без учёта extract_info)")
+
+
+if __name__ == "__main__":
+    main()
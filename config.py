@@ -1,7 +1,137 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
\ No newline at end of file
+RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
+
+# Исполнители yt-dlp: "thread", "process" или "queue" (отдельные процессы-воркеры, см. WORKER_*)
+YTDLP_EXECUTOR = os.getenv("YTDLP_EXECUTOR", "thread")
+YTDLP_EXTRACT_WORKERS = int(os.getenv("YTDLP_EXTRACT_WORKERS", "4"))
+YTDLP_DOWNLOAD_WORKERS = int(os.getenv("YTDLP_DOWNLOAD_WORKERS", "2"))
+YTDLP_EXTRACT_TIMEOUT = float(os.getenv("YTDLP_EXTRACT_TIMEOUT", "60"))
+YTDLP_DOWNLOAD_TIMEOUT = float(os.getenv("YTDLP_DOWNLOAD_TIMEOUT", "900"))
+# Пул экземпляров YoutubeDL: сколько свободных держать на профиль и через сколько задач пересоздавать
+YTDLP_POOL_IDLE = int(os.getenv("YTDLP_POOL_IDLE", str(max(YTDLP_EXTRACT_WORKERS, YTDLP_DOWNLOAD_WORKERS))))
+YTDLP_POOL_MAX_USES = int(os.getenv("YTDLP_POOL_MAX_USES", "50"))
+# Идентичности yt-dlp: файлы cookies через запятую и User-Agent через «|», пары составляются по порядку.
+# После 403/429 или урезанной скорости идентичность отдыхает IDENTITY_BENCH_BASE c, дальше вдвое дольше
+YTDLP_COOKIE_FILES = [p.strip() for p in os.getenv("YTDLP_COOKIE_FILES", "cookies.txt").split(",") if p.strip()]
+YTDLP_USER_AGENTS = [ua.strip() for ua in os.getenv("YTDLP_USER_AGENTS", "").split("|") if ua.strip()]
+IDENTITY_BENCH_BASE = float(os.getenv("IDENTITY_BENCH_BASE", "60"))
+IDENTITY_BENCH_MAX = float(os.getenv("IDENTITY_BENCH_MAX", "3600"))
+
+# Кэш Telegram file_id (анонимные данные удаляются раз в 1-2 месяца)
+FILE_CACHE_PATH = os.getenv("FILE_CACHE_PATH", "file_cache.sqlite3")
+FILE_CACHE_TTL_DAYS = float(os.getenv("FILE_CACHE_TTL_DAYS", "45"))
+
+# Кэш метаданных yt-dlp: TTL меньше срока жизни подписанных ссылок (~6 ч)
+INFO_CACHE_TTL = float(os.getenv("INFO_CACHE_TTL", "7200"))
+INFO_CACHE_MAX_ENTRIES = int(os.getenv("INFO_CACHE_MAX_ENTRIES", "256"))
+INFO_CACHE_MAX_MB = int(os.getenv("INFO_CACHE_MAX_MB", "64"))
+
+# Планировщик загрузок
+SCHEDULER_MAX_ACTIVE = int(os.getenv("SCHEDULER_MAX_ACTIVE", str(YTDLP_DOWNLOAD_WORKERS)))
+SCHEDULER_MAX_QUEUED = int(os.getenv("SCHEDULER_MAX_QUEUED", "50"))
+SCHEDULER_MAX_PER_USER = int(os.getenv("SCHEDULER_MAX_PER_USER", "3"))
+
+# Воркеры загрузок (YTDLP_EXECUTOR=queue): бот кладёт задачи в очередь, скачивают отдельные процессы
+WORKER_QUEUE_URL = os.getenv("WORKER_QUEUE_URL", "sqlite:///jobs.sqlite3")
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 2)))
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "20"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+WORKER_STALE_TIMEOUT = float(os.getenv("WORKER_STALE_TIMEOUT", "60"))
+WORKER_SPAWN_LOCAL = os.getenv("WORKER_SPAWN_LOCAL", "1") == "1"
+
+# Режим получения апдейтов: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER")
+# Свой telegram-bot-api с --local: файлы до 2 ГБ и отправка по локальному пути без перезаливки
+TELEGRAM_API_LOCAL = os.getenv("TELEGRAM_API_LOCAL", "0") == "1"
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# При нескольких фронтендах за балансировщиком вебхук регистрирует только один из них
+WEBHOOK_SET_ON_START = os.getenv("WEBHOOK_SET_ON_START", "1") == "1"
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", os.getenv("WEBAPP_PORT", "8080")))
+
+# Журнал загрузок: после перезапуска незавершённые задачи продолжаются, если им не больше
+# JOURNAL_MAX_AGE c и они пережили меньше JOURNAL_MAX_ATTEMPTS запусков; при остановке отправке
+# уже скачанных файлов даётся JOURNAL_DRAIN_TIMEOUT c
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "journal.sqlite3")
+JOURNAL_MAX_AGE = float(os.getenv("JOURNAL_MAX_AGE", "21600"))
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "3"))
+JOURNAL_DRAIN_TIMEOUT = float(os.getenv("JOURNAL_DRAIN_TIMEOUT", "60"))
+
+# Сколько ссылок на ролики из одного сообщения обрабатывать
+URL_MAX_LINKS = int(os.getenv("URL_MAX_LINKS", "5"))
+
+# Плейлисты и альбомы: первые BATCH_MAX_ITEMS роликов, на плейлист BATCH_EXTRACTS извлечений и
+# BATCH_DOWNLOADS загрузок одновременно (загрузки — в пределах SCHEDULER_MAX_PER_USER); готовые файлы
+# уходят альбомами по BATCH_GROUP_SIZE (Telegram допускает до 10), неполный альбом ждёт не дольше
+# BATCH_GROUP_WAIT c, статус правится раз в BATCH_PROGRESS_INTERVAL c
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_EXTRACTS = int(os.getenv("BATCH_EXTRACTS", "2"))
+BATCH_DOWNLOADS = int(os.getenv("BATCH_DOWNLOADS", "2"))
+BATCH_GROUP_SIZE = int(os.getenv("BATCH_GROUP_SIZE", "10"))
+BATCH_GROUP_WAIT = float(os.getenv("BATCH_GROUP_WAIT", "30"))
+BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "3"))
+
+# MP3: "classic" — скачать через yt-dlp (с разбиением на куски), затем перекодировать; "pipe" — ffmpeg
+# перекодирует прямо из потока. Pipe экспериментальный: обходит http_chunk_size yt-dlp и не замерен
+# на реальном YouTube (benchmarks/audio_paths.py), поэтому включается только явно
+AUDIO_MP3_MODE = os.getenv("AUDIO_MP3_MODE", "classic")
+
+# Лимиты Telegram: облачный Bot API принимает от ботов файлы до 50 МБ, локальный — до 2000 МБ
+_DEFAULT_LIMIT_MB = "2000" if TELEGRAM_API_LOCAL else "50"
+TELEGRAM_UPLOAD_LIMIT_MB = int(os.getenv("TELEGRAM_UPLOAD_LIMIT_MB", _DEFAULT_LIMIT_MB))
+TELEGRAM_VIDEO_LIMIT_MB = int(os.getenv("TELEGRAM_VIDEO_LIMIT_MB", _DEFAULT_LIMIT_MB))
+
+# Временное хранилище загрузок: у каждой задачи свой каталог и резерв в пределах квоты.
+# SCRATCH_TMPFS_DIR (например, /dev/shm/bsaver) — для небольших задач, в первую очередь аудио
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "bsaver"))
+SCRATCH_QUOTA_MB = int(os.getenv("SCRATCH_QUOTA_MB", "8192"))
+SCRATCH_TMPFS_DIR = os.getenv("SCRATCH_TMPFS_DIR", "")
+SCRATCH_TMPFS_QUOTA_MB = int(os.getenv("SCRATCH_TMPFS_QUOTA_MB", "512"))
+SCRATCH_TMPFS_JOB_MAX_MB = int(os.getenv("SCRATCH_TMPFS_JOB_MAX_MB", "64"))
+SCRATCH_RESERVE_TIMEOUT = float(os.getenv("SCRATCH_RESERVE_TIMEOUT", "300"))
+SCRATCH_SWEEP_INTERVAL = float(os.getenv("SCRATCH_SWEEP_INTERVAL", "600"))
+SCRATCH_ORPHAN_AGE = float(os.getenv("SCRATCH_ORPHAN_AGE", str(YTDLP_DOWNLOAD_TIMEOUT * 2)))
+
+# Кэш готовых файлов на диске (видео, аудио по качеству) в пределах MEDIA_CACHE_MB, 0 — выключен.
+# На той же файловой системе, что и SCRATCH_DIR, файлы попадают в кэш жёсткой ссылкой без копирования
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bsaver-cache"))
+MEDIA_CACHE_MB = int(os.getenv("MEDIA_CACHE_MB", "2048"))
+
+# Профили скачивания по ожидаемому размеру: параллельные фрагменты DASH/HLS, HTTP-запросы кусками
+# (YouTube урезает скорость длинных соединений) и повторное извлечение при скорости ниже порога
+DOWNLOAD_SMALL_MB = int(os.getenv("DOWNLOAD_SMALL_MB", "20"))
+DOWNLOAD_LARGE_MB = int(os.getenv("DOWNLOAD_LARGE_MB", "200"))
+DOWNLOAD_FRAGMENTS = int(os.getenv("DOWNLOAD_FRAGMENTS", "4"))
+DOWNLOAD_FRAGMENTS_LARGE = int(os.getenv("DOWNLOAD_FRAGMENTS_LARGE", "8"))
+DOWNLOAD_CHUNK_MB = int(os.getenv("DOWNLOAD_CHUNK_MB", "10"))
+DOWNLOAD_THROTTLED_RATE_KB = int(os.getenv("DOWNLOAD_THROTTLED_RATE_KB", "100"))
+
+# Упреждающая загрузка самого вероятного формата, пока открыта карточка: только при свободных
+# слотах планировщика, не больше PREFETCH_MAX_ACTIVE сразу и файлы до PREFETCH_MAX_MB
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+PREFETCH_MAX_ACTIVE = int(os.getenv("PREFETCH_MAX_ACTIVE", "1"))
+PREFETCH_MAX_MB = int(os.getenv("PREFETCH_MAX_MB", "50"))
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "120"))
+# Качаем, только если доля выбора среди доступных в карточке не меньше этой
+PREFETCH_MIN_SHARE = float(os.getenv("PREFETCH_MIN_SHARE", "0.3"))
+
+# Исходящая очередь Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, ~20/мин в группу
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_GROUP_RATE_PER_MIN = float(os.getenv("SEND_GROUP_RATE_PER_MIN", "20"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Метрики Prometheus на отдельном порту (0 — выключить) и trace_id апдейта в строках лога
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+LOG_TRACE_IDS = os.getenv("LOG_TRACE_IDS", "1") == "1"
@@ -1,17 +1,44 @@
 import logging
 import asyncio
+import contextlib
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import BotCommand
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN,
+    BOT_MODE,
+    TELEGRAM_API_SERVER,
+    TELEGRAM_API_LOCAL,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    YTDLP_EXECUTOR,
+    WORKER_SPAWN_LOCAL,
+    METRICS_HOST,
+    METRICS_PORT,
+    LOG_TRACE_IDS,
+)
 from app.handlers import routers, youtube
+from app.services.youtube_service import YouTubeService
+from app.services.scratch import scratch
+from app.services.send_queue import send_queue
+from app.services.prefetch import prefetcher
+from app.services.journal import journal
+from app.services.file_cache import file_id_cache
+from app.services.metrics import TraceIdFilter, TraceMiddleware, register_service_metrics, start_metrics_server
 
+log_handler = logging.StreamHandler()
+log_handler.addFilter(TraceIdFilter())
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format=(
+        "%(asctime)s - %(name)s - [%(trace_id)s] - %(levelname)s - %(message)s" if LOG_TRACE_IDS
+        else "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    ),
     datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[logging.StreamHandler()]
+    handlers=[log_handler]
 )
 logger = logging.getLogger("BOT")
 
@@ -25,23 +52,100 @@ async def set_commands(bot):
     await bot.set_my_commands(commands)
 
 
+def create_bot(token: str = BOT_TOKEN, api_server: str = TELEGRAM_API_SERVER, is_local: bool = TELEGRAM_API_LOCAL,
+               rate_limited: bool = True) -> Bot:
+    session = None
+    if api_server:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_server, is_local=is_local))
+        logger.info(f"Используется Bot API сервер: {api_server}{' (локальный режим)' if is_local else ''}")
+    bot = Bot(token=token, session=session)
+    if rate_limited:
+        # Все исходящие запросы в чаты идут через очередь с лимитами и повтором по retry_after
+        bot.session.middleware(send_queue)
+    return bot
+
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    dp.update.outer_middleware(TraceMiddleware())
+    dp.include_router(routers.router)
+    # Перед закрытием сессии Bot API: дождаться отправки скачанных файлов, загрузки отложить до запуска
+    dp.shutdown.register(journal.drain)
+    return dp
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    from aiohttp import web
+    from app.webhook import create_webhook_app, register_webhook
+
+    app = create_webhook_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    await register_webhook(bot, dp)
+    logger.info(f"🌐 Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
 async def main():
     logger.info("🟢 Бот запускается...")
     if not BOT_TOKEN or not isinstance(BOT_TOKEN, str):
         logger.critical("❌ BOT_TOKEN не найден! Укажите переменную окружения BOT_TOKEN.")
         return
+    workers = None
+    metrics_runner = None
+    warm_up = None
     try:
-        bot = Bot(token=BOT_TOKEN)
-        dp = Dispatcher()
-        dp.include_router(routers.router)
+        register_service_metrics()
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        if YTDLP_EXECUTOR == 'queue' and WORKER_SPAWN_LOCAL:
+            from app.workers.worker import start_local_workers
+            workers = start_local_workers()
+        # Уборка временных файлов, оставшихся после падения прошлого запуска; каталоги загрузок,
+        # которые продолжатся из журнала, она не трогает
+        unfinished = await youtube.recover_deliveries()
+        await scratch.start()
+        bot = create_bot()
+        dp = create_dispatcher()
         await set_commands(bot)
+        # Ссылки на задачи держим до конца работы: цикл событий хранит их только слабо
+        resumed = youtube.resume_deliveries(bot, unfinished)
+        if resumed:
+            logger.info(f"🔁 Продолжаем прерванные загрузки: {len(resumed)}")
+        # yt-dlp грузится в фоне: на /start бот отвечает, не дожидаясь импорта экстракторов;
+        # ссылку держим, чтобы задачу не собрал сборщик мусора и её можно было отменить при остановке
+        warm_up = asyncio.create_task(YouTubeService.warm_up())
         logger.info("🔄 Бот готов к работе. Ожидаем сообщения...")
-        await dp.start_polling(bot)
+        if BOT_MODE == 'webhook':
+            await run_webhook(bot, dp)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.critical(f"🔴 КРИТИЧЕСКАЯ ОШИБКА: {e}")
         raise
     finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if warm_up is not None and not warm_up.done():
+            warm_up.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await warm_up
+        await journal.drain()
+        await send_queue.close()
+        await prefetcher.close()
+        await scratch.stop()
+        file_id_cache.close()
+        YouTubeService.shutdown()
+        if workers is not None:
+            workers.terminate()
+            workers.join(timeout=10)
         logger.info("Бот остановлен")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
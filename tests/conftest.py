@@ -0,0 +1,29 @@
+import asyncio
+import inspect
+import os
+import tempfile
+
+import pytest
+
+
+# config читается при первом импорте: лимиты и каталоги не должны зависеть от .env разработчика
+_workdir = tempfile.mkdtemp(prefix='bsaver-tests-')
+os.environ.update({
+    'TELEGRAM_API_LOCAL': '0',
+    'TELEGRAM_UPLOAD_LIMIT_MB': '50',
+    'TELEGRAM_VIDEO_LIMIT_MB': '50',
+    'SCRATCH_DIR': os.path.join(_workdir, 'scratch'),
+    'MEDIA_CACHE_DIR': os.path.join(_workdir, 'media'),
+    'FILE_CACHE_PATH': os.path.join(_workdir, 'file_cache.sqlite3'),
+    'JOURNAL_PATH': os.path.join(_workdir, 'journal.sqlite3'),
+})
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # async-тесты без pytest-asyncio: каждый в своём цикле событий
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(pyfuncitem.obj(**kwargs))
+    return True
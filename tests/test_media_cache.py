@@ -0,0 +1,95 @@
+import os
+
+from app.services.media_cache import MediaCache
+
+
+def make_source(tmp_path, name, size=100):
+    path = tmp_path / 'src' / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b'\0' * size)
+    return str(path)
+
+
+def make_cache(tmp_path, max_bytes=400):
+    return MediaCache(str(tmp_path / 'cache'), max_bytes)
+
+
+async def test_put_and_get(tmp_path):
+    cache = make_cache(tmp_path)
+    assert await cache.put('a', 'mp3', make_source(tmp_path, 'a.mp3'))
+    cached = cache.get('a', 'mp3')
+    assert cached is not None
+    async with cached.use() as path:
+        assert os.path.getsize(path) == 100
+        assert path.endswith('.mp3')
+    assert cache.get('b', 'mp3') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    # Повторный put того же ключа ничего не меняет
+    assert not await cache.put('a', 'mp3', make_source(tmp_path, 'a2.mp3'))
+
+
+async def test_least_recently_requested_is_evicted(tmp_path):
+    cache = make_cache(tmp_path)
+    for name in 'abcd':
+        assert await cache.put(name, 'mp3', make_source(tmp_path, f"{name}.mp3"))
+    cache.get('a', 'mp3').discard()
+    assert await cache.put('e', 'mp3', make_source(tmp_path, 'e.mp3'))
+    assert not cache.has('b', 'mp3')
+    assert all(cache.has(name, 'mp3') for name in 'acde')
+    assert cache.size == 400
+    assert cache.stats()['evicted'] == 1
+
+
+async def test_pinned_file_is_not_evicted(tmp_path):
+    cache = make_cache(tmp_path)
+    for name in 'abcd':
+        await cache.put(name, 'mp3', make_source(tmp_path, f"{name}.mp3"))
+    # Пока файл отправляется, вытеснение его пропускает, даже самый старый
+    sending = cache.get('a', 'mp3')
+    for name in 'bcd':
+        cache.get(name, 'mp3').discard()
+    assert await cache.put('e', 'mp3', make_source(tmp_path, 'e.mp3'))
+    assert cache.has('a', 'mp3') and not cache.has('b', 'mp3')
+    async with sending.use() as path:
+        assert os.path.exists(path)
+
+
+async def test_nothing_fits_while_everything_is_pinned(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=200)
+    for name in 'abcd':
+        await cache.put(name, 'mp3', make_source(tmp_path, f"{name}.mp3", 50))
+    pins = {name: cache.get(name, 'mp3') for name in 'abcd'}
+    assert not await cache.put('e', 'mp3', make_source(tmp_path, 'e.mp3', 50))
+    assert all(cache.has(name, 'mp3') for name in 'abcd')
+    pins['c'].discard()
+    assert await cache.put('e', 'mp3', make_source(tmp_path, 'e.mp3', 50))
+    assert not cache.has('c', 'mp3')
+    assert cache.size == 200
+
+
+async def test_file_larger_than_share_is_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    assert not await cache.put('big', '720', make_source(tmp_path, 'big.mp4', 101))
+    assert cache.size == 0
+
+
+async def test_order_survives_restart(tmp_path):
+    cache = make_cache(tmp_path)
+    for name in 'abcd':
+        await cache.put(name, 'mp3', make_source(tmp_path, f"{name}.mp3"))
+    # Порядок после перезапуска восстанавливается по времени изменения файлов
+    for age, name in enumerate('bcda'):
+        os.utime(cache._path(name, 'mp3', '.mp3'), (1000 + age, 1000 + age))
+    (tmp_path / 'cache' / '.tmp-leftover').write_bytes(b'\0')
+    restarted = make_cache(tmp_path)
+    assert restarted.has('a', 'mp3')
+    assert not os.path.exists(tmp_path / 'cache' / '.tmp-leftover')
+    await restarted.put('e', 'mp3', make_source(tmp_path, 'e.mp3'))
+    assert not restarted.has('b', 'mp3') and restarted.has('a', 'mp3')
+
+
+async def test_disabled_cache(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=0)
+    assert not cache.enabled
+    assert not await cache.put('a', 'mp3', make_source(tmp_path, 'a.mp3'))
+    assert cache.get('a', 'mp3') is None
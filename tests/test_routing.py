@@ -0,0 +1,42 @@
+import pytest
+from aiogram import Bot
+from aiogram.types import Update
+
+from app.handlers import youtube
+from tools.fake_telegram import make_message_update
+
+
+ID = 'dQw4w9WgXcQ'
+
+
+@pytest.fixture(scope='module')
+def dispatcher():
+    # Роутеры — синглтоны модулей и подключаются к диспетчеру один раз
+    from main import create_dispatcher
+    return create_dispatcher()
+
+
+@pytest.fixture
+def cards(monkeypatch):
+    sent = []
+
+    async def send_video_card(message, video_id):
+        sent.append(video_id)
+
+    monkeypatch.setattr(youtube, 'send_video_card', send_video_card)
+    return sent
+
+
+@pytest.mark.parametrize('text', [
+    f"https://www.youtube-nocookie.com/embed/{ID}?start=10",
+    f"смотри YOUTU.BE/{ID}",
+    f"https://M.YouTube.com/watch?v={ID}",
+])
+async def test_links_understood_by_parser_reach_handler(dispatcher, cards, text):
+    bot = Bot('42:TEST')
+    try:
+        update = Update.model_validate(make_message_update(1, 100, text), context={'bot': bot})
+        await dispatcher.feed_update(bot, update)
+    finally:
+        await bot.session.close()
+    assert cards == [ID]
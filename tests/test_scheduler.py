@@ -0,0 +1,64 @@
+import pytest
+
+from app.services.scheduler import DownloadScheduler, QueueFullError
+
+
+def granted(tickets):
+    return [t for t in tickets if t.granted.done() and not t.granted.cancelled()]
+
+
+async def test_light_user_overtakes_heavy_user_backlog():
+    scheduler = DownloadScheduler(max_active=1, max_queued=10, max_per_user=5)
+    heavy = [scheduler.submit(1, 1.0) for _ in range(3)]
+    light = scheduler.submit(2, 1.0)
+    assert granted(heavy + [light]) == [heavy[0]]
+    scheduler.release(heavy[0])
+    assert granted([light, heavy[1], heavy[2]]) == [light]
+    scheduler.release(light)
+    assert granted([heavy[1], heavy[2]]) == [heavy[1]]
+
+
+async def test_cheaper_job_goes_first():
+    scheduler = DownloadScheduler(max_active=1, max_queued=10, max_per_user=5)
+    running = scheduler.submit(1, 1.0)
+    video = scheduler.submit(2, 4.0)
+    audio = scheduler.submit(3, 1.0)
+    assert scheduler.position(audio) == 1
+    assert scheduler.position(video) == 2
+    scheduler.release(running)
+    assert audio.granted.done() and not video.granted.done()
+
+
+async def test_limits_raise_queue_full():
+    scheduler = DownloadScheduler(max_active=1, max_queued=1, max_per_user=2)
+    scheduler.submit(1, 1.0)
+    scheduler.submit(1, 1.0)
+    with pytest.raises(QueueFullError):
+        scheduler.submit(1, 1.0)
+    with pytest.raises(QueueFullError):
+        scheduler.submit(2, 1.0)
+    assert scheduler.rejected == 2
+
+
+async def test_release_of_waiting_ticket_and_double_release():
+    scheduler = DownloadScheduler(max_active=1, max_queued=5, max_per_user=5)
+    running = scheduler.submit(1, 1.0)
+    waiting = scheduler.submit(2, 1.0)
+    scheduler.release(waiting)
+    assert waiting.granted.cancelled()
+    assert scheduler.queued == 0
+    scheduler.release(running)
+    scheduler.release(running)
+    assert scheduler.active == 0
+    assert scheduler.has_capacity()
+    # Слоты пользователя вернулись: можно снова ставить max_per_user задач
+    assert scheduler.submit(2, 1.0).granted.done()
+
+
+async def test_wait_times_out_until_granted():
+    scheduler = DownloadScheduler(max_active=1, max_queued=5, max_per_user=5)
+    running = scheduler.submit(1, 1.0)
+    waiting = scheduler.submit(2, 1.0)
+    assert not await scheduler.wait(waiting, timeout=0.01)
+    scheduler.release(running)
+    assert await scheduler.wait(waiting, timeout=0.01)
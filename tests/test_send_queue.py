@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from aiogram.methods import DeleteMessage, EditMessageText, SendMessage
+
+from app.services.send_queue import SendQueue, TokenBucket
+
+
+def make_queue():
+    return SendQueue(global_rate=1000, chat_rate=1000, chat_burst=100, group_rate=1000, max_retries=1)
+
+
+def test_token_bucket_refill_and_burst():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = bucket.updated
+    assert bucket.delay(now) == 0
+    bucket.take()
+    bucket.take()
+    assert bucket.delay(now) == 0.5
+    assert bucket.delay(now + 0.5) == 0
+    # Простой не копит токенов сверх ёмкости
+    assert bucket.delay(now + 100) == 0
+    assert bucket.tokens == 2
+    assert bucket.idle(now + 100)
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.pause(5)
+    now = time.monotonic()
+    assert 4 < bucket.delay(now) <= 5
+    assert not bucket.idle(now)
+
+
+async def test_edits_of_one_message_are_merged():
+    queue = make_queue()
+    first = queue._enqueue(None, None, EditMessageText(chat_id=1, message_id=5, text='1%'), 1)
+    merged = queue._merge(EditMessageText(chat_id=1, message_id=5, text='50%'))
+    assert merged is first
+    assert first.method.text == '50%'
+    assert first.waiters == 2
+    assert queue.depth == 1
+    assert queue._merge(EditMessageText(chat_id=1, message_id=6, text='1%')) is None
+    assert queue._merge(SendMessage(chat_id=1, text='hi')) is None
+
+
+async def test_edit_and_delete_are_never_merged():
+    queue = make_queue()
+    edit = queue._enqueue(None, None, EditMessageText(chat_id=1, message_id=5, text='1%'), 1)
+    assert queue._merge(DeleteMessage(chat_id=1, message_id=5)) is None
+    delete = queue._enqueue(None, None, DeleteMessage(chat_id=1, message_id=5), 1)
+    assert queue._merge(EditMessageText(chat_id=1, message_id=5, text='2%')) is edit
+    assert queue._merge(DeleteMessage(chat_id=1, message_id=5)) is delete
+    assert isinstance(edit.method, EditMessageText)
+    assert queue.depth == 2
+
+
+async def test_merged_callers_get_results_of_their_own_method():
+    queue = make_queue()
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(type(method).__name__)
+        return True if isinstance(method, DeleteMessage) else f"message:{method.text}"
+
+    results = await asyncio.gather(
+        queue(make_request, None, EditMessageText(chat_id=1, message_id=5, text='1%')),
+        queue(make_request, None, EditMessageText(chat_id=1, message_id=5, text='99%')),
+        queue(make_request, None, DeleteMessage(chat_id=1, message_id=5)),
+    )
+    await queue.close()
+    assert results == ['message:99%', 'message:99%', True]
+    assert sent == ['EditMessageText', 'DeleteMessage']
+    assert queue.merged == 1
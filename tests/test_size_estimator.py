@@ -0,0 +1,82 @@
+from app.services.size_estimator import (
+    APPROX,
+    BITRATE,
+    EXACT,
+    UNKNOWN,
+    UPLOAD_LIMIT,
+    delivery_kind,
+    estimate_audio_size,
+    estimate_format_size,
+    estimate_mp3_size,
+    estimate_selection_size,
+    estimate_spec_size,
+    exceeds_limit,
+    format_size_label,
+)
+
+
+MB = 1024 * 1024
+
+INFO = {
+    'duration': 200,
+    'formats': [
+        {'format_id': '136', 'vcodec': 'avc1', 'acodec': 'none', 'filesize': 30 * MB},
+        {'format_id': '137', 'vcodec': 'avc1', 'acodec': 'none', 'tbr': 4000},
+        {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128, 'filesize_approx': 3 * MB},
+        {'format_id': '251', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160, 'filesize': 4 * MB},
+        {'format_id': '160', 'vcodec': 'avc1', 'acodec': 'none'},
+    ],
+}
+
+
+def test_format_size_by_confidence():
+    assert estimate_format_size({'filesize': 100, 'filesize_approx': 90}, 10) == (100, EXACT)
+    assert estimate_format_size({'filesize_approx': 90}, 10) == (90, APPROX)
+    assert estimate_format_size({'tbr': 8}, 10) == (10000, BITRATE)
+    assert estimate_format_size({'vbr': 6, 'abr': 2}, 10) == (10000, BITRATE)
+    assert estimate_format_size({'tbr': 8}, None) == (0, UNKNOWN)
+    # Нет дорожки — нечего и считать
+    assert estimate_format_size(None, 10) == (0, EXACT)
+
+
+def test_selection_takes_worst_confidence_and_mux_overhead():
+    size, confidence = estimate_selection_size({'video': {'filesize': 1000}, 'audio': {'filesize_approx': 100}}, 10)
+    assert (size, confidence) == (1111, APPROX)
+    assert estimate_selection_size({'video': {'filesize': 1000}, 'audio': {'tbr': 128}}, None) == (0, UNKNOWN)
+    assert estimate_selection_size({'video': {'filesize': 1000}, 'audio': None}, None) == (1010, EXACT)
+
+
+def test_spec_size():
+    assert estimate_spec_size(INFO, '136+140') == (int(33 * MB * 1.01), APPROX)
+    assert estimate_spec_size(INFO, '137+251')[1] == BITRATE
+    assert estimate_spec_size(INFO, '160+140') == (0, UNKNOWN)
+    assert estimate_spec_size(INFO, '999') == (0, UNKNOWN)
+    # Видео с точным размером, но звуковой дорожки в списке форматов нет
+    assert estimate_spec_size(INFO, '136+999') == (0, UNKNOWN)
+
+
+def test_audio_size_prefers_m4a():
+    assert estimate_audio_size(INFO, 'm4a') == (3 * MB, APPROX)
+    assert estimate_audio_size(INFO, 'mp3') == estimate_mp3_size(200) == (192 * 1000 // 8 * 200, BITRATE)
+    assert estimate_audio_size({'duration': 10, 'formats': []}, 'm4a') == (0, UNKNOWN)
+
+
+def test_exceeds_limit_gives_rough_estimates_a_margin():
+    assert exceeds_limit(UPLOAD_LIMIT + 1, EXACT)
+    assert exceeds_limit(UPLOAD_LIMIT + 1, APPROX)
+    assert not exceeds_limit(UPLOAD_LIMIT, EXACT)
+    # По битрейту отказываем, только если и 80% оценки не влезает
+    assert not exceeds_limit(int(UPLOAD_LIMIT * 1.2), BITRATE)
+    assert exceeds_limit(int(UPLOAD_LIMIT * 1.3), BITRATE)
+    assert not exceeds_limit(10 * UPLOAD_LIMIT, UNKNOWN)
+
+
+def test_delivery_kind_and_label():
+    assert delivery_kind(UPLOAD_LIMIT, EXACT) == 'video'
+    assert delivery_kind(UPLOAD_LIMIT + 1, APPROX) == 'document'
+    assert delivery_kind(10 * UPLOAD_LIMIT, UNKNOWN) == 'video'
+    assert format_size_label(30 * MB, EXACT) == '30MB'
+    assert format_size_label(30 * MB, BITRATE) == '~30MB'
+    assert format_size_label(1000, APPROX) == '~1MB'
+    assert format_size_label(0, EXACT) == '?MB'
+    assert format_size_label(30 * MB, UNKNOWN) == '?MB'
@@ -0,0 +1,59 @@
+import pytest
+
+from app.services.url_parser import extract_playlist_ids, extract_video_ids, parse_playlist_id, parse_video_id
+
+
+ID = 'dQw4w9WgXcQ'
+PLAYLIST = 'PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf'
+
+
+@pytest.mark.parametrize('text, expected', [
+    (f"https://www.youtube.com/watch?v={ID}", [ID]),
+    (f"https://youtu.be/{ID}?t=42", [ID]),
+    (f"youtube.com/shorts/{ID}", [ID]),
+    (f"https://music.youtube.com/watch?v={ID}&list=RDAMVM{ID}", [ID]),
+    (f"https://www.youtube-nocookie.com/embed/{ID}?start=10", [ID]),
+    (f"https://m.youtube.com/watch?feature=share&v={ID}#t=1m30s", [ID]),
+    (f"https://www.youtube.com/live/{ID}?si=abc", [ID]),
+    (f"Глянь, как смешно 😂 https://youtu.be/{ID}. И вот ещё: youtube.com/watch?v=aaaaaaaaaaa&t=5", [ID, 'aaaaaaaaaaa']),
+    (f"два раза https://youtu.be/{ID} https://www.youtube.com/watch?v={ID}", [ID]),
+    ("https://www.youtube.com/@somechannel/videos", []),
+    ("https://www.youtube.com/playlist?list=PLabcdefghijk", []),
+    ("https://www.youtube.com/watch?v=tooshort", []),
+    (f"https://evil.example/youtube.com/watch?v={ID}", []),
+    (f"https://notyoutube.com/watch?v={ID}", []),
+    ("я смотрю youtube.com каждый день, а ты?", []),
+    ("", []),
+    (None, []),
+])
+def test_extract_video_ids(text, expected):
+    assert extract_video_ids(text) == expected
+
+
+def test_extract_video_ids_limit():
+    text = ' '.join(f"https://youtu.be/{c * 11}" for c in 'abcde')
+    assert extract_video_ids(text, 2) == ['a' * 11, 'b' * 11]
+
+
+def test_trailing_punctuation_is_not_part_of_id():
+    assert extract_video_ids(f"(https://youtu.be/{ID})") == [ID]
+    assert parse_video_id(f"https://www.youtube.com/watch?v={ID}»") == ID
+
+
+@pytest.mark.parametrize('url, expected', [
+    (f"https://www.youtube.com/playlist?list={PLAYLIST}", PLAYLIST),
+    ("https://music.youtube.com/playlist?list=OLAK5uy_kx0123456789", 'OLAK5uy_kx0123456789'),
+    (f"youtube.com/watch?list={PLAYLIST}", PLAYLIST),
+    (f"https://www.youtube.com/watch?v={ID}&list={PLAYLIST}", None),
+    (f"https://www.youtube.com/@channel?list={PLAYLIST}", None),
+    ("https://www.youtube.com/playlist?list=short", None),
+    (f"https://example.com/playlist?list={PLAYLIST}", None),
+])
+def test_parse_playlist_id(url, expected):
+    assert parse_playlist_id(url) == expected
+
+
+def test_playlist_and_video_links_are_told_apart():
+    text = f"плейлист youtube.com/playlist?list={PLAYLIST} и ролик https://youtu.be/{ID}"
+    assert extract_playlist_ids(text) == [PLAYLIST]
+    assert extract_video_ids(text) == [ID]
@@ -0,0 +1,249 @@
+"""Локальный фейковый Telegram Bot API для офлайн-проверок.
+
+Запуск самопроверки вебхука:
+    python -m tools.fake_telegram
+Отдельный сервер (в т.ч. как заглушка локального Bot API с file://):
+    python -m tools.fake_telegram --serve --port 8081
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import aiohttp
+from aiohttp import web
+
+
+logger = logging.getLogger("FAKE_TELEGRAM")
+
+TOKEN = "42:FAKE-TOKEN"
+BOT_USER = {'id': 42, 'is_bot': True, 'first_name': 'BSaver', 'username': 'bsaver_fake_bot'}
+
+MEDIA_FIELDS = {
+    'sendVideo': 'video',
+    'sendDocument': 'document',
+    'sendAudio': 'audio',
+    'sendPhoto': 'photo',
+}
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self.updates: List[Dict] = []
+        self.uploaded_bytes = 0
+        self.local_bytes = 0
+        self._flood: Dict[str, int] = {}
+        self._ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=4 * 1024 ** 3)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _read_local(self, path: str) -> int:
+        size = 0
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                size += len(chunk)
+        self.local_bytes += size
+        return size
+
+    def inject_retry_after(self, method: str, seconds: int) -> None:
+        # Следующий вызов method получит 429 Too Many Requests
+        self._flood[method] = seconds
+
+    def calls_of(self, method: str) -> List[Dict[str, Any]]:
+        return [params for name, params in self.calls if name == method]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params: Dict[str, Any] = {}
+        data = await request.post()
+        for key, value in data.items():
+            if isinstance(value, web.FileField):
+                size = len(value.file.read())
+                self.uploaded_bytes += size
+                params[key] = {'upload': value.filename, 'size': size}
+            elif key in MEDIA_FIELDS.values() and value.startswith('file://'):
+                # Как локальный Bot API: читаем файл с диска сами
+                params[key] = {'local': value, 'size': self._read_local(value[len('file://'):])}
+            else:
+                params[key] = value
+        if method in self._flood:
+            retry_after = self._flood.pop(method)
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {retry_after}",
+                'parameters': {'retry_after': retry_after},
+            })
+        self.calls.append((method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = await self._result(method, params)
+        if isinstance(result, dict) and 'message_id' in result:
+            # Бенчмаркам нужен id отправленной карточки, чтобы нажать кнопку именно в ней
+            params['_message_id'] = result['message_id']
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            updates, self.updates = self.updates, []
+            return updates
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method in ('sendMessage', 'editMessageText', 'editMessageCaption') or method in MEDIA_FIELDS:
+            return self._message(method, params)
+        if method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            return [self._message(f"send{m.get('type', 'document').capitalize()}", params) for m in media]
+        return True
+
+    def _message(self, method: str, params: Dict[str, Any]) -> Dict:
+        chat_id = int(params.get('chat_id', 0))
+        message = {
+            'message_id': int(params.get('message_id') or next(self._ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'from': BOT_USER,
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'caption' in params:
+            message['caption'] = params['caption']
+        field = MEDIA_FIELDS.get(method)
+        if field:
+            file_id = f"fake-{field}-{next(self._ids)}"
+            media = {'file_id': file_id, 'file_unique_id': file_id}
+            if field == 'photo':
+                message['photo'] = [dict(media, width=320, height=180)]
+            elif field == 'video':
+                message['video'] = dict(media, width=640, height=360, duration=1)
+            elif field == 'audio':
+                message['audio'] = dict(media, duration=1)
+            else:
+                message['document'] = media
+        return message
+
+
+def make_user(user_id: int) -> Dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+
+
+def make_message_update(update_id: int, chat_id: int, text: str, message_id: Optional[int] = None) -> Dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': message_id or update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': make_user(chat_id),
+            'text': text,
+        },
+    }
+
+
+def make_callback_update(update_id: int, chat_id: int, data: str, message_id: int) -> Dict:
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': make_user(chat_id),
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'caption': 'card',
+            },
+        },
+    }
+
+
+async def post_update(url: str, update: Dict, secret: Optional[str] = None) -> int:
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=update, headers=headers) as response:
+            return response.status
+
+
+async def _self_check() -> None:
+    # Поднимаем фейковый API и настоящий вебхук-фронтенд бота в одном процессе
+    import os
+    os.environ.setdefault("WEBHOOK_SECRET", "fake-secret")
+    os.environ.setdefault("WEBHOOK_BASE_URL", "http://127.0.0.1")
+    from main import create_bot, create_dispatcher
+    from app.webhook import create_webhook_app, register_webhook
+    from config import WEBHOOK_PATH, WEBHOOK_SECRET
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    bot = create_bot(TOKEN, api_url)
+    dp = create_dispatcher()
+    runner = web.AppRunner(create_webhook_app(bot, dp))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    hook_url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+    try:
+        await register_webhook(bot, dp)
+        assert fake.calls_of('setWebhook'), "setWebhook не вызван"
+        assert await post_update(hook_url, make_message_update(1, 100, "/start"), "wrong") == 401
+        assert await post_update(hook_url, make_message_update(2, 100, "/start"), WEBHOOK_SECRET) == 200
+        for _ in range(50):
+            if fake.calls_of('sendMessage'):
+                break
+            await asyncio.sleep(0.05)
+        assert fake.calls_of('sendMessage'), "бот не ответил на /start"
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/healthz") as response:
+                assert response.status == 200
+        print("OK: вебхук, проверка секрета и /healthz работают")
+        for method, params in fake.calls:
+            print(f"  {method}: {params}")
+    finally:
+        await runner.cleanup()
+        await fake.stop()
+
+
+async def _serve(host: str, port: int) -> None:
+    fake = FakeTelegram()
+    await fake.start(host, port)
+    print(f"Фейковый Bot API: {fake.base_url}", flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', action='store_true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(args.host, args.port) if args.serve else _self_check())
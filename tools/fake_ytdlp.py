@@ -0,0 +1,199 @@
+"""Фейковый yt_dlp.YoutubeDL для офлайн-нагрузочных прогонов.
+
+Отдаёт синтетический info с типичным набором форматов YouTube и «скачивает»
+файлы нужного размера с заданной скоростью, вызывая progress- и postprocessor-хуки
+так же, как настоящий yt-dlp. Подключается через install().
+"""
+from typing import Dict, List, Optional
+import os
+import re
+import time
+import types
+
+import yt_dlp
+
+
+CHUNK = 1024 * 1024
+
+
+class FakeYoutubeDL:
+    # Параметры общие для всех экземпляров, их выставляет бенчмарк
+    extract_latency = 0.3
+    download_speed = 50 * 1024 * 1024
+    video_size = 8 * 1024 * 1024
+    duration = 240
+    playlist_size = 30
+    extracted = 0
+    downloaded = 0
+    transferred = 0
+    # Файлы cookies, на которые «YouTube» отвечает 429
+    blocked_cookiefiles = set()
+
+    def __init__(self, params: Optional[Dict] = None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _check_blocked(self) -> None:
+        if self.params.get('cookiefile') in self.blocked_cookiefiles:
+            raise yt_dlp.utils.DownloadError("ERROR: unable to download video data: HTTP Error 429: Too Many Requests")
+
+    def close(self) -> None:
+        pass
+
+    @classmethod
+    def make_info(cls, video_id: str) -> Dict:
+        expire = int(time.time()) + 6 * 3600
+        video = cls.video_size
+        audio = max(1, cls.video_size // 8)
+
+        def fmt(format_id, ext, height, vcodec, acodec, size, tbr):
+            return {
+                'format_id': format_id,
+                'ext': ext,
+                'height': height,
+                'vcodec': vcodec,
+                'acodec': acodec,
+                'filesize': size,
+                'tbr': tbr,
+                'abr': tbr if vcodec == 'none' else None,
+                'fps': 30 if height else None,
+                'protocol': 'https',
+                'url': f"https://fake.googlevideo.com/videoplayback?id={video_id}&itag={format_id}&expire={expire}",
+            }
+
+        return {
+            'id': video_id,
+            'title': f"Synthetic video {video_id}",
+            'duration': cls.duration,
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'uploader': 'Fake Channel',
+            'uploader_url': 'https://www.youtube.com/@fake',
+            'formats': [
+                fmt('160', 'mp4', 144, 'avc1.4d400c', 'none', video // 8, 100),
+                fmt('133', 'mp4', 240, 'avc1.4d4015', 'none', video // 5, 250),
+                fmt('18', 'mp4', 360, 'avc1.42001E', 'mp4a.40.2', video // 3, 600),
+                fmt('135', 'mp4', 480, 'avc1.4d401e', 'none', video // 2, 1000),
+                fmt('136', 'mp4', 720, 'avc1.4d401f', 'none', video, 2000),
+                fmt('140', 'm4a', None, 'none', 'mp4a.40.2', audio, 128),
+                fmt('251', 'webm', None, 'none', 'opus', audio, 130),
+            ],
+        }
+
+    def make_playlist(self, playlist_id: str) -> Dict:
+        # Как extract_flat: только ссылки на ролики, без форматов
+        count = min(self.playlist_size, self.params.get('playlistend') or self.playlist_size)
+        prefix = (playlist_id + '____')[:4]
+        entries = [{
+            '_type': 'url',
+            'id': f"{prefix}{i:07d}",
+            'title': f"Synthetic track {i + 1}",
+            'duration': self.duration,
+            'url': f"https://www.youtube.com/watch?v={prefix}{i:07d}",
+        } for i in range(count)]
+        return {'_type': 'playlist', 'id': playlist_id, 'title': f"Synthetic playlist {playlist_id}",
+                'uploader': 'Fake Channel', 'entries': entries}
+
+    def extract_info(self, url: str, download: bool = True, **kwargs) -> Dict:
+        playlist = re.search(r'[?&]list=([\w-]+)', url)
+        if playlist and 'v=' not in url:
+            time.sleep(self.extract_latency)
+            self._check_blocked()
+            FakeYoutubeDL.extracted += 1
+            return self.make_playlist(playlist.group(1))
+        match = re.search(r'(?:v=|youtu\.be/|shorts/)([\w-]{11})', url)
+        if not match:
+            raise yt_dlp.utils.DownloadError(f"Unsupported URL: {url}")
+        time.sleep(self.extract_latency)
+        self._check_blocked()
+        FakeYoutubeDL.extracted += 1
+        info = self.make_info(match.group(1))
+        if download:
+            return self.process_ie_result(info, download=True)
+        return info
+
+    def sanitize_info(self, info: Dict, *args) -> Dict:
+        return info
+
+    def download(self, urls: List[str]) -> int:
+        for url in urls:
+            self.extract_info(url, download=True)
+        return 0
+
+    def _select(self, info: Dict) -> List[Dict]:
+        formats = {f['format_id']: f for f in info['formats']}
+        for alternative in (self.params.get('format') or 'best').split('/'):
+            if alternative.startswith('bestaudio'):
+                return [formats['140']]
+            if alternative == 'best':
+                return [formats['18']]
+            parts = [formats.get(p) for p in alternative.split('+')]
+            if all(parts):
+                return parts
+        return [formats['18']]
+
+    def _hook(self, name: str, d: Dict) -> None:
+        for hook in self.params.get(name, []):
+            hook(d)
+
+    def _write(self, path: str, size: int, info: Dict) -> None:
+        # Как HttpFD: пишем в .part и с continuedl продолжаем его с места остановки
+        part = path + '.part'
+        resumed = os.path.getsize(part) if self.params.get('continuedl', True) and os.path.exists(part) else 0
+        started = time.monotonic()
+        written = resumed
+        with open(part, 'ab' if resumed else 'wb') as f:
+            while written < size:
+                chunk = min(CHUNK, size - written)
+                f.write(b'\0' * chunk)
+                f.flush()
+                written += chunk
+                FakeYoutubeDL.transferred += chunk
+                delay = (written - resumed) / self.download_speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                self._hook('progress_hooks', {
+                    'status': 'downloading', 'downloaded_bytes': written, 'total_bytes': size,
+                    'filename': path, 'info_dict': info,
+                })
+        os.replace(part, path)
+        self._hook('progress_hooks', {'status': 'finished', 'total_bytes': size, 'filename': path, 'info_dict': info})
+
+    def process_ie_result(self, info: Dict, download: bool = True) -> Dict:
+        self._check_blocked()
+        selected = self._select(info)
+        outtmpl = self.params.get('outtmpl') or '%(id)s.%(ext)s'
+        if isinstance(outtmpl, dict):
+            outtmpl = outtmpl.get('default') or '%(id)s.%(ext)s'
+        postprocessors = {pp.get('key'): pp for pp in self.params.get('postprocessors', [])}
+        extract_audio = postprocessors.get('FFmpegExtractAudio')
+        if extract_audio and extract_audio.get('preferredcodec') == 'mp3':
+            ext = 'mp3'
+        elif len(selected) > 1:
+            ext = self.params.get('merge_output_format') or selected[0]['ext']
+        else:
+            ext = selected[0]['ext']
+        path = outtmpl % {'ext': ext, 'id': info['id']}
+        size = sum(f['filesize'] for f in selected)
+        if ext == 'mp3':
+            size = int(info['duration'] * 192 * 1000 / 8)
+        self._write(path, size, info)
+        FakeYoutubeDL.downloaded += 1
+        for pp in (['Merger'] if len(selected) > 1 else []) + (['ExtractAudio'] if extract_audio else []):
+            self._hook('postprocessor_hooks', {'status': 'started', 'postprocessor': pp, 'info_dict': info})
+            self._hook('postprocessor_hooks', {'status': 'finished', 'postprocessor': pp, 'info_dict': info})
+        self._hook('postprocessor_hooks', {
+            'status': 'finished', 'postprocessor': 'MoveFiles', 'info_dict': dict(info, filepath=path),
+        })
+        return info
+
+
+def install() -> None:
+    # Подменяет YoutubeDL в сервисе; ошибки и утилиты yt_dlp остаются настоящими
+    from app.services import youtube_service
+    youtube_service.yt_dlp = types.SimpleNamespace(YoutubeDL=FakeYoutubeDL, utils=yt_dlp.utils)
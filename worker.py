@@ -0,0 +1,19 @@
+import logging
+
+from config import YTDLP_EXECUTOR
+from app.workers.worker import supervise
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(processName)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    handlers=[logging.StreamHandler()]
+)
+
+if __name__ == "__main__":
+    # Задачи в очередь кладёт только бот с YTDLP_EXECUTOR=queue, иначе воркер опрашивал бы пустую очередь
+    if YTDLP_EXECUTOR != 'queue':
+        logging.getLogger("WORKER").warning(
+            f"YTDLP_EXECUTOR={YTDLP_EXECUTOR}: бот качает сам, воркеры не нужны. Для них задайте YTDLP_EXECUTOR=queue")
+    else:
+        supervise()